@@ -0,0 +1,141 @@
+"""
+Benchmark of `comparator.compare_file_lists` against the previous four-join
+implementation.
+
+Usage:
+    python benchmarks/compare_file_lists.py run --rows 1000000
+
+Every implementation is run in a fresh interpreter so the reported peak RSS
+only covers the comparison of that implementation.
+"""
+
+import json
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+import polars as pl
+import typer
+
+from container_diffoscope.comparator import compare_file_lists
+from container_diffoscope.manifest import load_manifest, write_manifest
+
+app = typer.Typer()
+
+MODES = ["legacy", "lazy", "streaming"]
+
+
+def _legacy_compare_file_lists(
+    df1: pl.DataFrame, df2: pl.DataFrame
+) -> tuple[pl.DataFrame, pl.DataFrame, pl.DataFrame, pl.DataFrame]:
+    """
+    Previous implementation of `compare_file_lists` running four separate joins.
+    """
+    common_rows = df1.join(df2, on=["hash", "path"], how="inner")
+    different_hashes = df1.join(df2, on="path", how="inner", suffix="_2")
+    changed_files = different_hashes.filter(
+        different_hashes["hash"] != different_hashes["hash_2"]
+    )
+    only_in_df1 = df1.join(df2, on=["path"], how="anti")
+    only_in_df2 = df2.join(df1, on=["path"], how="anti")
+    return (common_rows, changed_files, only_in_df1, only_in_df2)
+
+
+def generate_manifests(
+    rows: int, change_ratio: float, unique_ratio: float
+) -> tuple[pl.DataFrame, pl.DataFrame]:
+    """
+    Generate two synthetic manifests sharing most of their paths.
+
+    Args:
+        rows (int): Number of files in each manifest
+        change_ratio (float): Fraction of shared paths whose hash differs
+        unique_ratio (float): Fraction of paths present in only one manifest
+
+    Returns:
+        tuple[pl.DataFrame, pl.DataFrame]: The two manifests, with 32 byte binary
+            digests like the ones written by `manifest.write_manifest`
+    """
+    index = pl.int_range(0, rows)
+    df1 = pl.select(
+        index.hash(seed=1).cast(pl.String).str.zfill(64).alias("hash"),
+        pl.format("/usr/lib/package_{}/file_{}.so", index // 100, index).alias("path"),
+    )
+
+    unique = int(rows * unique_ratio)
+    changed = int(rows * change_ratio)
+    df2 = df1.with_columns(
+        pl.when(pl.int_range(pl.len()) < changed)
+        .then(pl.col("hash").str.reverse())
+        .otherwise(pl.col("hash"))
+        .alias("hash"),
+        pl.when(pl.int_range(pl.len()) >= rows - unique)
+        .then(pl.col("path") + ".new")
+        .otherwise(pl.col("path"))
+        .alias("path"),
+    )
+    # The zero padded decimal digits are valid hex, decoding gives 32 byte digests
+    to_binary = pl.col("hash").str.decode("hex")
+    return df1.with_columns(to_binary), df2.with_columns(to_binary)
+
+
+@app.command()
+def worker(mode: str, manifest_1: str, manifest_2: str) -> None:
+    """
+    Run a single implementation and print its timing as JSON.
+    """
+    df1 = load_manifest(manifest_1)
+    df2 = load_manifest(manifest_2)
+    baseline_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+    start = time.perf_counter()
+    if mode == "legacy":
+        results = _legacy_compare_file_lists(df1, df2)
+    else:
+        engine = "streaming" if mode == "streaming" else "auto"
+        results = compare_file_lists(df1, df2, engine=engine)
+    seconds = time.perf_counter() - start
+
+    peak_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    print(
+        json.dumps(
+            {
+                "mode": mode,
+                "seconds": seconds,
+                "peak_rss_increase_mb": (peak_rss - baseline_rss) / 1024,
+                "rows": [len(result) for result in results],
+            }
+        )
+    )
+
+
+@app.command()
+def run(
+    rows: int = typer.Option(1_000_000, help="Number of files in each manifest"),
+    change_ratio: float = typer.Option(0.01, help="Fraction of changed files"),
+    unique_ratio: float = typer.Option(
+        0.01, help="Fraction of files in only one image"
+    ),
+) -> None:
+    """
+    Compare the timing and peak memory of every implementation.
+    """
+    df1, df2 = generate_manifests(rows, change_ratio, unique_ratio)
+    with tempfile.TemporaryDirectory() as directory:
+        manifest_1 = f"{directory}/manifest_1.parquet"
+        manifest_2 = f"{directory}/manifest_2.parquet"
+        write_manifest(df1, manifest_1)
+        write_manifest(df2, manifest_2)
+        for mode in MODES:
+            output = subprocess.run(
+                [sys.executable, __file__, "worker", mode, manifest_1, manifest_2],
+                check=True,
+                capture_output=True,
+                text=True,
+            ).stdout
+            print(output.strip(), flush=True)
+
+
+if __name__ == "__main__":
+    app()
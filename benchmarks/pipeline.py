@@ -0,0 +1,461 @@
+"""
+Benchmark of every stage of an image comparison on synthetic images.
+
+Usage:
+    python benchmarks/pipeline.py run --files 10000 --output baseline.json
+    python benchmarks/pipeline.py run --files 10000 --baseline baseline.json
+
+The two images are flattened filesystem tar archives generated from a seed, so no
+Docker daemon is needed. The inputs of every stage are prepared beforehand and each
+stage is run in a fresh interpreter, so the reported peak RSS only covers that stage.
+The run exits with an error when a stage is slower or uses more memory than in the
+baseline by more than the threshold.
+"""
+
+import asyncio
+import contextlib
+import io
+import json
+import math
+import os
+import random
+import resource
+import subprocess
+import sys
+import tarfile
+import tempfile
+import time
+from collections.abc import Callable
+import polars as pl
+import typer
+
+from container_diffoscope.cache import ContentCache
+from container_diffoscope.comparator import (
+    build_merkle_tree,
+    compare_file_lists,
+    compare_manifest_trees,
+    compare_sorted_manifests,
+    load_list_to_dataframe,
+)
+from container_diffoscope.extractor import (
+    INDEX_FILE,
+    MANIFEST_FILE,
+    ingest_image,
+    load_tree,
+)
+from container_diffoscope.hasher import hash_tar_members
+from container_diffoscope.main import (
+    DiffOptions,
+    _analyze_changed_files,
+    compare_filesystem,
+)
+from container_diffoscope.manifest import (
+    export_text_manifest,
+    load_manifest,
+    write_manifest,
+)
+from container_diffoscope.profiling import StageTimes
+from container_diffoscope.quick import quick_compare
+
+app = typer.Typer()
+
+IMAGES = ("image_1", "image_2")
+STAGES = [
+    "hash",
+    "load_list_to_dataframe",
+    "compare_file_lists",
+    "build_merkle_tree",
+    "compare_manifest_trees",
+    "compare_sorted_manifests",
+    "quick_compare",
+    "analyze_changed_files",
+    "end_to_end",
+]
+
+FILES_PER_DIRECTORY = 32
+SORTED_MEMORY_LIMIT = 64 * 1024**2
+# Differences smaller than these are noise whatever the threshold
+MIN_SECONDS_REGRESSION = 0.05
+MIN_RSS_REGRESSION_MB = 16.0
+
+
+def generate_paths(files: int, depth: int, fanout: int) -> list[str]:
+    """
+    Generate the paths of a synthetic filesystem.
+
+    Args:
+        files (int): Number of files
+        depth (int): Number of directories above every file
+        fanout (int): Number of subdirectories of every directory
+
+    Returns:
+        list[str]: Unique paths, `FILES_PER_DIRECTORY` files per leaf directory
+    """
+    paths = []
+    for number in range(files):
+        directory = number // FILES_PER_DIRECTORY
+        parts = []
+        for _ in range(depth):
+            directory, digit = divmod(directory, fanout)
+            parts.append(f"dir_{digit}")
+        paths.append("/".join([*parts, f"file_{number}.txt"]))
+    return paths
+
+
+def generate_sizes(
+    files: int, mean_size: int, size_spread: float, rng: random.Random
+) -> list[int]:
+    """
+    Draw the sizes of the files of a synthetic filesystem.
+
+    Args:
+        files (int): Number of files
+        mean_size (int): Mean size of a file, in bytes
+        size_spread (float): Standard deviation of the logarithm of the sizes, 0
+            gives every file the mean size
+        rng (random.Random): Seeded random generator
+
+    Returns:
+        list[int]: Log-normally distributed sizes, like the few large and many small
+            files of a real image
+    """
+    if size_spread == 0:
+        return [mean_size] * files
+    mu = math.log(mean_size) - size_spread**2 / 2
+    return [int(rng.lognormvariate(mu, size_spread)) for _ in range(files)]
+
+
+def _content(path: str, size: int, version: int) -> bytes:
+    """
+    Text content of a synthetic file, the versions only differ in their first line.
+    """
+    header = f"# version {version}\n".encode()
+    line = f"{path}\n".encode()
+    size = max(size, len(header))
+    return (header + line * (size // len(line) + 1))[:size]
+
+
+def _add_file(tar: tarfile.TarFile, path: str, content: bytes) -> None:
+    info = tarfile.TarInfo(path)
+    info.size = len(content)
+    info.mtime = 1_700_000_000
+    tar.addfile(info, io.BytesIO(content))
+
+
+def generate_images(
+    directory: str,
+    files: int,
+    change_ratio: float,
+    unique_ratio: float,
+    mean_size: int,
+    size_spread: float,
+    depth: int,
+    fanout: int,
+    seed: int,
+) -> tuple[str, str]:
+    """
+    Write two synthetic flattened filesystem archives sharing most of their files.
+
+    Args:
+        directory (str): Directory receiving the archives
+        files (int): Number of files in each image
+        change_ratio (float): Fraction of shared files whose content differs
+        unique_ratio (float): Fraction of files present in only one image
+        mean_size (int): Mean size of a file, see `generate_sizes`
+        size_spread (float): Spread of the sizes, see `generate_sizes`
+        depth (int): Number of directories above every file
+        fanout (int): Number of subdirectories of every directory
+        seed (int): Seed of the random generator, the same seed gives the same images
+
+    Returns:
+        tuple[str, str]: Paths of the two tar archives
+    """
+    rng = random.Random(seed)
+    paths = generate_paths(files, depth, fanout)
+    sizes = generate_sizes(files, mean_size, size_spread, rng)
+    archive_1, archive_2 = (os.path.join(directory, f"{image}.tar") for image in IMAGES)
+    with tarfile.open(archive_1, "w") as tar_1, tarfile.open(archive_2, "w") as tar_2:
+        for path, size in zip(paths, sizes):
+            draw = rng.random()
+            _add_file(tar_1, path, _content(path, size, 1))
+            if draw < unique_ratio:
+                _add_file(tar_2, path + ".new", _content(path, size, 2))
+            elif draw < unique_ratio + change_ratio:
+                _add_file(tar_2, path, _content(path, size, 2))
+            else:
+                _add_file(tar_2, path, _content(path, size, 1))
+    return archive_1, archive_2
+
+
+def prepare_inputs(directory: str) -> None:
+    """
+    Ingest the two synthetic images and write the inputs of every stage.
+
+    Args:
+        directory (str): Directory holding the archives written by `generate_images`
+    """
+    manifests = []
+    for image in IMAGES:
+        entry = os.path.join(directory, image)
+        ingest_image(f"{entry}.tar", "rootfs", entry)
+        manifest = load_manifest(os.path.join(entry, MANIFEST_FILE))
+        export_text_manifest(manifest, f"{entry}.txt")
+        write_manifest(manifest.sort("path"), f"{entry}.sorted.parquet")
+        manifests.append(manifest)
+    _, changed_files, _, _ = compare_file_lists(*manifests)
+    changed_files.write_parquet(os.path.join(directory, "changed.parquet"))
+
+
+def _silenced(function: Callable[[], object]) -> Callable[[], object]:
+    """
+    Send what a stage prints to stderr, stdout only carries the results.
+    """
+
+    def run() -> object:
+        with contextlib.redirect_stdout(sys.stderr):
+            return function()
+
+    return run
+
+
+def setup_stage(
+    stage: str, directory: str, scratch_dir: str, jobs: int
+) -> Callable[[], object]:
+    """
+    Load the inputs of a stage.
+
+    Args:
+        stage (str): One of `STAGES`
+        directory (str): Directory prepared by `prepare_inputs`
+        scratch_dir (str): Empty directory the stage may write into
+        jobs (int): Number of threads used to hash the images
+
+    Returns:
+        Callable[[], object]: Runs the stage alone on the loaded inputs
+    """
+    entry_1, entry_2 = (os.path.join(directory, image) for image in IMAGES)
+    tar_1, tar_2 = f"{entry_1}.tar", f"{entry_2}.tar"
+    if stage == "hash":
+        return lambda: hash_tar_members(
+            tar_1,
+            os.path.join(scratch_dir, MANIFEST_FILE),
+            jobs=jobs,
+            index_path=os.path.join(scratch_dir, INDEX_FILE),
+        )
+    if stage == "load_list_to_dataframe":
+        return lambda: load_list_to_dataframe(f"{entry_1}.txt")
+    if stage in ("compare_file_lists", "build_merkle_tree", "compare_manifest_trees"):
+        df1 = load_manifest(os.path.join(entry_1, MANIFEST_FILE))
+        df2 = load_manifest(os.path.join(entry_2, MANIFEST_FILE))
+        if stage == "compare_file_lists":
+            return lambda: compare_file_lists(df1, df2)
+        if stage == "build_merkle_tree":
+            return lambda: build_merkle_tree(df1)
+        tree_1, tree_2 = load_tree(entry_1), load_tree(entry_2)
+        assert tree_1 is not None and tree_2 is not None
+        return lambda: compare_manifest_trees(df1, tree_1, df2, tree_2)
+    if stage == "compare_sorted_manifests":
+        return lambda: compare_sorted_manifests(
+            f"{entry_1}.sorted.parquet",
+            f"{entry_2}.sorted.parquet",
+            scratch_dir,
+            SORTED_MEMORY_LIMIT,
+        )
+    if stage == "quick_compare":
+        return lambda: quick_compare(
+            os.path.join(entry_1, INDEX_FILE),
+            os.path.join(entry_2, INDEX_FILE),
+            scratch_dir,
+        )
+    export_dir = os.path.join(scratch_dir, "export")
+    if stage == "analyze_changed_files":
+        changed_files = pl.read_parquet(os.path.join(directory, "changed.parquet"))
+        extract_dir = os.path.join(scratch_dir, "extracted")
+        return _silenced(
+            lambda: asyncio.run(
+                _analyze_changed_files(
+                    changed_files,
+                    entry_1,
+                    entry_2,
+                    export_dir,
+                    extract_dir,
+                    StageTimes(),
+                    DiffOptions(jobs=jobs),
+                )
+            )
+        )
+    if stage == "end_to_end":
+        store = ContentCache(os.path.join(scratch_dir, "images"))
+        return _silenced(
+            lambda: compare_filesystem(
+                tar_1, tar_2, export_dir, jobs=jobs, source="rootfs", store=store
+            )
+        )
+    raise typer.BadParameter(f"Unknown stage {stage}, expected one of {STAGES}")
+
+
+def find_regressions(
+    results: list[dict], baseline: list[dict], threshold: float
+) -> list[str]:
+    """
+    Compare the results of a run with a saved baseline.
+
+    Args:
+        results (list[dict]): Measures of the run, one per image size and stage
+        baseline (list[dict]): Measures of the baseline run
+        threshold (float): Fraction by which a stage may be slower or use more memory
+
+    Returns:
+        list[str]: One line per stage that regressed, stages missing from the
+            baseline are not compared
+    """
+    saved = {(measure["files"], measure["stage"]): measure for measure in baseline}
+    regressions = []
+    for measure in results:
+        reference = saved.get((measure["files"], measure["stage"]))
+        if reference is None:
+            continue
+        for key, floor in (
+            ("seconds", MIN_SECONDS_REGRESSION),
+            ("peak_rss_increase_mb", MIN_RSS_REGRESSION_MB),
+        ):
+            limit = max(reference[key] * (1 + threshold), reference[key] + floor)
+            if measure[key] > limit:
+                regressions.append(
+                    f"{measure['stage']} ({measure['files']} files): {key} "
+                    f"{measure[key]:.3f} > {reference[key]:.3f} in the baseline"
+                )
+    return regressions
+
+
+@app.command()
+def worker(stage: str, directory: str, jobs: int = 1) -> None:
+    """
+    Run a single stage and print its timing and memory as JSON.
+    """
+    with tempfile.TemporaryDirectory() as scratch_dir:
+        function = setup_stage(stage, directory, scratch_dir, jobs)
+        baseline_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        start = time.perf_counter()
+        function()
+        seconds = time.perf_counter() - start
+        peak_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    print(
+        json.dumps(
+            {
+                "stage": stage,
+                "seconds": seconds,
+                "peak_rss_increase_mb": (peak_rss - baseline_rss) / 1024,
+            }
+        )
+    )
+
+
+def _measure(stage: str, directory: str, jobs: int, repeat: int) -> dict:
+    """
+    Run a stage several times, keeping its best timing and memory.
+    """
+    measures = []
+    for _ in range(repeat):
+        output = subprocess.run(
+            [sys.executable, __file__, "worker", stage, directory, "--jobs", str(jobs)],
+            check=True,
+            capture_output=True,
+            text=True,
+        ).stdout
+        measures.append(json.loads(output))
+    return {
+        "stage": stage,
+        "seconds": min(measure["seconds"] for measure in measures),
+        "peak_rss_increase_mb": min(
+            measure["peak_rss_increase_mb"] for measure in measures
+        ),
+    }
+
+
+FILES_OPTION = typer.Option(
+    [10_000], "--files", help="Number of files in each image, can be repeated"
+)
+STAGE_OPTION = typer.Option(
+    None, "--stage", help=f"Stages to run, can be repeated, defaults to {STAGES}"
+)
+
+
+@app.command()
+def run(
+    files: list[int] = FILES_OPTION,
+    stages: list[str] | None = STAGE_OPTION,
+    change_ratio: float = typer.Option(0.01, help="Fraction of changed files"),
+    unique_ratio: float = typer.Option(
+        0.01, help="Fraction of files in only one image"
+    ),
+    mean_size: int = typer.Option(4096, help="Mean size of a file in bytes"),
+    size_spread: float = typer.Option(
+        1.0, help="Spread of the log-normal file sizes, 0 for a single size"
+    ),
+    depth: int = typer.Option(4, help="Number of directories above every file"),
+    fanout: int = typer.Option(16, help="Number of subdirectories per directory"),
+    seed: int = typer.Option(0, help="Seed of the synthetic images"),
+    jobs: int = typer.Option(1, help="Number of threads used to hash the images"),
+    repeat: int = typer.Option(1, help="Runs of each stage, the best one is kept"),
+    output: str | None = typer.Option(None, help="Where to write the JSON results"),
+    baseline: str | None = typer.Option(
+        None, help="JSON results of a previous run to compare with"
+    ),
+    threshold: float = typer.Option(
+        0.2, help="Fraction by which a stage may regress against the baseline"
+    ),
+) -> None:
+    """
+    Time and memory-profile every stage on synthetic images of each size.
+    """
+    config = {
+        "change_ratio": change_ratio,
+        "unique_ratio": unique_ratio,
+        "mean_size": mean_size,
+        "size_spread": size_spread,
+        "depth": depth,
+        "fanout": fanout,
+        "seed": seed,
+        "jobs": jobs,
+    }
+    saved = None
+    if baseline is not None:
+        with open(baseline) as baseline_file:
+            saved = json.load(baseline_file)
+        if saved["config"] != config:
+            raise typer.BadParameter(
+                f"The baseline was measured on other images: {saved['config']}"
+            )
+    results = []
+    for count in files:
+        with tempfile.TemporaryDirectory() as directory:
+            generate_images(
+                directory,
+                count,
+                change_ratio,
+                unique_ratio,
+                mean_size,
+                size_spread,
+                depth,
+                fanout,
+                seed,
+            )
+            prepare_inputs(directory)
+            for stage in stages or STAGES:
+                measure = {"files": count, **_measure(stage, directory, jobs, repeat)}
+                print(json.dumps(measure), flush=True)
+                results.append(measure)
+    if output is not None:
+        with open(output, "w") as output_file:
+            json.dump({"config": config, "results": results}, output_file, indent=2)
+    if saved is not None:
+        regressions = find_regressions(results, saved["results"], threshold)
+        for regression in regressions:
+            print(f"Regression: {regression}", file=sys.stderr)
+        if regressions:
+            raise typer.Exit(1)
+
+
+if __name__ == "__main__":
+    app()
@@ -0,0 +1,367 @@
+import fcntl
+import os
+import re
+import shutil
+import threading
+import uuid
+from collections.abc import Callable, Iterator
+from contextlib import contextmanager
+from typing import TypedDict, TypeVar
+
+T = TypeVar("T")
+
+SIZE_UNITS = {"": 1, "k": 1024, "m": 1024**2, "g": 1024**3, "t": 1024**4}
+LOCK_FILE = ".lock"
+TEMPORARY_SUFFIX = ".tmp"
+
+
+class CacheStats(TypedDict):
+    """Content of a cache, see `ContentCache.stats`."""
+
+    entries: int
+    bytes: int
+    max_bytes: int | None
+    hits: int
+    misses: int
+
+
+def default_cache_dir() -> str:
+    """
+    Directory used for the persistent caches when none is configured.
+
+    Returns:
+        str: `$XDG_CACHE_HOME/container-diffoscope`, `~/.cache/container-diffoscope`
+             when XDG_CACHE_HOME is not set
+    """
+    base = os.environ.get("XDG_CACHE_HOME") or os.path.join(
+        os.path.expanduser("~"), ".cache"
+    )
+    return os.path.join(base, "container-diffoscope")
+
+
+def parse_size(size: str) -> int:
+    """
+    Parse a human readable size such as "512M", "2G" or "1.5GiB".
+
+    Args:
+        size (str): Number of bytes, optionally followed by a binary unit (K, M, G, T)
+
+    Returns:
+        int: The size in bytes
+    """
+    match = re.fullmatch(r"\s*([0-9.]+)\s*([kmgt]?)(i?b)?\s*", size.lower())
+    if match is None:
+        raise ValueError(f"Invalid size: {size!r}")
+    return int(float(match.group(1)) * SIZE_UNITS[match.group(2)])
+
+
+def format_size(size: int) -> str:
+    """
+    Format a number of bytes the way `parse_size` reads it.
+
+    Args:
+        size (int): Number of bytes
+
+    Returns:
+        str: The size with one decimal in the largest unit that keeps it above 1
+    """
+    for unit in ("T", "G", "M", "K"):
+        if size >= SIZE_UNITS[unit.lower()]:
+            return f"{size / SIZE_UNITS[unit.lower()]:.1f}{unit}"
+    return f"{size}B"
+
+
+def _entry_size(path: str) -> int:
+    """
+    Compute the size of a cache entry, which is either a file or a directory.
+
+    Args:
+        path (str): Path of the entry
+
+    Returns:
+        int: Size of the entry in bytes
+    """
+    if not os.path.isdir(path):
+        return os.path.getsize(path)
+    return sum(
+        os.path.getsize(os.path.join(root, name))
+        for root, _, names in os.walk(path)
+        for name in names
+    )
+
+
+def _remove_entry(path: str) -> None:
+    if os.path.isdir(path):
+        shutil.rmtree(path, ignore_errors=True)
+    elif os.path.exists(path):
+        os.remove(path)
+
+
+def _try_remove_unpinned(path: str) -> bool:
+    """
+    Remove a cache entry unless it is pinned by a reader (see `ContentCache.pin`).
+
+    Args:
+        path (str): Path of the entry
+
+    Returns:
+        bool: True if the entry was removed
+    """
+    try:
+        descriptor = os.open(path, os.O_RDONLY)
+    except FileNotFoundError:
+        return False
+    try:
+        fcntl.flock(descriptor, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except BlockingIOError:
+        return False
+    else:
+        _remove_entry(path)
+        return True
+    finally:
+        os.close(descriptor)
+
+
+class ContentCache:
+    """
+    Size bounded directory of entries keyed by content digests.
+
+    Entries are files or directories written atomically (they are built under a
+    temporary name and renamed into place). Reads take a shared lock and writes or
+    evictions an exclusive one (flock on a lock file inside the directory), so
+    several processes can share the same cache. When the total size exceeds
+    max_bytes the least recently used entries are evicted, every read refreshes
+    the modification time used for that ordering. Entries pinned by a running
+    process are skipped by the eviction.
+    """
+
+    def __init__(self, directory: str, max_bytes: int | None = None):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._counter_lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+
+    def path(self, key: str) -> str:
+        """
+        Location of the entry stored under key.
+
+        Args:
+            key (str): Key of the entry, usually a content digest
+
+        Returns:
+            str: Path of the entry inside the cache directory
+        """
+        return os.path.join(self.directory, re.sub(r"[^A-Za-z0-9_.-]", "_", key))
+
+    @contextmanager
+    def _lock(self, exclusive: bool) -> Iterator[None]:
+        with open(os.path.join(self.directory, LOCK_FILE), "a") as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock, fcntl.LOCK_UN)
+
+    def _count(self, hit: bool) -> None:
+        with self._counter_lock:
+            if hit:
+                self.hits += 1
+            else:
+                self.misses += 1
+
+    def load(self, key: str, reader: Callable[[str], T | None]) -> T | None:
+        """
+        Read an entry of the cache.
+
+        Args:
+            key (str): Key of the entry
+            reader (Callable[[str], T | None]): Function reading the entry from its
+                path, returning None when the entry cannot be used
+
+        Returns:
+            T | None: Value returned by reader, None when the entry is not cached or
+                was rejected by reader, both counted as a miss
+        """
+        path = self.path(key)
+        with self._lock(exclusive=False):
+            try:
+                os.utime(path)
+                value = reader(path)
+            except FileNotFoundError:
+                value = None
+        self._count(hit=value is not None)
+        return value
+
+    @contextmanager
+    def pin(self, key: str) -> Iterator[str | None]:
+        """
+        Use an entry in place, protecting it from eviction until the context exits.
+
+        Args:
+            key (str): Key of the entry
+
+        Yields:
+            str | None: Path of the entry, None when the entry is not cached
+        """
+        path = self.path(key)
+        with self._lock(exclusive=False):
+            try:
+                descriptor = os.open(path, os.O_RDONLY)
+            except FileNotFoundError:
+                descriptor = None
+            else:
+                fcntl.flock(descriptor, fcntl.LOCK_SH)
+                os.utime(path)
+        if descriptor is None:
+            yield None
+            return
+        try:
+            yield path
+        finally:
+            os.close(descriptor)
+
+    def contains(self, key: str) -> bool:
+        """
+        Check whether an entry is cached, without counting it as a hit or a miss.
+
+        Args:
+            key (str): Key of the entry
+
+        Returns:
+            bool: True if the entry exists
+        """
+        return os.path.exists(self.path(key))
+
+    def store(self, key: str, writer: Callable[[str], object]) -> str:
+        """
+        Add an entry to the cache and evict old entries if the cache is too big.
+
+        Args:
+            key (str): Key of the entry
+            writer (Callable[[str], object]): Function writing the entry (a file or a
+                directory) to the path it is given, its return value is ignored
+
+        Returns:
+            str: Path of the stored entry
+        """
+        self._store(key, writer, pin=False)
+        return self.path(key)
+
+    @contextmanager
+    def pin_or_store(self, key: str, writer: Callable[[str], object]) -> Iterator[str]:
+        """
+        Pin an entry (see `pin`), storing it first when it is not cached.
+
+        Args:
+            key (str): Key of the entry
+            writer (Callable[[str], object]): Function writing the entry, see `store`
+
+        Yields:
+            str: Path of the entry
+
+        A stored entry is pinned before the eviction runs, so storing several entries
+        in a row never evicts the ones already pinned by the caller.
+        """
+        with self.pin(key) as path:
+            if path is not None:
+                yield path
+                return
+        descriptor = self._store(key, writer, pin=True)
+        try:
+            yield self.path(key)
+        finally:
+            if descriptor is not None:
+                os.close(descriptor)
+
+    def _store(
+        self, key: str, writer: Callable[[str], object], pin: bool
+    ) -> int | None:
+        path = self.path(key)
+        temporary = f"{path}.{uuid.uuid4().hex}{TEMPORARY_SUFFIX}"
+        descriptor = None
+        try:
+            writer(temporary)
+            with self._lock(exclusive=True):
+                if os.path.isdir(temporary) and os.path.exists(path):
+                    # Another process stored the same content in the meantime
+                    _remove_entry(temporary)
+                else:
+                    os.replace(temporary, path)
+                if pin:
+                    descriptor = os.open(path, os.O_RDONLY)
+                    fcntl.flock(descriptor, fcntl.LOCK_SH)
+                self._evict(keep=path)
+        finally:
+            _remove_entry(temporary)
+        return descriptor
+
+    def remove(self, key: str) -> None:
+        """
+        Remove an entry from the cache.
+
+        Args:
+            key (str): Key of the entry
+        """
+        with self._lock(exclusive=True):
+            _remove_entry(self.path(key))
+
+    def _entries(self) -> list[tuple[float, int, str]]:
+        entries = []
+        for name in os.listdir(self.directory):
+            if name == LOCK_FILE or name.endswith(TEMPORARY_SUFFIX):
+                continue
+            path = os.path.join(self.directory, name)
+            try:
+                entries.append((os.path.getmtime(path), _entry_size(path), path))
+            except FileNotFoundError:
+                continue
+        return sorted(entries)
+
+    def _evict(self, keep: str | None = None, max_bytes: int | None = None) -> int:
+        max_bytes = self.max_bytes if max_bytes is None else max_bytes
+        if max_bytes is None:
+            return 0
+        entries = self._entries()
+        total = sum(size for _, size, _ in entries)
+        evicted = 0
+        for _, size, path in entries:
+            if total <= max_bytes:
+                break
+            if path == keep or not _try_remove_unpinned(path):
+                continue
+            total -= size
+            evicted += 1
+        return evicted
+
+    def prune(self, max_bytes: int | None = None) -> int:
+        """
+        Evict least recently used entries until the cache fits in max_bytes.
+
+        Args:
+            max_bytes (int | None): Size limit, defaults to the one of the cache
+
+        Returns:
+            int: Number of evicted entries
+        """
+        with self._lock(exclusive=True):
+            return self._evict(max_bytes=max_bytes)
+
+    def stats(self) -> CacheStats:
+        """
+        Describe the content of the cache.
+
+        Returns:
+            CacheStats: Number of entries, their total size, the size limit
+                and the hits and misses counted by this instance
+        """
+        with self._lock(exclusive=False):
+            entries = self._entries()
+        return {
+            "entries": len(entries),
+            "bytes": sum(size for _, size, _ in entries),
+            "max_bytes": self.max_bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+        }
@@ -0,0 +1,291 @@
+import hashlib
+import mmap
+import os
+import time
+from contextlib import contextmanager
+from collections.abc import Iterator
+from dataclasses import dataclass
+from .diffoscope_runner import (
+    DETAILED_MODE,
+    DIFF_OK,
+    DIFF_TIMEOUT,
+    DiffResult,
+    diff_output_path,
+)
+
+DEFAULT_CHUNK_THRESHOLD = "64M"  # Files this large are compared chunk by chunk
+MIN_CHUNK_SIZE = 2 * 1024
+MAX_CHUNK_SIZE = 64 * 1024
+# Bytes deciding a boundary. A run of 13 one bits takes 2**14 - 2 bytes on average,
+# so with MIN_CHUNK_SIZE chunks average about 18 KiB (17.4 KiB on random data)
+CHUNK_WINDOW = 13
+SEGMENT_SIZE = 16 * 1024**2  # Bytes of the mapped file scanned at once
+MAX_REPORTED_RANGES = 1000
+# Chunk comparison and the settings its output depends on, see `comparison_mode`
+CHUNK_MODE = f"chunks-{MIN_CHUNK_SIZE}-{MAX_CHUNK_SIZE}-{CHUNK_WINDOW}"
+
+# Each byte is mapped to one pseudo-random bit, a boundary ends the first window of
+# CHUNK_WINDOW bytes mapped to 1 after MIN_CHUNK_SIZE bytes. The condition only
+# depends on the window, so an insertion moves the boundaries after it instead of
+# changing every chunk (like the gear hash of FastCDC, with the windows found by
+# bytes.find in C instead of a loop over the bytes in Python).
+_BOUNDARY_BITS = bytes(
+    hashlib.sha256(bytes([byte])).digest()[0] & 1 for byte in range(256)
+)
+_BOUNDARY = b"\x01" * CHUNK_WINDOW
+
+
+@dataclass(frozen=True)
+class Chunk:
+    """
+    Content-defined chunk of a file.
+
+    Attributes:
+        offset (int): Offset of the chunk in the file
+        size (int): Size of the chunk in bytes
+        digest (bytes): Digest of the content of the chunk
+    """
+
+    offset: int
+    size: int
+    digest: bytes
+
+
+@dataclass(frozen=True)
+class ChunkComparison:
+    """
+    Byte ranges that differ between two files, see `compare_chunks`.
+
+    Attributes:
+        size_1 (int): Size of the first file
+        size_2 (int): Size of the second file
+        removed (list[tuple[int, int]]): Ranges (start, end) of the first file
+            whose content is not in the second one
+        added (list[tuple[int, int]]): Ranges (start, end) of the second file
+            whose content is not in the first one
+        similarity (float): Percentage of the bytes of both files in shared chunks
+    """
+
+    size_1: int
+    size_2: int
+    removed: list[tuple[int, int]]
+    added: list[tuple[int, int]]
+    similarity: float
+
+
+def _check_deadline(deadline: float | None) -> None:
+    if deadline is not None and time.perf_counter() > deadline:
+        raise TimeoutError("chunk comparison ran past its deadline")
+
+
+@contextmanager
+def _map_file(path: str) -> Iterator[mmap.mmap | bytes]:
+    with open(path, "rb") as file:
+        if os.fstat(file.fileno()).st_size == 0:
+            yield b""
+            return
+        with mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as data:
+            yield data
+
+
+def chunk_ends(data: mmap.mmap | bytes, deadline: float | None = None) -> list[int]:
+    """
+    Find the content-defined chunk boundaries of a file.
+
+    Args:
+        data (mmap.mmap | bytes): Content of the file
+        deadline (float | None): `time.perf_counter` value after which the scan
+            stops, checked before each segment
+
+    Returns:
+        list[int]: End offset of every chunk, the last one is the size of data
+
+    Raises:
+        TimeoutError: If the deadline passes before the end of the file
+    """
+    ends = []
+    size = len(data)
+    start = 0
+    segment_start = 0
+    bits = b""
+    while start < size:
+        limit = min(start + MAX_CHUNK_SIZE, size)
+        if limit > segment_start + len(bits):
+            _check_deadline(deadline)
+            segment_start = start
+            bits = data[start : min(start + SEGMENT_SIZE, size)].translate(
+                _BOUNDARY_BITS
+            )
+        found = bits.find(
+            _BOUNDARY,
+            start + MIN_CHUNK_SIZE - CHUNK_WINDOW - segment_start,
+            limit - segment_start,
+        )
+        start = segment_start + found + CHUNK_WINDOW if found >= 0 else limit
+        ends.append(start)
+    return ends
+
+
+def chunk_file(path: str, deadline: float | None = None) -> list[Chunk]:
+    """
+    Split a file into content-defined chunks, reading it through mmap.
+
+    Args:
+        path (str): Path of the file
+        deadline (float | None): `time.perf_counter` value after which chunking
+            stops, checked once per `SEGMENT_SIZE` bytes
+
+    Returns:
+        list[Chunk]: Chunks of the file, in order
+
+    Raises:
+        TimeoutError: If the deadline passes before the end of the file
+    """
+    chunks = []
+    with _map_file(path) as data:
+        start = 0
+        next_check = SEGMENT_SIZE
+        for end in chunk_ends(data, deadline):
+            if end >= next_check:
+                _check_deadline(deadline)
+                next_check = end + SEGMENT_SIZE
+            digest = hashlib.blake2b(data[start:end], digest_size=16).digest()
+            chunks.append(Chunk(start, end - start, digest))
+            start = end
+    return chunks
+
+
+def _unique_ranges(chunks: list[Chunk], other: set[bytes]) -> list[tuple[int, int]]:
+    ranges: list[tuple[int, int]] = []
+    for chunk in chunks:
+        if chunk.digest in other:
+            continue
+        if ranges and ranges[-1][1] == chunk.offset:
+            ranges[-1] = (ranges[-1][0], chunk.offset + chunk.size)
+        else:
+            ranges.append((chunk.offset, chunk.offset + chunk.size))
+    return ranges
+
+
+def compare_chunks(
+    file_path_1: str, file_path_2: str, deadline: float | None = None
+) -> ChunkComparison:
+    """
+    Locate the changes between two files from their content-defined chunks.
+
+    Args:
+        file_path_1 (str): Path of the first file
+        file_path_2 (str): Path of the second file
+        deadline (float | None): `time.perf_counter` value after which the
+            comparison stops, see `chunk_file`
+
+    Returns:
+        ChunkComparison: Ranges of each file whose chunks are not in the other
+
+    Raises:
+        TimeoutError: If the deadline passes before both files are chunked
+    """
+    chunks_1 = chunk_file(file_path_1, deadline)
+    chunks_2 = chunk_file(file_path_2, deadline)
+    removed = _unique_ranges(chunks_1, {chunk.digest for chunk in chunks_2})
+    added = _unique_ranges(chunks_2, {chunk.digest for chunk in chunks_1})
+    size_1 = sum(chunk.size for chunk in chunks_1)
+    size_2 = sum(chunk.size for chunk in chunks_2)
+    changed = sum(end - start for start, end in removed + added)
+    total = size_1 + size_2
+    similarity = 100.0 * (1 - changed / total) if total else 100.0
+    return ChunkComparison(size_1, size_2, removed, added, similarity)
+
+
+def comparison_mode(size: int, chunk_threshold: int | None) -> str:
+    """
+    Choose how two copies of a changed file are compared.
+
+    Args:
+        size (int): Size of the larger copy
+        chunk_threshold (int | None): Size from which files are compared chunk by
+            chunk, None to always use the detailed comparison
+
+    Returns:
+        str: CHUNK_MODE or `diffoscope_runner.DETAILED_MODE`
+    """
+    if chunk_threshold is not None and size >= chunk_threshold:
+        return CHUNK_MODE
+    return DETAILED_MODE
+
+
+def _range_lines(ranges: list[tuple[int, int]]) -> list[str]:
+    lines = ["| Start | End | Size |", "|---|---|---|"]
+    lines.extend(
+        f"| {start:#x} | {end:#x} | {end - start} |"
+        for start, end in ranges[:MAX_REPORTED_RANGES]
+    )
+    if len(ranges) > MAX_REPORTED_RANGES:
+        lines.append(f"| … | {len(ranges) - MAX_REPORTED_RANGES} more ranges | |")
+    return lines
+
+
+def get_chunk_comparison(
+    file_path_1: str,
+    file_path_2: str,
+    export_dir: str,
+    name: str,
+    timeout: float | None = None,
+    labels: tuple[str, str] | None = None,
+) -> DiffResult:
+    """
+    Compare two large files chunk by chunk and save the changed ranges as markdown.
+
+    Args:
+        file_path_1 (str): Path to the first file
+        file_path_2 (str): Path to the second file
+        export_dir (str): Directory where the comparison markdown file will be saved
+        name (str): Path of the file in the images, see
+            `diffoscope_runner.get_detailed_file_comparison`
+        timeout (float | None): Seconds after which the comparison stops
+        labels (tuple[str, str] | None): Names the files are shown under instead of
+            their paths, see `diffoscope_runner.comparison_labels`
+
+    Returns:
+        DiffResult: Status of the comparison and path of the markdown file, with
+            the similarity of the files as message, or a DIFF_TIMEOUT result when
+            the timeout expires
+    """
+    output = diff_output_path(export_dir, name)
+    os.makedirs(os.path.dirname(output), exist_ok=True)
+    print(f"Running chunk comparison for {name}.", flush=True)
+    start = time.perf_counter()
+    deadline = start + timeout if timeout is not None else None
+    try:
+        comparison = compare_chunks(file_path_1, file_path_2, deadline)
+    except TimeoutError:
+        return DiffResult(
+            name,
+            DIFF_TIMEOUT,
+            duration=time.perf_counter() - start,
+            message=f"stopped after {timeout:.0f}s",
+        )
+    label_1, label_2 = labels or (file_path_1, file_path_2)
+    lines = [
+        f"# Comparing `{label_1}` & `{label_2}`",
+        "",
+        f"Chunk-level comparison: {comparison.similarity:.1f}% similar, "
+        f"{comparison.size_1} bytes before and {comparison.size_2} bytes after.",
+        "",
+        "## Ranges only in the first file",
+        "",
+        *_range_lines(comparison.removed),
+        "",
+        "## Ranges only in the second file",
+        "",
+        *_range_lines(comparison.added),
+    ]
+    with open(output, "w", encoding="utf-8") as markdown:
+        markdown.write("\n".join(lines) + "\n")
+    return DiffResult(
+        name,
+        DIFF_OK,
+        output,
+        time.perf_counter() - start,
+        f"{comparison.similarity:.1f}% similar",
+    )
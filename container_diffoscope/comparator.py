@@ -1,92 +1,156 @@
+import bisect
+import hashlib
+import itertools
+import os
 import polars as pl
 import os.path
+from collections.abc import Iterator
+from typing import Literal, cast
+
+PolarsEngine = Literal["auto", "in-memory", "streaming"]
+
 
 def load_list_to_dataframe(path: str) -> pl.DataFrame:
     """
     Load the file hash list into a polars DataFrame.
 
     Args:
-        image (str): Name of the Docker image whose hash list should be loaded
+        path (str): Path of the `sha256sum` style hash list that should be loaded
 
     Returns:
         pl.DataFrame: A DataFrame with two columns:
             - hash: SHA256 hash of the file
             - path: Path of the file in the container
+
+    Each line is split on its first two spaces only, so paths that contain spaces
+    are kept whole.
     """
     if os.path.getsize(path) == 0:
         return pl.DataFrame({"hash": [], "path": []})
-    df = pl.read_csv(path, separator=" ", has_header=False, truncate_ragged_lines=True)
-    df = df.rename({df.columns[0]: "hash", df.columns[2]: "path"})
-    df = df.select(["hash", "path"])
-    return df
+    lines = pl.read_csv(
+        path,
+        separator="\x00",
+        has_header=False,
+        quote_char=None,
+        new_columns=["line"],
+        schema_overrides={"line": pl.String},
+    )
+    fields = pl.col("line").str.splitn(" ", 3)
+    return lines.select(
+        fields.struct.field("field_0").alias("hash"),
+        fields.struct.field("field_2").alias("path"),
+    )
+
 
+FILE_STATUS = pl.Enum(["common", "changed", "only_in_1", "only_in_2"])
 
-def _get_common_files(df1: pl.DataFrame, df2: pl.DataFrame) -> pl.DataFrame:
+
+def _as_lazy(df: pl.DataFrame | pl.LazyFrame) -> pl.LazyFrame:
     """
-    Find files that are identical (same hash and path) between two DataFrames.
+    Turn a file list into a LazyFrame that can be joined with other file lists.
 
     Args:
-        df1 (pl.DataFrame): First DataFrame
-        df2 (pl.DataFrame): Second DataFrame
+        df (pl.DataFrame | pl.LazyFrame): File list with hash and path columns
 
     Returns:
-        pl.DataFrame: A DataFrame containing only the files that are the same in both
-                     DataFrames
+        pl.LazyFrame: The file list, with untyped (empty) columns cast to strings
     """
-    if df1.is_empty() or df2.is_empty():
-        return pl.DataFrame({"hash": [], "path": []})
-    common_rows = df1.join(df2, on=["hash", "path"], how="inner")
-    return common_rows
+    lf = df.lazy()
+    schema = lf.collect_schema()
+    return lf.with_columns(
+        pl.col(name).cast(pl.String)
+        for name, dtype in schema.items()
+        if dtype == pl.Null
+    )
 
 
-def _get_changed_files(df1: pl.DataFrame, df2: pl.DataFrame) -> pl.DataFrame:
+def label_file_lists(
+    df1: pl.DataFrame | pl.LazyFrame, df2: pl.DataFrame | pl.LazyFrame
+) -> pl.LazyFrame:
     """
-    Find files that exist in both DataFrames but have different content.
+    Build a lazy plan that labels every path of two file lists in a single join.
 
     Args:
-        df1 (pl.DataFrame): First DataFrame
-        df2 (pl.DataFrame): Second DataFrame
+        df1 (pl.DataFrame | pl.LazyFrame): First file list
+        df2 (pl.DataFrame | pl.LazyFrame): Second file list
 
     Returns:
-        pl.DataFrame: A DataFrame containing files that exist in both DataFrames
-                     but have different content(based of the hashes)
+        pl.LazyFrame: A LazyFrame with the columns:
+            - path: Path of the file in the container
+            - hash: Hash of the file in the first list (null if missing)
+            - hash_2: Hash of the file in the second list (null if missing)
+            - status: One of common, changed, only_in_1 or only_in_2
+
+    The plan is a single full outer join on path, so it can be collected with any
+    polars engine, including the streaming one.
     """
-    if df1.is_empty() or df2.is_empty():
-        return pl.DataFrame({"hash": [], "path": []})
-    different_hashes = df1.join(df2, on="path", how="inner", suffix="_2")
-    changed_files = different_hashes.filter(
-        different_hashes["hash"] != different_hashes["hash_2"]
+    joined = _as_lazy(df1).join(
+        _as_lazy(df2),
+        on="path",
+        how="full",
+        suffix="_2",
+        coalesce=False,
+        maintain_order="left_right",
+    )
+    status = (
+        pl.when(pl.col("path").is_null())
+        .then(pl.lit("only_in_2"))
+        .when(pl.col("path_2").is_null())
+        .then(pl.lit("only_in_1"))
+        .when(pl.col("hash") == pl.col("hash_2"))
+        .then(pl.lit("common"))
+        .otherwise(pl.lit("changed"))
+    )
+    return joined.select(
+        pl.coalesce("path", "path_2").alias("path"),
+        "hash",
+        "hash_2",
+        status.cast(FILE_STATUS).alias("status"),
     )
-    return changed_files
 
 
-def _filter_files(df1: pl.DataFrame, df2: pl.DataFrame) -> pl.DataFrame:
+def split_labelled_files(
+    labelled: pl.DataFrame,
+) -> tuple[pl.DataFrame, pl.DataFrame, pl.DataFrame, pl.DataFrame]:
     """
-    Find files that exist only in the first DataFrame and not in the second.
+    Split the output of `label_file_lists` into one DataFrame per category.
 
     Args:
-        df1 (pl.DataFrame): First DataFrame
-        df2 (pl.DataFrame): Second DataFrame
+        labelled (pl.DataFrame): Collected output of `label_file_lists`
 
     Returns:
-        pl.DataFrame: A DataFrame containing only the files that exist in first DataFrame
-                     and not in the second DataFrame
+        tuple containing:
+            - common_rows (pl.DataFrame): hash and path of identical files
+            - changed_files (pl.DataFrame): hash, path and hash_2 of modified files
+            - only_in_df1 (pl.DataFrame): hash and path of files only in the first list
+            - only_in_df2 (pl.DataFrame): hash and path of files only in the second list
     """
-    if df1.is_empty():
-        return pl.DataFrame({"hash": [], "path": []})
-    if df2.is_empty():
-        return df1
-    return df1.join(df2, on=["path"], how="anti")
+    partitions = labelled.partition_by("status", as_dict=True, include_key=False)
+    empty = labelled.clear().drop("status")
+
+    def category(status: str) -> pl.DataFrame:
+        return partitions.get((status,), empty)
+
+    return (
+        category("common").select("hash", "path"),
+        category("changed").select("hash", "path", "hash_2"),
+        category("only_in_1").select("hash", "path"),
+        category("only_in_2").select(pl.col("hash_2").alias("hash"), "path"),
+    )
+
 
 def compare_file_lists(
-    df1: pl.DataFrame, df2: pl.DataFrame
+    df1: pl.DataFrame | pl.LazyFrame,
+    df2: pl.DataFrame | pl.LazyFrame,
+    engine: PolarsEngine = "auto",
 ) -> tuple[pl.DataFrame, pl.DataFrame, pl.DataFrame, pl.DataFrame]:
     """
     Compare file lists between two Dataframes and categorize the differences.
 
     Args:
-        df1 (pl.DataFrame): First DataFrame
-        df2 (pl.DataFrame): Second DataFrame
+        df1 (pl.DataFrame | pl.LazyFrame): First DataFrame
+        df2 (pl.DataFrame | pl.LazyFrame): Second DataFrame
+        engine (PolarsEngine): Polars engine used to collect the comparison plan
 
     Returns:
         tuple containing:
@@ -94,11 +158,580 @@ def compare_file_lists(
             - changed_files (pl.DataFrame): Files that exist in both but have different content
             - only_in_df1 (pl.DataFrame): Files that exist only in first image
             - only_in_df2 (pl.DataFrame): Files that exist only in second image
+
+    All categories are computed by the single join of `label_file_lists`.
     """
+    labelled = label_file_lists(df1, df2).collect(engine=engine)
+    return split_labelled_files(labelled)
+
+
+MERKLE_TREE_SCHEMA = {"directory": pl.String, "hash": pl.Binary, "files": pl.UInt64}
+
+
+def _parent(path: pl.Expr) -> pl.Expr:
+    """Directory of a path, "" for the root ("usr/lib/a.so" -> "usr/lib")."""
+    return path.str.replace(r"/?[^/]*$", "")
+
 
-    common_rows = _get_common_files(df1, df2)
-    changed_files = _get_changed_files(df1, df2)
-    only_in_df1 = _filter_files(df1, df2)
-    only_in_df2 = _filter_files(df2, df1)
+def build_merkle_tree(manifest: pl.DataFrame) -> pl.DataFrame:
+    """
+    Hash every directory of a manifest from the hashes of its files and directories.
+
+    Args:
+        manifest (pl.DataFrame): Manifest with the hash and path columns
+
+    Returns:
+        pl.DataFrame: A DataFrame with the columns of `MERKLE_TREE_SCHEMA`, one row
+            per directory ("" is the root):
+            - directory: Path of the directory
+            - hash: SHA256 of the sorted names and hashes of its children
+            - files: Number of files below the directory
 
-    return (common_rows, changed_files, only_in_df1, only_in_df2)
+    Two directories have the same hash exactly when they hold the same files with
+    the same content, at any depth. The tree is built bottom-up, one level of
+    depth at a time.
+    """
+    nodes = manifest.select(
+        "path",
+        pl.col("hash").cast(pl.Binary),
+        pl.lit("f").alias("kind"),
+        pl.lit(1, dtype=pl.UInt64).alias("files"),
+        pl.col("path").str.count_matches("/").cast(pl.Int32).alias("depth"),
+    )
+    max_depth = nodes["depth"].max()
+    if max_depth is None:
+        return pl.DataFrame(
+            {"directory": [""], "hash": [hashlib.sha256().digest()], "files": [0]},
+            schema=MERKLE_TREE_SCHEMA,
+        )
+    record = pl.concat_str(
+        "kind",
+        pl.col("path").str.extract(r"([^/]*)$", 1),
+        pl.lit("\x00"),
+        pl.col("hash").bin.encode("hex"),
+    )
+    directories = nodes.clear()
+    levels = []
+    for depth in range(cast(int, max_depth), -1, -1):
+        level = pl.concat([nodes.filter(pl.col("depth") == depth), directories])
+        parents = level.group_by(_parent(pl.col("path")).alias("directory")).agg(
+            record.sort().str.join("\n").alias("records"),
+            pl.col("files").sum(),
+        )
+        parents = parents.select(
+            "directory",
+            pl.Series(
+                "hash",
+                [
+                    hashlib.sha256(records.encode()).digest()
+                    for records in parents["records"]
+                ],
+                dtype=pl.Binary,
+            ),
+            "files",
+        )
+        levels.append(parents)
+        directories = parents.select(
+            pl.col("directory").alias("path"),
+            "hash",
+            pl.lit("d").alias("kind"),
+            "files",
+            pl.lit(depth - 1, dtype=pl.Int32).alias("depth"),
+        )
+    return pl.concat(levels).cast(MERKLE_TREE_SCHEMA).sort("directory")
+
+
+def _prefix_ranges(paths: pl.Series, prefixes: list[str]) -> list[tuple[int, int]]:
+    """
+    Find the rows of a sorted column that start with each prefix, by binary search.
+
+    Args:
+        paths (pl.Series): Paths sorted in ascending order
+        prefixes (list[str]): Prefixes ending with "/", or "" for every row
+
+    Returns:
+        list[tuple[int, int]]: Start and end of the rows of each prefix, which are
+            contiguous
+    """
+    # "/" is followed by "0", so "usr0" is the first path after the ones in "usr/"
+    bounds = pl.Series(
+        [*prefixes, *(f"{prefix[:-1]}0" if prefix else "" for prefix in prefixes)],
+        dtype=pl.String,
+    )
+    found = (
+        paths.to_frame("path")
+        .select(pl.col("path").search_sorted(bounds))
+        .to_series()
+        .to_list()
+    )
+    return [
+        (start, end) if prefix else (0, len(paths))
+        for prefix, start, end in zip(
+            prefixes, found[: len(prefixes)], found[len(prefixes) :]
+        )
+    ]
+
+
+def _skip_before(values: pl.Series, target: str, position: int, end: int) -> int:
+    """
+    Find the first row from position whose value is not below target.
+
+    Args:
+        values (pl.Series): Values sorted in ascending order
+        target (str): Value to find
+        position (int): Row below target to search from
+        end (int): Row at or above target to stop at
+
+    Returns:
+        int: The row, found with steps that double before a binary search, so
+            skipping a few rows only reads a few values
+    """
+    step = 1
+    while position + step < end and values[position + step] < target:
+        position += step
+        step *= 2
+    return bisect.bisect_left(values, target, position, min(position + step, end))
+
+
+def _child_directories(directories: pl.Series, directory: str) -> dict[str, int]:
+    """
+    Find the directories directly inside a directory of a Merkle tree.
+
+    Args:
+        directories (pl.Series): Directory column of the tree, sorted
+        directory (str): Path of the parent directory, "" for the root
+
+    Returns:
+        dict[str, int]: Row of each child directory in the tree
+
+    The subtree of each child is skipped with `_skip_before`, so the number of
+    rows read grows with the number of children, not with the directories below
+    them.
+    """
+    prefix = f"{directory}/" if directory else ""
+    [(position, end)] = _prefix_ranges(directories, [prefix])
+    children = {}
+    while position < end:
+        name = directories[position]
+        slash = name.find("/", len(prefix))
+        if not name:
+            position += 1
+        elif slash < 0:
+            children[name] = position
+            position += 1
+        else:
+            position = _skip_before(directories, f"{name[:slash]}0", position, end)
+    return children
+
+
+def _walk_changes(
+    tree_1: pl.DataFrame, tree_2: pl.DataFrame
+) -> Iterator[tuple[str, dict[str, tuple[int | None, int | None]]]]:
+    """
+    Walk two Merkle trees from the root, entering only the directories whose hash
+    differs.
+
+    Args:
+        tree_1 (pl.DataFrame): Tree of the first manifest, sorted by directory, see
+            `build_merkle_tree`
+        tree_2 (pl.DataFrame): Tree of the second manifest, sorted by directory
+
+    Yields:
+        tuple: Each directory in both trees with a different hash, and the row of
+            each of its child directories in both trees (None when the child is only
+            in the other tree)
+
+    Children with the same hash in both trees are identical and never entered, so
+    the walk reads a number of rows that grows with the change, not with the trees.
+    """
+    directories = (tree_1["directory"], tree_2["directory"])
+    hashes = (tree_1["hash"], tree_2["hash"])
+    # The root "" is the first row of a sorted tree
+    if hashes[0][0] == hashes[1][0]:
+        return
+    pending = [""]
+    while pending:
+        directory = pending.pop()
+        children_1 = _child_directories(directories[0], directory)
+        children_2 = _child_directories(directories[1], directory)
+        children = {
+            name: (children_1.get(name), children_2.get(name))
+            for name in sorted(children_1.keys() | children_2.keys())
+        }
+        yield directory, children
+        pending.extend(
+            name
+            for name, (row_1, row_2) in children.items()
+            if row_1 is not None
+            and row_2 is not None
+            and hashes[0][row_1] != hashes[1][row_2]
+        )
+
+
+def changed_directories(tree_1: pl.DataFrame, tree_2: pl.DataFrame) -> pl.Series:
+    """
+    Find the directories whose content differs between two Merkle trees.
+
+    Args:
+        tree_1 (pl.DataFrame): Tree of the first manifest, sorted by directory, see
+            `build_merkle_tree`
+        tree_2 (pl.DataFrame): Tree of the second manifest, sorted by directory
+
+    Returns:
+        pl.Series: Paths of the directories entered by `_walk_changes`, and of
+            every directory of the subtrees that are only in one tree
+    """
+    trees = (tree_1["directory"], tree_2["directory"])
+    found = []
+    for directory, children in _walk_changes(tree_1, tree_2):
+        found.append(directory)
+        for name, rows in children.items():
+            for side, row in enumerate(rows):
+                if row is not None and rows[1 - side] is None:
+                    [(start, end)] = _prefix_ranges(trees[side], [f"{name}/"])
+                    found.append(name)
+                    found.extend(trees[side].slice(start, end - start).to_list())
+    return pl.Series("directory", found, dtype=pl.String)
+
+
+def _sorted_by_path(df: pl.DataFrame) -> pl.DataFrame:
+    """
+    Sort a manifest by path, reading it only when the column is not flagged sorted.
+
+    Args:
+        df (pl.DataFrame): Manifest, see `manifest.load_manifest`
+
+    Returns:
+        pl.DataFrame: df itself when its path column is sorted, a sorted copy
+            otherwise (manifests stored before they were sorted)
+    """
+    df = df.select("hash", "path")
+    return df if df["path"].is_sorted() else df.sort("path")
+
+
+def _take_ranges(df: pl.DataFrame, ranges: list[tuple[int, int]]) -> pl.DataFrame:
+    """
+    Concatenate the rows of a frame in each range, which are sorted and disjoint.
+
+    Args:
+        df (pl.DataFrame): Frame to take the rows from
+        ranges (list[tuple[int, int]]): Start and end of each range
+
+    Returns:
+        pl.DataFrame: The rows, empty ranges are skipped
+    """
+    slices = [df.slice(start, end - start) for start, end in ranges if end > start]
+    return pl.concat(slices) if slices else df.clear()
+
+
+def compare_manifest_trees(
+    df1: pl.DataFrame,
+    tree_1: pl.DataFrame,
+    df2: pl.DataFrame,
+    tree_2: pl.DataFrame,
+) -> tuple[pl.LazyFrame, pl.DataFrame, pl.DataFrame, pl.DataFrame]:
+    """
+    Compare two manifests, joining only the files of the directories that changed.
+
+    Args:
+        df1 (pl.DataFrame): First manifest
+        tree_1 (pl.DataFrame): Merkle tree of the first manifest, sorted by directory
+        df2 (pl.DataFrame): Second manifest
+        tree_2 (pl.DataFrame): Merkle tree of the second manifest
+
+    Returns:
+        tuple: The four categories of `compare_file_lists`, with the common files
+            left lazy
+
+    The trees are walked from the root with `_walk_changes`. The files of each
+    changed directory are found by binary search in the manifests sorted by path,
+    leaving out the subtrees of its children that are in both trees (identical or
+    walked on their own). Only these rows are joined, and the rest of the first
+    manifest is common without being read, so the comparison takes a time that
+    grows with the size of the change.
+    """
+    frames = (_sorted_by_path(df1), _sorted_by_path(df2))
+    paths = (frames[0]["path"], frames[1]["path"])
+    ranges: tuple[list[tuple[int, int]], list[tuple[int, int]]] = ([], [])
+    for directory, children in _walk_changes(tree_1, tree_2):
+        prefixes = [f"{directory}/" if directory else ""] + [
+            f"{name}/" for name, rows in children.items() if None not in rows
+        ]
+        for side in (0, 1):
+            (start, end), *subtrees = _prefix_ranges(paths[side], prefixes)
+            # Sorted by position: "lib-x/" comes before "lib/" in the manifest
+            for child_start, child_end in sorted(subtrees):
+                ranges[side].append((start, child_start))
+                start = max(start, child_end)
+            ranges[side].append((start, end))
+    for side_ranges in ranges:
+        side_ranges.sort()
+    common_rows, changed_files, only_in_df1, only_in_df2 = compare_file_lists(
+        _take_ranges(frames[0], ranges[0]), _take_ranges(frames[1], ranges[1])
+    )
+    # The rows of the first manifest between the joined ones are in identical
+    # subtrees
+    bounds = [0, *itertools.chain.from_iterable(ranges[0]), frames[0].height]
+    unchanged = list(zip(bounds[::2], bounds[1::2]))
+    common = pl.concat(
+        [
+            *(
+                frames[0].lazy().slice(start, end - start)
+                for start, end in unchanged
+                if end > start
+            ),
+            common_rows.lazy(),
+        ],
+        how="vertical_relaxed",
+    )
+    return common.select("hash", "path"), changed_files, only_in_df1, only_in_df2
+
+
+def summarize_by_directory(
+    changed_files: pl.DataFrame, only_in_df1: pl.DataFrame, only_in_df2: pl.DataFrame
+) -> pl.DataFrame:
+    """
+    Count the differences between two manifests per directory.
+
+    Args:
+        changed_files (pl.DataFrame): Files with a different content
+        only_in_df1 (pl.DataFrame): Files only in the first manifest
+        only_in_df2 (pl.DataFrame): Files only in the second manifest
+
+    Returns:
+        pl.DataFrame: A DataFrame with the directory, changed, removed, added and
+            total columns, the directories with the most differences first
+    """
+    counts = [
+        frame.group_by(_parent(pl.col("path")).alias("directory")).agg(
+            pl.len().alias(name)
+        )
+        for frame, name in (
+            (changed_files, "changed"),
+            (only_in_df1, "removed"),
+            (only_in_df2, "added"),
+        )
+    ]
+    summary = counts[0]
+    for count in counts[1:]:
+        summary = summary.join(count, on="directory", how="full", coalesce=True)
+    return (
+        summary.with_columns(pl.col("changed", "removed", "added").fill_null(0))
+        .with_columns(pl.sum_horizontal("changed", "removed", "added").alias("total"))
+        .sort(["total", "directory"], descending=[True, False])
+    )
+
+
+CATEGORIES: tuple[str, ...] = ("common", "changed", "only_in_1", "only_in_2")
+MIN_BATCH_ROWS = 1024
+# Bytes used by a merge whatever the batch size: decoded Parquet row groups and the
+# buffers of the polars thread pool
+MERGE_BASE_MEMORY = 32 * 1024**2
+# Bytes used per byte of batch: the pending rows of both manifests (up to two
+# batches each), the join, its categories and the allocator slack, measured
+MERGE_MEMORY_FACTOR = 24
+
+
+def _batch_rows(path: str, memory_limit: int) -> int:
+    """
+    Number of manifest rows read at once so a merge step fits in memory_limit.
+
+    Args:
+        path (str): Path of a manifest, its first rows give the size of a row
+        memory_limit (int): Memory the merge may use, in bytes
+
+    Returns:
+        int: Rows per batch, at least `MIN_BATCH_ROWS`
+    """
+    sample = pl.scan_parquet(path).head(MIN_BATCH_ROWS).collect()
+    row_size = max(sample.estimated_size() // max(sample.height, 1), 1)
+    batch_memory = memory_limit - MERGE_BASE_MEMORY
+    return max(MIN_BATCH_ROWS, int(batch_memory // (MERGE_MEMORY_FACTOR * row_size)))
+
+
+def iter_manifest_batches(path: str, batch_rows: int) -> Iterator[pl.DataFrame]:
+    """
+    Read a manifest sorted by path one batch of rows at a time.
+
+    Args:
+        path (str): Path of the Parquet manifest
+        batch_rows (int): Number of rows per batch
+
+    Yields:
+        pl.DataFrame: Consecutive batches with the hash and path columns
+
+    Raises:
+        ValueError: If the manifest is not sorted by path
+    """
+    # Slices are pushed down to the Parquet reader, counting the rows first is not:
+    # it would read the whole file
+    manifest = pl.scan_parquet(path).select("hash", "path")
+    last = None
+    for offset in itertools.count(0, batch_rows):
+        batch = manifest.slice(offset, batch_rows).collect()
+        if batch.is_empty():
+            return
+        paths = batch["path"]
+        if not paths.is_sorted() or (last is not None and paths[0] < last):
+            raise ValueError(f"Manifest {path} is not sorted by path")
+        last = paths[-1]
+        yield batch
+
+
+def is_sorted_manifest(path: str, batch_rows: int = 1024**2) -> bool:
+    """
+    Check that a manifest is sorted by path, reading it one batch at a time.
+
+    Args:
+        path (str): Path of the Parquet manifest
+        batch_rows (int): Number of rows per batch
+
+    Returns:
+        bool: True if `compare_sorted_manifests` can read the manifest
+    """
+    try:
+        for _ in iter_manifest_batches(path, batch_rows):
+            pass
+    except ValueError:
+        return False
+    return True
+
+
+class _CategoryWriter:
+    """Append the rows of each category to numbered Parquet files."""
+
+    def __init__(self, output_dir: str):
+        self.output_dir = output_dir
+        self.counts: dict[str, int] = dict.fromkeys(CATEGORIES, 0)
+        self._parts = 0
+        for category in CATEGORIES:
+            os.makedirs(os.path.join(output_dir, category), exist_ok=True)
+
+    def write(self, categories: dict[str, pl.DataFrame]) -> None:
+        self._parts += 1
+        for category, rows in categories.items():
+            if rows.is_empty():
+                continue
+            self.counts[category] += rows.height
+            rows.write_parquet(
+                os.path.join(
+                    self.output_dir, category, f"part-{self._parts:06d}.parquet"
+                )
+            )
+
+
+def _merge_step(
+    rows_1: pl.DataFrame,
+    rows_2: pl.DataFrame,
+    directories: pl.Series | None,
+    writer: _CategoryWriter,
+) -> None:
+    common_rows = rows_1.clear()
+    if directories is not None:
+        in_changed = _parent(pl.col("path")).is_in(directories)
+        common_rows = rows_1.filter(~in_changed)
+        rows_1 = rows_1.filter(in_changed)
+        rows_2 = rows_2.filter(in_changed)
+    categories = split_labelled_files(label_file_lists(rows_1, rows_2).collect())
+    writer.write(
+        dict(
+            zip(
+                CATEGORIES,
+                (
+                    pl.concat([common_rows, categories[0]], how="vertical_relaxed"),
+                    *categories[1:],
+                ),
+            )
+        )
+    )
+
+
+def compare_sorted_manifests(
+    path_1: str,
+    path_2: str,
+    output_dir: str,
+    memory_limit: int,
+    directories: pl.Series | None = None,
+) -> dict[str, int]:
+    """
+    Compare two manifests sorted by path without loading them in memory.
+
+    Args:
+        path_1 (str): First manifest, sorted by path (see `manifest.write_manifest`)
+        path_2 (str): Second manifest, sorted by path
+        output_dir (str): Directory that receives one directory of Parquet files per
+            category, read them with `scan_category`
+        memory_limit (int): Memory the comparison may use, in bytes, on top of the
+            memory used before it starts. Limits below `MERGE_BASE_MEMORY` are
+            exceeded, the batches do not go below `MIN_BATCH_ROWS` rows
+        directories (pl.Series | None): Changed directories, see
+            `changed_directories`, files directly in other directories are common
+            without being joined
+
+    Returns:
+        dict[str, int]: Number of files in each of `CATEGORIES`
+
+    Both manifests are read in batches and merged: each step joins the rows of
+    both manifests up to the smallest last path read, which are complete since
+    both are sorted, and appends the categories of these rows to output_dir.
+    """
+    batch_rows = min(
+        _batch_rows(path_1, memory_limit), _batch_rows(path_2, memory_limit)
+    )
+    writer = _CategoryWriter(output_dir)
+    batches = [
+        iter_manifest_batches(path_1, batch_rows),
+        iter_manifest_batches(path_2, batch_rows),
+    ]
+    pending = [
+        pl.DataFrame(schema={"hash": pl.Binary, "path": pl.String}) for _ in batches
+    ]
+    done = [False, False]
+    while True:
+        for side in (0, 1):
+            if not done[side] and pending[side].height < batch_rows:
+                batch = next(batches[side], None)
+                if batch is None:
+                    done[side] = True
+                else:
+                    pending[side] = pl.concat(
+                        [pending[side], batch], how="vertical_relaxed"
+                    )
+        if all(done):
+            _merge_step(pending[0], pending[1], directories, writer)
+            return writer.counts
+        boundary = min(pending[side]["path"][-1] for side in (0, 1) if not done[side])
+        complete = pl.col("path") <= boundary
+        _merge_step(
+            pending[0].filter(complete),
+            pending[1].filter(complete),
+            directories,
+            writer,
+        )
+        pending = [rows.filter(~complete) for rows in pending]
+
+
+def scan_category(output_dir: str, category: str) -> pl.LazyFrame:
+    """
+    Read one category written by `compare_sorted_manifests`.
+
+    Args:
+        output_dir (str): Output directory of the comparison
+        category (str): One of `CATEGORIES`
+
+    Returns:
+        pl.LazyFrame: The files of the category, with the columns returned by
+            `compare_file_lists` for it
+    """
+    directory = os.path.join(output_dir, category)
+    if not os.listdir(directory):
+        columns = (
+            ["hash", "path", "hash_2"] if category == "changed" else ["hash", "path"]
+        )
+        return pl.LazyFrame(
+            schema={
+                column: pl.String if column == "path" else pl.Binary
+                for column in columns
+            }
+        )
+    return pl.scan_parquet(os.path.join(directory, "*.parquet"))
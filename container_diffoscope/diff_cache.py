@@ -0,0 +1,177 @@
+import json
+import os
+import shutil
+from dataclasses import dataclass
+import polars as pl
+from .cache import ContentCache
+from .chunking import comparison_mode
+from .diffoscope_runner import (
+    DIFF_OK,
+    DIFF_SKIPPED,
+    DiffResult,
+    diff_output_path,
+    relabel_comparison,
+)
+
+# Bump when the rendering of the comparisons changes, older entries are ignored
+DIFF_CACHE_VERSION = 2
+COMPARISON_FILE = "comparison.md"  # Markdown of the comparison, in each entry
+# Path the comparison was written for, how it was compared and the size of the
+# larger copy, in each entry
+SOURCE_FILE = "source.json"
+
+
+@dataclass(frozen=True)
+class ChangeGroup:
+    """
+    Changed files sharing the same pair of content digests, compared only once.
+
+    Attributes:
+        path (str): Path of the file that is compared
+        hash (bytes): Digest of the file in the first image
+        hash_2 (bytes): Digest of the file in the second image
+        duplicates (tuple[str, ...]): Other paths with the same change, they get a
+            copy of the comparison of path
+    """
+
+    path: str
+    hash: bytes
+    hash_2: bytes
+    duplicates: tuple[str, ...] = ()
+
+
+def diff_cache_key(hash_1: bytes, hash_2: bytes) -> str:
+    """
+    Build the key of the comparison of two file contents in the diff cache.
+
+    Args:
+        hash_1 (bytes): Digest of the file in the first image
+        hash_2 (bytes): Digest of the file in the second image
+
+    Returns:
+        str: Key made of the version of the cache and both digests in hex
+
+    The entry records how the files were compared, see `restore_cached_diff`.
+    """
+    return f"diff-v{DIFF_CACHE_VERSION}-{hash_1.hex()}-{hash_2.hex()}"
+
+
+def group_changed_files(changed_files: pl.DataFrame) -> list[ChangeGroup]:
+    """
+    Group the changed files by pair of digests, keeping the order of the frame.
+
+    Args:
+        changed_files (pl.DataFrame): Changed files with the hash, path and hash_2
+            columns, see `comparator.compare_file_lists`
+
+    Returns:
+        list[ChangeGroup]: One group per distinct (hash, hash_2) pair
+    """
+    groups = changed_files.group_by("hash", "hash_2", maintain_order=True).agg(
+        pl.col("path")
+    )
+    return [
+        ChangeGroup(paths[0], hash_1, hash_2, tuple(paths[1:]))
+        for hash_1, hash_2, paths in groups.iter_rows()
+    ]
+
+
+def restore_cached_diff(
+    cache: ContentCache,
+    group: ChangeGroup,
+    export_dir: str,
+    chunk_threshold: int | None,
+) -> DiffResult | None:
+    """
+    Copy the cached comparison of a group to the output of its first path.
+
+    Args:
+        cache (ContentCache): Cache of rendered comparisons
+        group (ChangeGroup): Changed files to look up
+        export_dir (str): Directory where the comparison markdown files are saved
+        chunk_threshold (int | None): Size from which files are compared chunk by
+            chunk in this run, see `chunking.comparison_mode`
+
+    Returns:
+        DiffResult | None: Result of the first path of the group, None on a miss or
+            when the entry was compared another way than this run would (for
+            example chunk by chunk before the threshold was raised)
+
+    The names of the files in the comparison are rewritten for the first path of
+    the group, see `diffoscope_runner.relabel_comparison`.
+    """
+    output = diff_output_path(export_dir, group.path)
+
+    def restore(path: str) -> str | None:
+        with open(os.path.join(path, SOURCE_FILE), encoding="utf-8") as source_file:
+            source = json.load(source_file)
+        if comparison_mode(source["size"], chunk_threshold) != source["mode"]:
+            return None
+        return relabel_comparison(
+            os.path.join(path, COMPARISON_FILE), output, source["path"], group.path
+        )
+
+    if cache.load(diff_cache_key(group.hash, group.hash_2), restore) is None:
+        return None
+    return DiffResult(group.path, DIFF_OK, output, message="cached")
+
+
+def store_diff(
+    cache: ContentCache, group: ChangeGroup, result: DiffResult, mode: str, size: int
+) -> None:
+    """
+    Add the comparison of a group to the cache when it completed.
+
+    Args:
+        cache (ContentCache): Cache of rendered comparisons
+        group (ChangeGroup): Changed files the comparison belongs to
+        result (DiffResult): Result of the comparison of the first path of the group
+        mode (str): How the files were compared, see `chunking.comparison_mode`
+        size (int): Size of the larger copy of the file
+    """
+    output = result.output
+    if result.status != DIFF_OK or output is None or not os.path.exists(output):
+        return
+
+    def write(path: str) -> None:
+        os.makedirs(path)
+        shutil.copyfile(output, os.path.join(path, COMPARISON_FILE))
+        with open(os.path.join(path, SOURCE_FILE), "w", encoding="utf-8") as source:
+            json.dump({"path": group.path, "mode": mode, "size": size}, source)
+
+    cache.store(diff_cache_key(group.hash, group.hash_2), write)
+
+
+def fan_out(
+    result: DiffResult, group: ChangeGroup, export_dir: str
+) -> list[DiffResult]:
+    """
+    Give the duplicates of a group a copy of the comparison of its first path,
+    showing their own path.
+
+    Args:
+        result (DiffResult): Result of the first path of the group
+        group (ChangeGroup): Changed files the comparison belongs to
+        export_dir (str): Directory where the comparison markdown files are saved
+
+    Returns:
+        list[DiffResult]: The result of the first path followed by one per duplicate
+    """
+    results = [result]
+    for path in group.duplicates:
+        output = None
+        if result.output is not None:
+            output = relabel_comparison(
+                result.output, diff_output_path(export_dir, path), group.path, path
+            )
+        results.append(
+            DiffResult(
+                path,
+                result.status,
+                output,
+                message=result.message
+                if result.status == DIFF_SKIPPED
+                else f"same change as {group.path}",
+            )
+        )
+    return results
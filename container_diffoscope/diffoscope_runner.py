@@ -1,10 +1,192 @@
-
-import subprocess
+import difflib
+import os
 import os.path
+import shutil
+import signal
+import subprocess
+import time
+from dataclasses import dataclass
 
-def get_detailed_file_comparison(
-    file_path_1: str, file_path_2: str, export_dir: str
+DIFF_OK = "ok"  # diffoscope ran to completion (with or without differences)
+DIFF_FAILED = "failed"  # diffoscope exited with an error
+DIFF_TIMEOUT = "timeout"  # diffoscope was killed after the per-file timeout
+DIFF_SKIPPED = "skipped"  # diffoscope was not run, the total budget was exhausted
+
+DIFF_REPORT_FILE = "report.md"  # List of all comparisons, at the top of export_dir
+DIFF_FILES_DIR = "files"  # Comparisons, mirroring the paths of the compared files
+
+TEXT_DIFF_MAX_SIZE = 1024**2  # Larger text files are left to diffoscope
+TEXT_SNIFF_SIZE = 8192  # Bytes searched for a NUL byte before a file is taken as text
+DIFF_CONTEXT = 2  # Lines of context around each change, as --diff-context
+# Comparison of files below the chunk threshold (a text diff or diffoscope) and the
+# settings its output depends on, recorded in the diff cache
+DETAILED_MODE = f"detailed-{TEXT_DIFF_MAX_SIZE}-{DIFF_CONTEXT}"
+IMAGE_LABELS = ("image_1", "image_2")  # Prefix of each copy in the comparisons
+# Signatures of formats diffoscope unpacks even when they look like text
+BINARY_MAGIC = (
+    b"\x7fELF",
+    b"\x1f\x8b",
+    b"BZh",
+    b"\xfd7zXZ\x00",
+    b"\x28\xb5\x2f\xfd",
+    b"PK\x03\x04",
+    b"SQLite format 3\x00",
+    b"%PDF",
+    b"\x89PNG",
+    b"!<arch>",
+)
+
+
+@dataclass(frozen=True)
+class DiffResult:
+    """
+    Outcome of the detailed comparison of one changed file.
+
+    Attributes:
+        path (str): Path of the file in the images
+        status (str): DIFF_OK, DIFF_FAILED, DIFF_TIMEOUT or DIFF_SKIPPED
+        output (str | None): Markdown file written by diffoscope, if any
+        duration (float): Wall-clock time spent in diffoscope, in seconds
+        message (str): Error output of diffoscope or reason why it was not run
+    """
+
+    path: str
+    status: str
+    output: str | None = None
+    duration: float = 0.0
+    message: str = ""
+
+
+def diff_output_path(export_dir: str, name: str) -> str:
+    """
+    Build the path of the markdown file of a comparison, mirroring the file path.
+
+    Args:
+        export_dir (str): Directory where the comparison markdown files are saved
+        name (str): Path of the compared file in the images
+
+    Returns:
+        str: export_dir/files/<name>.md, so files sharing a basename get different
+             outputs and no output can overwrite the report
+    """
+    relative = os.path.normpath(name.lstrip("/"))
+    if relative.startswith(".."):
+        relative = relative.replace(os.sep, "_")
+    return os.path.join(export_dir, DIFF_FILES_DIR, f"{relative}.md")
+
+
+def comparison_labels(name: str) -> tuple[str, str]:
+    """
+    Build the names the two copies of a file are shown under in its comparison.
+
+    Args:
+        name (str): Path of the compared file in the images
+
+    Returns:
+        tuple[str, str]: "image_1/<name>" and "image_2/<name>", which do not depend on
+            where the copies were extracted
+    """
+    relative = name.lstrip("/")
+    return f"{IMAGE_LABELS[0]}/{relative}", f"{IMAGE_LABELS[1]}/{relative}"
+
+
+def relabel_comparison(source: str, output: str, name: str, new_name: str) -> str:
+    """
+    Copy the comparison of a file to the output of another file with the same change.
+
+    Args:
+        source (str): Markdown file of the comparison
+        output (str): Path of the copy
+        name (str): Path of the file the comparison was written for
+        new_name (str): Path of the file the copy is for
+
+    Returns:
+        str: output
+    """
+    os.makedirs(os.path.dirname(output), exist_ok=True)
+    if name == new_name:
+        return shutil.copyfile(source, output)
+    labels = zip(comparison_labels(name), comparison_labels(new_name))
+    _copy_replacing(source, output, dict(labels))
+    return output
+
+
+def _copy_replacing(source: str, output: str, replacements: dict[str, str]) -> None:
+    with open(source, encoding="utf-8", errors="surrogateescape") as markdown:
+        text = markdown.read()
+    for old, new in replacements.items():
+        text = text.replace(old, new)
+    with open(output, "w", encoding="utf-8", errors="surrogateescape") as markdown:
+        markdown.write(text)
+
+
+def _read_text_lines(path: str) -> list[str] | None:
+    """
+    Read a small UTF-8 text file, the kind of file compared without diffoscope.
+
+    Args:
+        path (str): Path of the file
+
+    Returns:
+        list[str] | None: Lines of the file with their line endings, None when the
+            file is large, binary, not UTF-8 or cannot be read
+    """
+    try:
+        if os.path.getsize(path) > TEXT_DIFF_MAX_SIZE:
+            return None
+        with open(path, "rb") as file:
+            data = file.read()
+    except OSError:
+        return None
+    if data.startswith(BINARY_MAGIC) or b"\x00" in data[:TEXT_SNIFF_SIZE]:
+        return None
+    try:
+        return data.decode("utf-8").splitlines(keepends=True)
+    except UnicodeDecodeError:
+        return None
+
+
+def _write_text_diff(
+    lines_1: list[str],
+    lines_2: list[str],
+    label_1: str,
+    label_2: str,
+    output: str,
 ) -> None:
+    """
+    Write the unified diff of two text files in the markdown layout of diffoscope.
+
+    Args:
+        lines_1 (list[str]): Lines of the first file
+        lines_2 (list[str]): Lines of the second file
+        label_1 (str): Name the first file is shown under
+        label_2 (str): Name the second file is shown under
+        output (str): Path of the markdown file
+    """
+    diff = []
+    for line in difflib.unified_diff(
+        lines_1, lines_2, label_1, label_2, n=DIFF_CONTEXT
+    ):
+        diff.append(
+            line if line.endswith("\n") else f"{line}\n\\ No newline at end of file\n"
+        )
+    text = "".join(diff)
+    fence = "```"
+    while fence in text:
+        fence += "`"
+    with open(output, "w", encoding="utf-8") as markdown:
+        markdown.write(f"# Comparing `{label_1}` & `{label_2}`\n\n")
+        markdown.write(f"{fence}diff\n{text}{fence}\n")
+
+
+def get_detailed_file_comparison(
+    file_path_1: str,
+    file_path_2: str,
+    export_dir: str,
+    name: str | None = None,
+    timeout: float | None = None,
+    labels: tuple[str, str] | None = None,
+) -> DiffResult:
     """
     Generate a detailed comparison between two files (similar to git comparison) and save it as markdown.
 
@@ -12,12 +194,98 @@ def get_detailed_file_comparison(
         file_path_1 (str): Path to the first file
         file_path_2 (str): Path to the second file
         export_dir (str): Directory where the comparison markdown file will be saved
+        name (str | None): Path of the file in the images, the markdown file is saved
+            under the same relative path. Defaults to the basename of file_path_1
+        timeout (float | None): Seconds after which diffoscope is killed
+        labels (tuple[str, str] | None): Names the files are shown under instead of
+            their paths, see `comparison_labels`
+
+    Returns:
+        DiffResult: Status of the comparison and path of the markdown file
+
+    Small UTF-8 text files are compared in process with a unified diff, which is
+    written in the same markdown layout. Other files go to diffoscope, which runs in
+    its own process group, so the helpers it spawns are killed with it when the
+    timeout expires.
+    """
+    name = name or os.path.basename(file_path_1)
+    output = diff_output_path(export_dir, name)
+    os.makedirs(os.path.dirname(output), exist_ok=True)
+    start = time.perf_counter()
+    label_1, label_2 = labels or (file_path_1, file_path_2)
+    lines_1 = _read_text_lines(file_path_1)
+    lines_2 = _read_text_lines(file_path_2) if lines_1 is not None else None
+    if lines_1 is not None and lines_2 is not None:
+        _write_text_diff(lines_1, lines_2, label_1, label_2, output)
+        return DiffResult(name, DIFF_OK, output, time.perf_counter() - start)
+    print(f"Running comparison for {name}.", flush=True)
+    cmd = [
+        "diffoscope",
+        file_path_1,
+        file_path_2,
+        "--exclude-directory-metadata",
+        "yes",
+        "--diff-context=2",
+        "--markdown",
+        output,
+    ]
+    try:
+        process = subprocess.Popen(
+            cmd,
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.PIPE,
+            text=True,
+            start_new_session=True,
+        )
+    except FileNotFoundError as error:
+        return DiffResult(name, DIFF_FAILED, message=str(error))
+    try:
+        _, error_output = process.communicate(timeout=timeout)
+    except subprocess.TimeoutExpired:
+        os.killpg(process.pid, signal.SIGKILL)
+        process.communicate()
+        return DiffResult(
+            name,
+            DIFF_TIMEOUT,
+            duration=time.perf_counter() - start,
+            message=f"killed after {timeout:.0f}s",
+        )
+    duration = time.perf_counter() - start
+    # diffoscope exits with 1 when the files differ and 2 on errors
+    if process.returncode not in (0, 1):
+        return DiffResult(
+            name, DIFF_FAILED, duration=duration, message=error_output.strip()
+        )
+    if labels is not None and os.path.exists(output):
+        # diffoscope names the files by the paths it was given
+        _copy_replacing(output, output, {file_path_1: label_1, file_path_2: label_2})
+    return DiffResult(name, DIFF_OK, output, duration)
+
+
+def write_diff_report(results: list[DiffResult], export_dir: str) -> str:
+    """
+    Write the list of detailed comparisons, including the ones that did not complete.
+
+    Args:
+        results (list[DiffResult]): Results of the changed files
+        export_dir (str): Directory where the comparison markdown files are saved
 
-    The function uses diffoscope to generate a detailed comparison between the files
-    and saves the output as a markdown file named after first file in the comparison.
+    Returns:
+        str: Path of the markdown report
     """
     os.makedirs(export_dir, exist_ok=True)
-    base_name = os.path.basename(file_path_1)
-    print(f"Running comparison for {base_name}.", flush=True)
-    cmd = f"diffoscope {file_path_1} {file_path_2}  --exclude-directory-metadata yes  --diff-context=2 --markdown {export_dir}/{base_name}.md"
-    subprocess.run(cmd, shell=True)
\ No newline at end of file
+    report_path = os.path.join(export_dir, DIFF_REPORT_FILE)
+    lines = ["| File | Status | Duration | Details |", "|---|---|---|---|"]
+    for result in sorted(results, key=lambda result: result.path):
+        details = (
+            f"[diff]({os.path.relpath(result.output, export_dir)})"
+            if result.output
+            else result.message.replace("\n", " ").replace("|", "\\|")
+        )
+        lines.append(
+            f"| `{result.path}` | {result.status} | {result.duration:.1f}s "
+            f"| {details} |"
+        )
+    with open(report_path, "w", encoding="utf-8") as report:
+        report.write("\n".join(lines) + "\n")
+    return report_path
@@ -1,56 +1,727 @@
+import hashlib
+import io
+import json
+import mmap
+import os
+import shutil
 import subprocess
+import sys
+import tarfile
+import tempfile
+import uuid
+from collections.abc import Iterator
+from contextlib import contextmanager, nullcontext
+from dataclasses import replace
+from enum import Enum
+from typing import cast
+import polars as pl
+from .cache import ContentCache
+from .comparator import build_merkle_tree
+from .globs import PathFilter, headers_only_filter
+from .hasher import HASH_BLOCK_SIZE, hash_tar_members, hash_tar_stream
+from .layers import build_layered_manifest, detect_source, read_image_digest
+from .manifest import DEFAULT_HASH_ALGORITHM, load_manifest
+from .member_index import SPARSE_TYPE, load_member_index, open_source
+from .profiling import StageTimes
+from .spill import SPILL_FILE, SpillPolicy
 
-def export_filesystem_from_image(image: str) -> None:
+REGULAR_FILE_TYPES = [
+    tarfile.REGTYPE.decode(),
+    tarfile.AREGTYPE.decode(),
+    tarfile.CONTTYPE.decode(),
+]
+# Types of the members listed in manifests, hard links take the hash of their target
+FILE_TYPES = [*REGULAR_FILE_TYPES, tarfile.LNKTYPE.decode(), SPARSE_TYPE]
+
+
+class ImageSource(str, Enum):
+    """How an image given on the command line is read, see `layers.detect_source`."""
+
+    auto = "auto"
+    docker = "docker"
+    oci = "oci"
+    archive = "archive"
+    rootfs = "rootfs"
+    stream = "stream"
+
+
+MANIFEST_FILE = "manifest.parquet"
+INDEX_FILE = "index.parquet"
+TREE_FILE = "tree.parquet"  # Directory hashes, see `comparator.build_merkle_tree`
+# Globs and number of excluded files, see `globs.PathFilter`
+FILTER_FILE = "filter.json"
+FILESYSTEM_FILE = "filesystem.tar"
+
+
+def _path_digest(*parts: object) -> str:
+    return hashlib.sha256(":".join(map(str, parts)).encode()).hexdigest()[:16]
+
+
+def _docker_image_id(image: str) -> str:
+    """
+    Read the ID of a Docker image, pulling the image when it is not available locally.
+
+    Args:
+        image (str): Name or ID of the Docker image
+
+    Returns:
+        str: The image ID, "sha256:<digest of the image config>"
+    """
+    command = ["docker", "image", "inspect", "--format", "{{.Id}}", image]
+    inspect = subprocess.run(command, capture_output=True, text=True)
+    if inspect.returncode != 0:
+        subprocess.run(["docker", "pull", image], stdout=subprocess.DEVNULL, check=True)
+        inspect = subprocess.run(command, capture_output=True, text=True, check=True)
+    return inspect.stdout.strip()
+
+
+def image_key(
+    image: str,
+    source: str,
+    path_filter: PathFilter | None = None,
+    algorithm: str = DEFAULT_HASH_ALGORITHM,
+    spill: SpillPolicy | None = None,
+) -> str:
+    """
+    Build the key of an image in the image store.
+
+    Args:
+        image (str): Docker image name, OCI layout directory or tar archive
+        source (str): One of `ImageSource` except "auto", see `detect_source`
+        path_filter (PathFilter | None): Files hashed in the entry
+        algorithm (str): One of `manifest.HashAlgorithm`, the files are hashed with
+        spill (SpillPolicy | None): Payloads kept of Docker images hashed from the
+            export pipe, see `export_filesystem_from_image`
+
+    Returns:
+        str: "<source>-<image ID>", the image ID being the config digest reported
+             by Docker. Images read in place also include a digest of their path,
+             since their member index points at it, and flattened tar archives,
+             which have no ID, use their path, size and modification time instead.
+             Filtered images end with the fingerprint of the filter, and images
+             hashed with another algorithm than SHA256 with its name, so entries
+             stored before the algorithm was selectable keep their key.
+             Docker images hashed from the pipe end with the fingerprint of the
+             spill policy.
     """
-    Export the filesystem from a Docker image to a tar archive.
+    suffix = "" if path_filter is None else f"-{path_filter.fingerprint}"
+    if algorithm != DEFAULT_HASH_ALGORITHM:
+        suffix += f"-{algorithm}"
+    if source == "docker":
+        if spill is not None:
+            suffix += f"-stream-{spill.fingerprint}"
+        return f"docker-{_docker_image_id(image).split(':')[-1]}{suffix}"
+    path = os.path.abspath(image)
+    if source == "rootfs":
+        stat = os.stat(path)
+        return f"rootfs-{_path_digest(path, stat.st_size, stat.st_mtime_ns)}{suffix}"
+    image_id = read_image_digest(image, source)
+    return f"{source}-{image_id.split(':')[-1]}-{_path_digest(path)}{suffix}"
+
+
+class _TeeReader(io.RawIOBase):
+    """
+    Read-only raw stream copying every byte it reads from a pipe to a file, so an
+    archive can be hashed while it is written to disk.
+    """
+
+    def __init__(self, source, copy):
+        self._source = source
+        self._copy = copy
+
+    def readable(self) -> bool:
+        return True
+
+    def readinto(self, buffer) -> int:
+        read = self._source.readinto(buffer)
+        if read:
+            self._copy.write(memoryview(buffer)[:read])
+        return read or 0
+
+    def drain(self) -> None:
+        """Copy what is left in the pipe, such as the padding after the last member."""
+        shutil.copyfileobj(self._source, self._copy)
+
+
+def export_filesystem_from_image(
+    image: str,
+    tar_path: str,
+    manifest_path: str,
+    index_path: str,
+    jobs: int = 1,
+    path_filter: PathFilter | None = None,
+    algorithm: str = DEFAULT_HASH_ALGORITHM,
+    spill: SpillPolicy | None = None,
+) -> int:
+    """
+    Export the filesystem from a Docker image to a tar archive and hash it.
 
     Args:
         image (str): Name or ID of the Docker image to export
+        tar_path (str): Path of the tar archive that should be written
+        manifest_path (str): Path of the manifest that should be written
+        index_path (str): Path of the member index that should be written
+        jobs (int): Number of threads used to hash the files
+        path_filter (PathFilter | None): Files that are hashed, see
+            `hasher.hash_tar_members`
+        algorithm (str): One of `manifest.HashAlgorithm`
+        spill (SpillPolicy | None): Hash the export from the pipe without writing
+            it, tar_path only receives the payloads the policy keeps
+
+    Returns:
+        int: Number of files that were hashed
 
     The function performs the following steps:
-    1. Creates a temporary container from the image
-    2. Creates a cache directory for the image tar archive
-    3. Exports the container's filesystem to a tar archive
-    4. Removes the temporary container
+    1. Creates a temporary container (with a unique name) from the image
+    2. Exports the container's filesystem to a tar archive. With a single job the
+       members are hashed from the pipe while they are written to disk, with more
+       jobs the written archive is hashed by `hash_tar_members` in parallel. With a
+       spill policy the archive is never written and the members are hashed from
+       the pipe whatever the number of jobs
+    3. Removes the temporary container
     """
+    container = f"container-diffoscope-{uuid.uuid4().hex[:12]}"
     subprocess.run(
-        f"docker create --name image_temp {image}",
-        shell=True,
+        ["docker", "create", "--name", container, image],
         stdout=subprocess.DEVNULL,
         check=True,
     )
-    subprocess.run(f"mkdir -p cache/{image}", shell=True, check=True)
-    subprocess.run(
-        f"docker export image_temp > cache/{image}.tar",
-        shell=True,
-        stdout=subprocess.DEVNULL,
-        check=True,
+    try:
+        if spill is not None:
+            with subprocess.Popen(
+                ["docker", "export", container], stdout=subprocess.PIPE
+            ) as export:
+                pipe = cast(io.BufferedReader, export.stdout)
+                files = hash_tar_stream(
+                    pipe,
+                    tar_path,
+                    manifest_path,
+                    index_path=index_path,
+                    path_filter=path_filter,
+                    algorithm=algorithm,
+                    spill=spill,
+                )
+                # Read the padding after the last member, docker fails on a closed pipe
+                while pipe.read(HASH_BLOCK_SIZE):
+                    pass
+            if export.returncode:
+                raise subprocess.CalledProcessError(export.returncode, export.args)
+            return files
+        with (
+            open(tar_path, "wb") as archive,
+            subprocess.Popen(
+                ["docker", "export", container], stdout=subprocess.PIPE
+            ) as export,
+        ):
+            tee = _TeeReader(export.stdout, archive)
+            if jobs == 1:
+                files = hash_tar_stream(
+                    io.BufferedReader(tee, HASH_BLOCK_SIZE),
+                    tar_path,
+                    manifest_path,
+                    index_path=index_path,
+                    path_filter=path_filter,
+                    algorithm=algorithm,
+                )
+            tee.drain()
+        if export.returncode:
+            raise subprocess.CalledProcessError(export.returncode, export.args)
+    finally:
+        subprocess.run(
+            ["docker", "rm", container], stdout=subprocess.DEVNULL, check=True
+        )
+    if jobs > 1:
+        files = hash_tar_members(
+            tar_path,
+            manifest_path,
+            jobs=jobs,
+            index_path=index_path,
+            path_filter=path_filter,
+            algorithm=algorithm,
+        )
+    return files
+
+
+def ingest_image(
+    image: str,
+    source: str,
+    entry_dir: str,
+    jobs: int = 1,
+    layer_cache: ContentCache | None = None,
+    path_filter: PathFilter | None = None,
+    quick: bool = False,
+    algorithm: str = DEFAULT_HASH_ALGORITHM,
+    spill: SpillPolicy | None = None,
+) -> int:
+    """
+    Build the manifest and member index of an image inside a store entry.
+
+    Args:
+        image (str): Docker image name, OCI layout directory or tar archive
+        source (str): One of `ImageSource` except "auto", see `detect_source`
+        entry_dir (str): Directory that receives the manifest, the member index and,
+            for Docker images, the exported filesystem
+        jobs (int): Number of threads used to hash flattened archives or layers
+        layer_cache (ContentCache | None): Cache of partial layer manifests, layers
+            found in it are not hashed again
+        path_filter (PathFilter | None): Files that are hashed, the others are
+            skipped from their tar header and only counted in `FILTER_FILE`
+        quick (bool): Only record the tar headers in the member index, the manifest
+            stays empty and no payload is read, see `quick.quick_compare`
+        algorithm (str): One of `manifest.HashAlgorithm`, recorded in the manifest
+        spill (SpillPolicy | None): Hash Docker exports from the pipe without
+            writing them, only keeping these payloads in `SPILL_FILE`. Streams read
+            from stdin are always hashed this way, with the default policy when None
+
+    Returns:
+        int: Number of files in the image (hashed files, none in quick mode)
+
+    Docker images are exported with the Docker CLI into the entry, and hashed while
+    the export is running when a single job is used. Flattened tar
+    archives read from stdin are hashed as they arrive. Flattened tar
+    archives and layered images (OCI layouts and `docker save` archives) are read
+    in place, layered images layer by layer applying the whiteouts of each layer.
+    The Merkle tree of the manifest is stored next to it.
+    """
+    os.makedirs(entry_dir, exist_ok=True)
+    hashing_filter = headers_only_filter(path_filter) if quick else path_filter
+    manifest_path = os.path.join(entry_dir, MANIFEST_FILE)
+    index_path = os.path.join(entry_dir, INDEX_FILE)
+    if spill is not None or source == "stream":
+        # Kept payloads are those that may be compared, whatever is hashed
+        spill = replace(spill or SpillPolicy(), path_filter=path_filter)
+    if source == "stream":
+        count = hash_tar_stream(
+            sys.stdin.buffer,
+            os.path.join(entry_dir, SPILL_FILE),
+            manifest_path,
+            index_path=index_path,
+            path_filter=hashing_filter,
+            algorithm=algorithm,
+            spill=spill,
+        )
+    elif source in ("oci", "archive"):
+        count = build_layered_manifest(
+            image,
+            source,
+            manifest_path,
+            index_path,
+            jobs=jobs,
+            layer_cache=layer_cache,
+            path_filter=hashing_filter,
+            algorithm=algorithm,
+        )
+    elif source == "docker":
+        tar_path = os.path.join(
+            entry_dir, FILESYSTEM_FILE if spill is None else SPILL_FILE
+        )
+        count = export_filesystem_from_image(
+            image,
+            tar_path,
+            manifest_path,
+            index_path,
+            jobs,
+            hashing_filter,
+            algorithm,
+            spill,
+        )
+    else:
+        count = hash_tar_members(
+            os.path.abspath(image),
+            manifest_path,
+            jobs=jobs,
+            index_path=index_path,
+            path_filter=hashing_filter,
+            algorithm=algorithm,
+        )
+    if not quick:
+        build_merkle_tree(load_manifest(manifest_path)).write_parquet(
+            os.path.join(entry_dir, TREE_FILE)
+        )
+    if path_filter is not None:
+        _write_filter_stats(entry_dir, path_filter)
+    return count
+
+
+def _write_filter_stats(entry_dir: str, path_filter: PathFilter) -> None:
+    """
+    Record the globs of a filtered entry and the number of files they excluded.
+
+    Args:
+        entry_dir (str): Directory of the entry, with its member index
+        path_filter (PathFilter): Filter the entry was hashed with
+    """
+    files = (
+        load_member_index(os.path.join(entry_dir, INDEX_FILE))
+        .filter(pl.col("type").is_in(FILE_TYPES))
+        .get_column("path")
+        .unique()
     )
-    subprocess.run(
-        "docker rm image_temp", shell=True, stdout=subprocess.DEVNULL, check=True
+    excluded = sum(not path_filter.keeps(path) for path in files)
+    with open(os.path.join(entry_dir, FILTER_FILE), "w", encoding="utf-8") as stats:
+        json.dump(
+            {
+                "include": list(path_filter.include),
+                "exclude": list(path_filter.exclude),
+                "excluded": excluded,
+            },
+            stats,
+        )
+
+
+def load_excluded_count(entry_dir: str) -> int | None:
+    """
+    Read the number of files a path filter excluded from a store entry.
+
+    Args:
+        entry_dir (str): Directory of the entry, see `open_image`
+
+    Returns:
+        int | None: Number of excluded files, None for entries hashed without filter
+    """
+    path = os.path.join(entry_dir, FILTER_FILE)
+    if not os.path.exists(path):
+        return None
+    with open(path, encoding="utf-8") as stats:
+        return json.load(stats)["excluded"]
+
+
+def load_tree(entry_dir: str) -> pl.DataFrame | None:
+    """
+    Load the Merkle tree of a store entry.
+
+    Args:
+        entry_dir (str): Directory of the entry, see `open_image`
+
+    Returns:
+        pl.DataFrame | None: The tree, see `comparator.build_merkle_tree`, None for
+            entries stored before trees were added
+    """
+    path = os.path.join(entry_dir, TREE_FILE)
+    return pl.read_parquet(path) if os.path.exists(path) else None
+
+
+def _payload_bytes(entry_dir: str) -> int:
+    """
+    Size of the regular files recorded in the member index of an entry.
+
+    Args:
+        entry_dir (str): Directory of the entry, see `open_image`
+
+    Returns:
+        int: Number of bytes of file contents in the image
+    """
+    return (
+        pl.scan_parquet(os.path.join(entry_dir, INDEX_FILE))
+        .unique("path", keep="last")
+        .filter(pl.col("type").is_in(REGULAR_FILE_TYPES + [SPARSE_TYPE]))
+        .select(pl.col("size").sum())
+        .collect()
+        .item()
     )
 
 
-def get_hash_file_list(image: str) -> None:
+@contextmanager
+def open_image(
+    image: str,
+    store: ContentCache,
+    source: str = "auto",
+    jobs: int = 1,
+    layer_cache: ContentCache | None = None,
+    path_filter: PathFilter | None = None,
+    quick: bool = False,
+    algorithm: str = DEFAULT_HASH_ALGORITHM,
+    spill: SpillPolicy | None = None,
+    times: StageTimes | None = None,
+) -> Iterator[str]:
+    """
+    Use the store entry of an image, exporting and hashing the image when needed.
+
+    Args:
+        image (str): Docker image name, OCI layout directory or tar archive
+        store (ContentCache): Store of image entries keyed by `image_key`
+        source (str): One of `ImageSource`, "auto" detects it with `detect_source`
+        jobs (int): Number of threads used to hash flattened archives or layers
+        layer_cache (ContentCache | None): Cache of partial layer manifests
+        path_filter (PathFilter | None): Files that are hashed, see `ingest_image`
+        quick (bool): Use an entry with the tar headers only, see `ingest_image`
+        algorithm (str): One of `manifest.HashAlgorithm`, images hashed with another
+            algorithm have their own entry
+        spill (SpillPolicy | None): Payloads kept of images hashed from a pipe, see
+            `ingest_image`
+        times (StageTimes | None): Timings the "hash <image>" stage is added to when
+            the image is ingested, with the number of files hashed and, when
+            profiling, the bytes of their contents
+
+    Yields:
+        str: Directory of the entry, with `MANIFEST_FILE`, `INDEX_FILE` and
+             `TREE_FILE`. The entry is not evicted from the store until the
+             context exits. Streams read from stdin have no key, they are ingested
+             into a temporary entry removed when the context exits.
+    """
+    if source == "auto":
+        source = detect_source(image)
+
+    def ingest(entry_dir: str) -> int:
+        stage = f"hash {image}"
+        with nullcontext() if times is None else times.measure(stage):
+            count = ingest_image(
+                image,
+                source,
+                entry_dir,
+                jobs,
+                layer_cache,
+                path_filter,
+                quick,
+                algorithm,
+                spill,
+            )
+        if times is not None:
+            times.count(stage, files=count)
+            if times.profile:
+                times.count(stage, bytes=_payload_bytes(entry_dir))
+        return count
+
+    if source == "stream":
+        with tempfile.TemporaryDirectory(prefix="container-diffoscope-") as entry_dir:
+            ingest(entry_dir)
+            yield entry_dir
+        return
+    with store.pin_or_store(
+        image_key(
+            image,
+            source,
+            headers_only_filter(path_filter) if quick else path_filter,
+            algorithm,
+            spill,
+        ),
+        ingest,
+    ) as entry_dir:
+        yield entry_dir
+
+
+def _member_destination(output_dir: str, file_path: str) -> str | None:
+    """
+    Build the path a tar member is extracted to, refusing paths outside output_dir.
+
+    Args:
+        output_dir (str): Directory the members are extracted into
+        file_path (str): Path of the member in the tar archive
+
+    Returns:
+        str | None: Destination path or None if the member would escape output_dir
+    """
+    root = os.path.abspath(output_dir)
+    destination = os.path.normpath(os.path.join(root, file_path.lstrip("/")))
+    if not destination.startswith(root + os.sep):
+        return None
+    return destination
+
+
+def _resolve_hard_links(index: pl.DataFrame, index_path: str) -> pl.DataFrame:
+    """
+    Replace the hard link entries of the index by the payload of their targets.
+
+    Args:
+        index (pl.DataFrame): Member index entries that should be extracted
+        index_path (str): Path of the full member index of the archive
+
+    Returns:
+        pl.DataFrame: The entries with hard links pointing at their target payload
+    """
+    links = index.filter(pl.col("type") == tarfile.LNKTYPE.decode())
+    if links.is_empty():
+        return index
+    targets = load_member_index(index_path, links["linkname"].to_list())
+    resolved = links.select("path", "linkname").join(
+        targets.drop("linkname").rename({"path": "linkname"}), on="linkname"
+    )
+    return pl.concat(
+        [
+            index.filter(pl.col("type") != tarfile.LNKTYPE.decode()),
+            resolved.select(index.columns),
+        ]
+    )
+
+
+def _write_member(output_dir: str, path: str, payload) -> None:
+    """
+    Write the payload of a member below output_dir, skipping unsafe paths.
+
+    Args:
+        output_dir (str): Directory the members are extracted into
+        path (str): Path of the member in the image
+        payload: Bytes-like object or binary stream with the member content
+    """
+    destination = _member_destination(output_dir, path)
+    if destination is None:
+        return
+    os.makedirs(os.path.dirname(destination), exist_ok=True)
+    with open(destination, "wb") as output:
+        if isinstance(payload, (bytes, memoryview)):
+            output.write(payload)
+        else:
+            shutil.copyfileobj(payload, output)
+
+
+def _extract_mapped(output_dir: str, source: str, members: pl.DataFrame) -> None:
     """
-    Generate a list of files with their SHA256 hashes from a Docker image tar archive.
+    Copy regular files out of a memory map of an uncompressed tar stream.
 
     Args:
-        image (str): Name of the Docker image whose filesystem has been exported to tar
+        output_dir (str): Directory the members are extracted into
+        source (str): Path of the file holding the tar stream
+        members (pl.DataFrame): Member index entries of the files stored in source
+    """
+    with (
+        open(source, "rb") as archive,
+        mmap.mmap(archive.fileno(), 0, access=mmap.ACCESS_READ) as mapped,
+    ):
+        view = memoryview(mapped)
+        try:
+            for path, start, size in members.select(
+                "path", pl.col("source_offset") + pl.col("data_offset"), "size"
+            ).iter_rows():
+                _write_member(output_dir, path, view[start : start + size])
+        finally:
+            view.release()
 
-    The function extracts the tar archive and generates a text file in the cache directory
-    containing hash and filepath pairs for each file in the image.
+
+def _extract_streamed(
+    output_dir: str,
+    source: str,
+    source_offset: int,
+    source_size: int | None,
+    members: pl.DataFrame,
+) -> None:
     """
-    cmd = f'tar xf cache/{image}.tar --to-command=\'sh -c "sha256sum | sed \\"s|-|$TAR_FILENAME|\\""\' > cache/{image}_list.txt'
-    subprocess.run(cmd, shell=True)
+    Extract members of a tar stream that can not be read with a seek.
+
+    Args:
+        output_dir (str): Directory the members are extracted into
+        source (str): Path of the file holding the tar stream
+        source_offset (int): Offset of the tar stream inside the file
+        source_size (int | None): Length of the tar stream
+        members (pl.DataFrame): Member index entries of the files stored in source
+
+    The stream is read once, members are matched on the offset of their header.
+    """
+    wanted: dict[int, list[str]] = {}
+    for path, header_offset in members.select("path", "header_offset").iter_rows():
+        wanted.setdefault(header_offset, []).append(path)
+    with (
+        open_source(source, source_offset, source_size) as stream,
+        tarfile.open(fileobj=stream, mode="r|*") as tar,
+    ):
+        for member in tar:
+            paths = wanted.pop(member.offset, None)
+            if paths is None or not member.isfile():
+                continue
+            _write_member(output_dir, paths[0], tar.extractfile(member))
+            first = _member_destination(output_dir, paths[0])
+            for path in paths[1:]:
+                destination = _member_destination(output_dir, path)
+                if first is not None and destination is not None:
+                    os.makedirs(os.path.dirname(destination), exist_ok=True)
+                    shutil.copyfile(first, destination)
+            if not wanted:
+                break
+
+
+def extract_members(index_path: str, file_paths: list[str], output_dir: str) -> None:
+    """
+    Extract a set of members from an image using its member index.
+
+    Args:
+        index_path (str): Path to the member index written while hashing the image
+        file_paths (list[str]): Paths of the members that should be extracted
+        output_dir (str): Directory the members are extracted into
+
+    Regular files stored in uncompressed tar streams are copied straight out of a
+    memory map, one slice per member, so the archives are never rescanned. Members
+    the index can not address with a seek (sparse files or compressed layers) are
+    extracted with a single pass over their tar stream. Paths missing from the
+    index are not part of the image and are skipped, like files whose payload was
+    not kept (see `find_missing_payloads`). Empty files are written without reading
+    their source.
+    """
+    index = _resolve_hard_links(load_member_index(index_path, file_paths), index_path)
+    files = index.filter(pl.col("type").is_in(REGULAR_FILE_TYPES + [SPARSE_TYPE]))
+    for path in files.filter(pl.col("size") == 0)["path"].to_list():
+        _write_member(output_dir, path, b"")
+    files = files.filter((pl.col("size") > 0) & pl.col("source").is_not_null())
+    seekable = (pl.col("type") != SPARSE_TYPE) & ~pl.col("compressed")
+
+    for (source,), members in files.filter(seekable).group_by("source"):
+        _extract_mapped(output_dir, str(source), members)
+
+    for (source, source_offset, source_size), members in files.filter(
+        ~seekable
+    ).group_by("source", "source_offset", "source_size"):
+        _extract_streamed(
+            output_dir,
+            str(source),
+            int(cast(int, source_offset)),
+            None if source_size is None else int(cast(int, source_size)),
+            members,
+        )
+
+    for path, linkname in (
+        index.filter(pl.col("type") == tarfile.SYMTYPE.decode())
+        .select("path", "linkname")
+        .iter_rows()
+    ):
+        destination = _member_destination(output_dir, path)
+        if destination is None or os.path.lexists(destination):
+            continue
+        os.makedirs(os.path.dirname(destination), exist_ok=True)
+        os.symlink(linkname, destination)
+
+
+def find_missing_payloads(entry_dir: str, file_paths: list[str]) -> set[str]:
+    """
+    Find the files of an image whose content can not be extracted.
+
+    Args:
+        entry_dir (str): Store entry of the image, see `open_image`
+        file_paths (list[str]): Paths of the files
+
+    Returns:
+        set[str]: Paths of the files of an image hashed from a stream whose payload
+            was not kept, see `spill.SpillPolicy`
+    """
+    index_path = os.path.join(entry_dir, INDEX_FILE)
+    index = _resolve_hard_links(load_member_index(index_path, file_paths), index_path)
+    return set(
+        index.filter(
+            pl.col("type").is_in(REGULAR_FILE_TYPES + [SPARSE_TYPE])
+            & pl.col("source").is_null()
+            & (pl.col("size") > 0)
+        )["path"].to_list()
+    )
+
+
+def extract_files_from_tar(
+    file_paths: list[str], entry_dir: str, output_dir: str
+) -> None:
+    """
+    Extract a set of files (based on the file paths) from an image of the store.
+
+    Args:
+        file_paths (list[str]): Paths of the files to extract from the image
+        entry_dir (str): Store entry of the image, see `open_image`
+        output_dir (str): Directory the files are extracted into
+    """
+    extract_members(os.path.join(entry_dir, INDEX_FILE), file_paths, output_dir)
+
 
-def extract_file_from_tar(file_path: str, image: str) -> None:
+def extract_file_from_tar(file_path: str, entry_dir: str, output_dir: str) -> None:
     """
-    Extract a single file (based on the file path) from a Docker image tar archive.
+    Extract a single file (based on the file path) from an image of the store.
 
     Args:
-        file_path (str): Path of the file to extract from the tar archive
-        image (str): Name of the Docker image whose tar archive contains the file
+        file_path (str): Path of the file to extract from the image
+        entry_dir (str): Store entry of the image, see `open_image`
+        output_dir (str): Directory the file is extracted into
     """
-    cmd = f'tar -xf cache/{image}.tar -C cache/{image} "{file_path}"'
-    subprocess.run(cmd, shell=True)
\ No newline at end of file
+    extract_files_from_tar([file_path], entry_dir, output_dir)
@@ -0,0 +1,188 @@
+import hashlib
+import re
+from dataclasses import dataclass
+from functools import cached_property
+
+# Characters with a meaning in regular expressions but not in globs
+_REGEX_SPECIAL = set(".^$+()[]{}|\\")
+
+
+def glob_to_regex(pattern: str) -> str:
+    """
+    Translate a path glob into a regular expression matched against "/<path>".
+
+    Args:
+        pattern (str): Glob where "*" and "?" stay inside one directory, "**" spans
+            directories and "**/" also matches no directory. A pattern without "/"
+            matches the name of the file at any depth, like in .gitignore files
+
+    Returns:
+        str: Anchored regular expression, usable with `re` and polars
+    """
+    if "/" not in pattern:
+        pattern = f"**/{pattern}"
+    elif not pattern.startswith(("/", "**")):
+        pattern = f"/{pattern}"
+    parts = []
+    position = 0
+    while position < len(pattern):
+        if pattern.startswith("**/", position):
+            parts.append("(?:.*/)?")
+            position += 3
+        elif pattern.startswith("**", position):
+            parts.append(".*")
+            position += 2
+        else:
+            character = pattern[position]
+            if character == "*":
+                parts.append("[^/]*")
+            elif character == "?":
+                parts.append("[^/]")
+            elif character in _REGEX_SPECIAL:
+                parts.append(f"\\{character}")
+            else:
+                parts.append(character)
+            position += 1
+    return f"^{''.join(parts)}$"
+
+
+def compile_globs(
+    patterns: list[str] | tuple[str, ...], subtrees: bool = False
+) -> re.Pattern[str] | None:
+    """
+    Compile several globs into a single regular expression.
+
+    Args:
+        patterns (list[str] | tuple[str, ...]): Globs, see `glob_to_regex`
+        subtrees (bool): Also match everything below a matching directory
+
+    Returns:
+        re.Pattern[str] | None: Expression matching "/<path>" when any glob matches,
+            None when there are no globs
+    """
+    if not patterns:
+        return None
+    suffix = "(?:/.*)?$" if subtrees else "$"
+    return re.compile(
+        "|".join(
+            f"(?:{glob_to_regex(pattern).removesuffix('$')}{suffix})"
+            for pattern in patterns
+        )
+    )
+
+
+@dataclass(frozen=True)
+class PathFilter:
+    """
+    Paths kept when an image is hashed.
+
+    Attributes:
+        include (tuple[str, ...]): Globs of the kept paths, every path when empty
+        exclude (tuple[str, ...]): Globs of the skipped paths, applied after include
+
+    A glob matching a directory also matches everything below it, so "/usr/share/doc"
+    and "/usr/share/doc/**" both skip the documentation.
+    """
+
+    include: tuple[str, ...] = ()
+    exclude: tuple[str, ...] = ()
+
+    @cached_property
+    def _include(self) -> re.Pattern[str] | None:
+        return compile_globs(self.include, subtrees=True)
+
+    @cached_property
+    def _exclude(self) -> re.Pattern[str] | None:
+        return compile_globs(self.exclude, subtrees=True)
+
+    def keeps(self, path: str) -> bool:
+        """
+        Check whether a file is kept.
+
+        Args:
+            path (str): Normalized path of the file, see
+                `member_index.normalize_member_name`
+
+        Returns:
+            bool: True when the path matches an include glob (or there are none) and
+                no exclude glob
+        """
+        path = f"/{path}"
+        if self._include is not None and not self._include.match(path):
+            return False
+        return self._exclude is None or not self._exclude.match(path)
+
+    @cached_property
+    def fingerprint(self) -> str:
+        """Short digest of the globs, distinguishing the manifests they produce."""
+        globs = "\0".join(("+", *self.include, "-", *self.exclude))
+        return hashlib.sha256(globs.encode()).hexdigest()[:16]
+
+
+def headers_only_filter(path_filter: PathFilter | None = None) -> PathFilter:
+    """
+    Filter that hashes no file, so only the tar headers of an image are read.
+
+    Args:
+        path_filter (PathFilter | None): Filter the headers are listed with
+
+    Returns:
+        PathFilter: path_filter with an exclude glob matching every path
+    """
+    if path_filter is None:
+        return PathFilter(exclude=("**",))
+    return PathFilter(path_filter.include, (*path_filter.exclude, "**"))
+
+
+def load_filter_file(path: str) -> tuple[list[str], list[str]]:
+    """
+    Read the globs of a filter file.
+
+    Args:
+        path (str): File with one glob per line, "+ <glob>" to include, "- <glob>" or
+            a bare glob to exclude, blank lines and lines starting with "#" ignored
+
+    Returns:
+        tuple containing:
+            - include (list[str]): Globs of the kept paths
+            - exclude (list[str]): Globs of the skipped paths
+    """
+    include = []
+    exclude = []
+    with open(path, encoding="utf-8") as filter_file:
+        for line in filter_file:
+            line = line.strip()
+            if not line or line.startswith("#"):
+                continue
+            if line.startswith("+ "):
+                include.append(line[2:].strip())
+            else:
+                exclude.append(line.removeprefix("- ").strip())
+    return include, exclude
+
+
+def build_path_filter(
+    include: list[str] | tuple[str, ...] = (),
+    exclude: list[str] | tuple[str, ...] = (),
+    filter_file: str | None = None,
+) -> PathFilter | None:
+    """
+    Combine the globs given on the command line with those of a filter file.
+
+    Args:
+        include (list[str] | tuple[str, ...]): Globs of the kept paths
+        exclude (list[str] | tuple[str, ...]): Globs of the skipped paths
+        filter_file (str | None): Filter file, see `load_filter_file`
+
+    Returns:
+        PathFilter | None: The filter, None when there are no globs
+    """
+    include = list(include)
+    exclude = list(exclude)
+    if filter_file is not None:
+        file_include, file_exclude = load_filter_file(filter_file)
+        include += file_include
+        exclude += file_exclude
+    if not include and not exclude:
+        return None
+    return PathFilter(tuple(include), tuple(exclude))
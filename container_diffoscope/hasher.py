@@ -0,0 +1,354 @@
+import hashlib
+import os
+import tarfile
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+from functools import partial
+import polars as pl
+from .globs import PathFilter
+from .manifest import DEFAULT_HASH_ALGORITHM, MANIFEST_SCHEMA, write_manifest
+from .spill import SpillPolicy, SpillStore
+from .member_index import (
+    add_member,
+    new_member_index,
+    normalize_member_name,
+    write_member_index,
+)
+
+# Size of the blocks read from the tar stream while hashing
+HASH_BLOCK_SIZE = 1024 * 1024
+PENDING_MEMBERS_PER_JOB = 4  # Number of members queued per worker in the parallel mode
+_DIGESTS = {
+    "sha256": hashlib.sha256,
+    # Same 32 byte digests as SHA256, faster on 64-bit CPUs without SHA instructions
+    "blake2b": partial(hashlib.blake2b, digest_size=32),
+}
+
+
+def new_digest(algorithm: str = DEFAULT_HASH_ALGORITHM):
+    """
+    Create an empty hash object.
+
+    Args:
+        algorithm (str): One of `manifest.HashAlgorithm`
+
+    Returns:
+        A hashlib object with `update` and `digest`
+
+    Raises:
+        ValueError: If the algorithm is not supported
+    """
+    try:
+        return _DIGESTS[algorithm]()
+    except KeyError:
+        raise ValueError(f"Unsupported hash algorithm: {algorithm}") from None
+
+
+def hash_stream(
+    stream, buffer: memoryview, algorithm: str = DEFAULT_HASH_ALGORITHM
+) -> bytes:
+    """
+    Compute the hash of a stream, typically a tar member, by reading it in blocks.
+
+    Args:
+        stream: Binary file-like object, for example returned by tarfile for a member
+        buffer (memoryview): Reusable buffer the payload is read into
+        algorithm (str): One of `manifest.HashAlgorithm`
+
+    Returns:
+        bytes: Digest of the stream content
+    """
+    digest = new_digest(algorithm)
+    while True:
+        read = stream.readinto(buffer)
+        if not read:
+            break
+        digest.update(buffer[:read])
+    return digest.digest()
+
+
+def _hash_range(
+    fd: int,
+    offset: int,
+    size: int,
+    block_size: int,
+    algorithm: str = DEFAULT_HASH_ALGORITHM,
+) -> bytes:
+    """
+    Compute the hash of a byte range of an open file.
+
+    Args:
+        fd (int): File descriptor of the tar archive
+        offset (int): Offset of the first byte of the range
+        size (int): Length of the range in bytes
+        block_size (int): Number of bytes read at once
+        algorithm (str): One of `manifest.HashAlgorithm`
+
+    Returns:
+        bytes: Digest of the range
+
+    Positional reads are used, so many threads can share the same descriptor.
+    At most `block_size` bytes are held in memory regardless of the range size.
+    """
+    digest = new_digest(algorithm)
+    end = offset + size
+    while offset < end:
+        chunk = os.pread(fd, min(block_size, end - offset), offset)
+        if not chunk:
+            raise EOFError(f"Unexpected end of archive at offset {offset}")
+        digest.update(chunk)
+        offset += len(chunk)
+    return digest.digest()
+
+
+def _hash_tar_members_serial(
+    tar_path: str,
+    manifest: dict[str, list],
+    block_size: int,
+    index: dict[str, list] | None,
+    stream=None,
+    path_filter: PathFilter | None = None,
+    algorithm: str = DEFAULT_HASH_ALGORITHM,
+    spill: SpillStore | None = None,
+) -> None:
+    """
+    Hash every regular file of a tar archive while streaming it once.
+
+    Args:
+        tar_path (str): Path to the tar archive with the exported filesystem
+        manifest (dict[str, list]): Hash and path lists the results are appended to
+        block_size (int): Number of bytes read from the archive at once
+        index (dict[str, list] | None): Member index filled with every member
+        stream: Binary file-like object the archive is read from instead of tar_path,
+            which is then only recorded as the source of the members
+        path_filter (PathFilter | None): Files that are hashed, the payload of the
+            others is skipped
+        algorithm (str): One of `manifest.HashAlgorithm`
+        spill (SpillStore | None): Store the payloads its policy keeps are copied
+            to, the stream is then not kept and the member index points at the store
+    """
+    buffer = memoryview(bytearray(block_size))
+    digests: dict[str, bytes] = {}
+    with tarfile.open(
+        tar_path if stream is None else None,
+        mode="r|",
+        fileobj=stream,
+        bufsize=block_size,
+    ) as tar:
+        for member in tar:
+            name = normalize_member_name(member.name)
+            hashed = path_filter is None or path_filter.keeps(name)
+            digest = None
+            source: str | None = tar_path
+            location = None
+            if spill is not None:
+                source = None
+                if spill.policy.keeps(name, member):
+                    # The payload is hashed while it is copied, it is read only once
+                    copied = new_digest(algorithm) if hashed else None
+                    location = spill.add(name, member, tar.extractfile(member), copied)
+                    source = spill.path
+                    digest = None if copied is None else copied.digest()
+            if index is not None:
+                add_member(index, member, source, location)
+            if not hashed:
+                continue
+            if member.islnk():
+                digest = digests.get(normalize_member_name(member.linkname))
+            elif member.isfile():
+                if digest is None:
+                    digest = hash_stream(tar.extractfile(member), buffer, algorithm)
+                digests[name] = digest
+            else:
+                continue
+            if digest is not None:
+                manifest["hash"].append(digest)
+                manifest["path"].append(name)
+
+
+def _hash_tar_members_parallel(
+    tar_path: str,
+    manifest: dict[str, list],
+    block_size: int,
+    jobs: int,
+    index: dict[str, list] | None,
+    path_filter: PathFilter | None = None,
+    algorithm: str = DEFAULT_HASH_ALGORITHM,
+) -> None:
+    """
+    Hash every regular file of a tar archive using a pool of worker threads.
+
+    Args:
+        tar_path (str): Path to the tar archive with the exported filesystem
+        manifest (dict[str, list]): Hash and path lists the results are appended to
+        block_size (int): Number of bytes read from the archive at once
+        jobs (int): Number of worker threads
+        index (dict[str, list] | None): Member index filled with every member
+        path_filter (PathFilter | None): Files that are hashed
+        algorithm (str): One of `manifest.HashAlgorithm`
+
+    The main thread only walks the tar headers, the payloads are read and hashed
+    by the workers (hashlib releases the GIL for large buffers). The number of
+    queued members is bounded, and results are collected in archive order so the
+    manifest is identical to the one produced by the serial mode.
+    """
+    pending: deque[tuple[str, Future[bytes]]] = deque()
+    max_pending = jobs * PENDING_MEMBERS_PER_JOB
+    buffer = memoryview(bytearray(block_size))
+    digests: dict[str, Future[bytes]] = {}
+
+    def collect(name: str, digest: Future[bytes]) -> None:
+        manifest["hash"].append(digest.result())
+        manifest["path"].append(name)
+
+    fd = os.open(tar_path, os.O_RDONLY)
+    try:
+        with (
+            tarfile.open(tar_path, mode="r:") as tar,
+            ThreadPoolExecutor(max_workers=jobs) as pool,
+        ):
+            for member in tar:
+                if index is not None:
+                    add_member(index, member, tar_path)
+                name = normalize_member_name(member.name)
+                if path_filter is not None and not path_filter.keeps(name):
+                    continue
+                if member.islnk():
+                    target = digests.get(normalize_member_name(member.linkname))
+                    if target is not None:
+                        pending.append((name, target))
+                    continue
+                if not member.isfile():
+                    continue
+                if member.issparse():
+                    # Sparse payloads are not contiguous, let tarfile reassemble them
+                    digest = Future()
+                    digest.set_result(
+                        hash_stream(tar.extractfile(member), buffer, algorithm)
+                    )
+                else:
+                    digest = pool.submit(
+                        _hash_range,
+                        fd,
+                        member.offset_data,
+                        member.size,
+                        block_size,
+                        algorithm,
+                    )
+                digests[name] = digest
+                pending.append((name, digest))
+                while len(pending) >= max_pending:
+                    collect(*pending.popleft())
+            while pending:
+                collect(*pending.popleft())
+    finally:
+        os.close(fd)
+
+
+def hash_tar_members(
+    tar_path: str,
+    output_path: str,
+    block_size: int = HASH_BLOCK_SIZE,
+    jobs: int = 1,
+    index_path: str | None = None,
+    path_filter: PathFilter | None = None,
+    algorithm: str = DEFAULT_HASH_ALGORITHM,
+) -> int:
+    """
+    Hash every regular file of a tar archive in a single streaming pass.
+
+    Args:
+        tar_path (str): Path to the tar archive with the exported filesystem
+        output_path (str): Path of the manifest that should be written
+        block_size (int): Number of bytes read from the archive at once
+        jobs (int): Number of worker threads used for hashing, 1 hashes serially
+        index_path (str | None): Where to write the member index of the archive
+        path_filter (PathFilter | None): Files that are hashed, the others are
+            skipped from their tar header without reading their payload
+        algorithm (str): One of `manifest.HashAlgorithm`, recorded in the manifest
+
+    Returns:
+        int: Number of files that were hashed
+
+    The archive is read sequentially and member payloads are hashed in memory,
+    nothing is unpacked to disk. Hard links are listed with the digest of their
+    target, hard links to a skipped file are skipped too. The result is written as a
+    binary manifest (see `manifest.write_manifest`).
+    When `index_path` is given, the offsets of all members are recorded in the
+    same pass so single members can later be read with a seek.
+    """
+    manifest: dict[str, list] = {column: [] for column in MANIFEST_SCHEMA}
+    index = new_member_index() if index_path is not None else None
+    if jobs > 1:
+        _hash_tar_members_parallel(
+            tar_path, manifest, block_size, jobs, index, path_filter, algorithm
+        )
+    else:
+        _hash_tar_members_serial(
+            tar_path,
+            manifest,
+            block_size,
+            index,
+            path_filter=path_filter,
+            algorithm=algorithm,
+        )
+    return _write_results(manifest, output_path, index, index_path, algorithm)
+
+
+def hash_tar_stream(
+    stream,
+    tar_path: str,
+    output_path: str,
+    block_size: int = HASH_BLOCK_SIZE,
+    index_path: str | None = None,
+    path_filter: PathFilter | None = None,
+    algorithm: str = DEFAULT_HASH_ALGORITHM,
+    spill: SpillPolicy | None = None,
+) -> int:
+    """
+    Hash every regular file of a tar archive while it is being produced.
+
+    Args:
+        stream: Binary file-like object yielding the archive, for example a pipe
+        tar_path (str): Path the archive is stored at, recorded in the member index
+        output_path (str): Path of the manifest that should be written
+        block_size (int): Number of bytes read from the stream at once
+        index_path (str | None): Where to write the member index of the archive
+        path_filter (PathFilter | None): Files that are hashed
+        algorithm (str): One of `manifest.HashAlgorithm`, recorded in the manifest
+        spill (SpillPolicy | None): Payloads kept when the archive is not stored,
+            tar_path then receives them instead (see `spill.SpillStore`)
+
+    Returns:
+        int: Number of files that were hashed
+
+    Same as `hash_tar_members` in serial mode, but the payloads are hashed as the
+    bytes arrive instead of once the archive is complete. With a spill policy
+    nothing but the kept payloads is written, whatever the size of the archive.
+    """
+    manifest: dict[str, list] = {column: [] for column in MANIFEST_SCHEMA}
+    index = new_member_index() if index_path is not None else None
+    store = None if spill is None else SpillStore(tar_path, spill, block_size)
+    try:
+        _hash_tar_members_serial(
+            tar_path, manifest, block_size, index, stream, path_filter, algorithm, store
+        )
+    finally:
+        if store is not None:
+            store.close()
+    return _write_results(manifest, output_path, index, index_path, algorithm)
+
+
+def _write_results(
+    manifest: dict[str, list],
+    output_path: str,
+    index: dict[str, list] | None,
+    index_path: str | None,
+    algorithm: str,
+) -> int:
+    write_manifest(
+        pl.DataFrame(manifest, schema=MANIFEST_SCHEMA), output_path, algorithm
+    )
+    if index_path is not None and index is not None:
+        write_member_index(index, index_path)
+    return len(manifest["path"])
@@ -0,0 +1,615 @@
+import hashlib
+import json
+import os
+import posixpath
+import re
+import tarfile
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+import polars as pl
+from .cache import ContentCache
+from .globs import PathFilter
+from .hasher import HASH_BLOCK_SIZE, hash_stream
+from .manifest import DEFAULT_HASH_ALGORITHM, MANIFEST_SCHEMA, write_manifest
+from .member_index import (
+    MEMBER_INDEX_SCHEMA,
+    SPARSE_TYPE,
+    normalize_member_name,
+    open_source,
+    write_member_index,
+)
+
+WHITEOUT_PREFIX = ".wh."
+OPAQUE_WHITEOUT = ".wh..wh..opq"
+WHITEOUT_TYPE = "wh"  # Type recorded for a whiteout, the path is the deleted entry
+OPAQUE_TYPE = "opq"  # Type recorded for an opaque whiteout, the path is the directory
+
+GZIP_MAGIC = b"\x1f\x8b"
+ZSTD_MAGIC = b"\x28\xb5\x2f\xfd"
+
+LAYER_MANIFEST_SCHEMA = {
+    "path": pl.String,
+    "hash": pl.Binary,
+    "type": pl.String,
+    "linkname": pl.String,
+    "header_offset": pl.UInt64,
+    "data_offset": pl.UInt64,
+    "size": pl.UInt64,
+    "mode": pl.UInt32,
+    "uid": pl.UInt32,
+    "gid": pl.UInt32,
+    "mtime": pl.Int64,
+}
+
+# Bump when the content of partial layer manifests changes, older entries are ignored
+LAYER_CACHE_VERSION = 2
+_CONTENT_DIGEST = re.compile(r"sha256:[0-9a-f]{64}")
+
+_DIRECTORY = tarfile.DIRTYPE.decode()
+_HARD_LINK = tarfile.LNKTYPE.decode()
+_REGULAR_FILE = tarfile.REGTYPE.decode()
+STDIN_IMAGE = "-"  # Image name of a flattened filesystem tar read from stdin
+# Members of a `docker save` archive are at most blobs/sha256/<digest> deep, and
+# there are a few per layer, deeper or further members are from a filesystem tar
+ARCHIVE_MAX_DEPTH = 3
+ARCHIVE_SCAN_LIMIT = 4096
+
+
+@dataclass(frozen=True)
+class Layer:
+    """
+    A filesystem layer of an image, stored as a tar archive inside a local file.
+
+    Attributes:
+        digest (str): Digest of the uncompressed layer (diff ID), or of its blob
+        path (str): Path of the file holding the layer
+        offset (int): Offset of the layer tar inside the file
+        size (int): Size of the layer tar in bytes
+        compressed (bool): Whether the layer tar is gzip compressed
+    """
+
+    digest: str
+    path: str
+    offset: int
+    size: int
+    compressed: bool
+
+
+def _is_docker_manifest(manifest: bytes, members: set[str]) -> bool:
+    """
+    Check that a `manifest.json` has the shape written by `docker save`.
+
+    Args:
+        manifest (bytes): Content of the file
+        members (set[str]): Normalized names of the members of the archive
+
+    Returns:
+        bool: True when it is a non-empty list of images whose config and layers are
+            members of the archive
+    """
+    try:
+        images = json.loads(manifest)
+    except ValueError:
+        return False
+    if not isinstance(images, list) or not images:
+        return False
+    for image in images:
+        if not isinstance(image, dict):
+            return False
+        config = image.get("Config")
+        layers = image.get("Layers")
+        if not isinstance(config, str) or not isinstance(layers, list):
+            return False
+        names = [config, *layers]
+        if not all(
+            isinstance(name, str) and normalize_member_name(name) in members
+            for name in names
+        ):
+            return False
+    return True
+
+
+def detect_source(image: str) -> str:
+    """
+    Detect how an image given on the command line should be read.
+
+    Args:
+        image (str): Docker image name, OCI layout directory or tar archive
+
+    Returns:
+        str: "oci" for an OCI image layout directory, "archive" for a `docker save`
+             archive, "rootfs" for a flattened filesystem tar (such as the output of
+             `docker export`), "stream" for such a tar read from stdin (`STDIN_IMAGE`)
+             and "docker" for anything else
+
+    Raises:
+        ValueError: If the file is not an uncompressed tar archive
+
+    Only the leading members of a tar archive are read: a `docker save` archive has
+    a few shallow members, so the scan stops at the first member deeper than
+    `ARCHIVE_MAX_DEPTH` or after `ARCHIVE_SCAN_LIMIT` members. A `manifest.json`
+    only makes it an archive when it lists configs and layers found in the tar.
+    """
+    if image == STDIN_IMAGE:
+        return "stream"
+    if os.path.isdir(image):
+        return "oci"
+    if not os.path.isfile(image):
+        return "docker"
+    members: set[str] = set()
+    manifest = None
+    try:
+        with tarfile.open(image, mode="r:") as tar:
+            for position, member in enumerate(tar):
+                name = normalize_member_name(member.name)
+                if (
+                    position >= ARCHIVE_SCAN_LIMIT
+                    or name.count("/") >= ARCHIVE_MAX_DEPTH
+                ):
+                    return "rootfs"
+                members.add(name)
+                if name == "manifest.json" and member.isfile():
+                    stream = tar.extractfile(member)
+                    manifest = stream.read() if stream is not None else None
+    except tarfile.ReadError as error:
+        raise ValueError(
+            f"{image} is not an uncompressed tar archive ({error}), decompress it "
+            "or pass an image name, an OCI layout or a tar archive"
+        ) from error
+    if manifest is not None and _is_docker_manifest(manifest, members):
+        return "archive"
+    return "rootfs"
+
+
+def _is_compressed(path: str, offset: int) -> bool:
+    """
+    Sniff the compression of a layer tar from its magic bytes.
+
+    Args:
+        path (str): Path of the file holding the layer
+        offset (int): Offset of the layer inside the file
+
+    Returns:
+        bool: True for gzip compressed layers, False for plain tar layers
+    """
+    with open(path, "rb") as layer:
+        layer.seek(offset)
+        magic = layer.read(4)
+    if magic.startswith(ZSTD_MAGIC):
+        raise ValueError(f"zstd compressed layers are not supported: {path}")
+    return magic.startswith(GZIP_MAGIC)
+
+
+def _read_json(path: str) -> dict:
+    with open(path, encoding="utf-8") as file:
+        return json.load(file)
+
+
+def _oci_blob(directory: str, digest: str) -> str:
+    algorithm, encoded = digest.split(":", 1)
+    return os.path.join(directory, "blobs", algorithm, encoded)
+
+
+def _oci_image_manifest(directory: str) -> dict:
+    """
+    Read the manifest of the first image of an OCI image layout directory.
+
+    Args:
+        directory (str): Path of the directory containing `index.json` and `blobs/`
+
+    Returns:
+        dict: The image manifest, listing the config and layer descriptors
+    """
+    manifest = _read_json(os.path.join(directory, "index.json"))
+    # Image indexes can be nested, follow the first manifest down to an image
+    while "manifests" in manifest:
+        manifest = _read_json(_oci_blob(directory, manifest["manifests"][0]["digest"]))
+    return manifest
+
+
+def _read_oci_layout(directory: str) -> list[Layer]:
+    """
+    Read the layers of the first image of an OCI image layout directory.
+
+    Args:
+        directory (str): Path of the directory containing `index.json` and `blobs/`
+
+    Returns:
+        list[Layer]: Layers of the image, from the bottom one to the top one
+    """
+    manifest = _oci_image_manifest(directory)
+    config = _read_json(_oci_blob(directory, manifest["config"]["digest"]))
+    diff_ids = config.get("rootfs", {}).get("diff_ids", [])
+
+    layers = []
+    for position, descriptor in enumerate(manifest["layers"]):
+        path = _oci_blob(directory, descriptor["digest"])
+        digest = (
+            diff_ids[position] if position < len(diff_ids) else descriptor["digest"]
+        )
+        layers.append(
+            Layer(digest, path, 0, os.path.getsize(path), _is_compressed(path, 0))
+        )
+    return layers
+
+
+def _resolve_archive_member(
+    members: dict[str, tarfile.TarInfo], name: str
+) -> tarfile.TarInfo:
+    """
+    Find a member of a `docker save` archive, following symbolic links.
+
+    Args:
+        members (dict[str, tarfile.TarInfo]): Members of the archive by normalized name
+        name (str): Name of the member
+
+    Returns:
+        tarfile.TarInfo: The member holding the content
+    """
+    member = members[normalize_member_name(name)]
+    # Layers shared between images are stored once, the others are symlinks
+    while member.issym():
+        target = posixpath.join(posixpath.dirname(member.name), member.linkname)
+        member = members[normalize_member_name(posixpath.normpath(target))]
+    return member
+
+
+def _read_archive_file(
+    tar: tarfile.TarFile, members: dict[str, tarfile.TarInfo], name: str
+) -> bytes:
+    stream = tar.extractfile(_resolve_archive_member(members, name))
+    if stream is None:
+        raise ValueError(f"{name} is not a file in {tar.name}")
+    return stream.read()
+
+
+def _read_docker_archive(archive: str) -> list[Layer]:
+    """
+    Read the layers of the first image of a `docker save` archive.
+
+    Args:
+        archive (str): Path of the archive containing `manifest.json`
+
+    Returns:
+        list[Layer]: Layers of the image, from the bottom one to the top one
+
+    The layers are not unpacked, each one is addressed as a byte range of the archive.
+    """
+    with tarfile.open(archive, mode="r:") as tar:
+        members = {normalize_member_name(member.name): member for member in tar}
+        manifest = json.loads(_read_archive_file(tar, members, "manifest.json"))[0]
+        config = json.loads(_read_archive_file(tar, members, manifest["Config"]))
+        diff_ids = config.get("rootfs", {}).get("diff_ids", [])
+
+        layers = []
+        for position, name in enumerate(manifest["Layers"]):
+            member = _resolve_archive_member(members, name)
+            digest = diff_ids[position] if position < len(diff_ids) else name
+            compressed = _is_compressed(archive, member.offset_data)
+            layers.append(
+                Layer(digest, archive, member.offset_data, member.size, compressed)
+            )
+    return layers
+
+
+def read_image_digest(image: str, source: str) -> str:
+    """
+    Read the digest of the config of an image stored on the local filesystem.
+
+    Args:
+        image (str): Path of the OCI layout directory or `docker save` archive
+        source (str): "oci" or "archive", see `detect_source`
+
+    Returns:
+        str: The config digest, which is what Docker reports as the image ID
+    """
+    if source == "oci":
+        return _oci_image_manifest(image)["config"]["digest"]
+    if source == "archive":
+        with tarfile.open(image, mode="r:") as tar:
+            members = {normalize_member_name(member.name): member for member in tar}
+            manifest = json.loads(_read_archive_file(tar, members, "manifest.json"))[0]
+            config = _read_archive_file(tar, members, manifest["Config"])
+        return "sha256:" + hashlib.sha256(config).hexdigest()
+    raise ValueError(f"Images of source {source!r} are not stored as layers")
+
+
+def read_image_layers(image: str, source: str) -> list[Layer]:
+    """
+    Read the layers of an image stored on the local filesystem.
+
+    Args:
+        image (str): Path of the OCI layout directory or `docker save` archive
+        source (str): "oci" or "archive", see `detect_source`
+
+    Returns:
+        list[Layer]: Layers of the image, from the bottom one to the top one
+    """
+    if source == "oci":
+        return _read_oci_layout(image)
+    if source == "archive":
+        return _read_docker_archive(image)
+    raise ValueError(f"Images of source {source!r} are not stored as layers")
+
+
+def hash_layer(
+    layer: Layer,
+    block_size: int = HASH_BLOCK_SIZE,
+    path_filter: PathFilter | None = None,
+    algorithm: str = DEFAULT_HASH_ALGORITHM,
+) -> pl.DataFrame:
+    """
+    Hash every regular file of a layer and record its whiteouts.
+
+    Args:
+        layer (Layer): Layer to read
+        block_size (int): Number of bytes read from the layer at once
+        path_filter (PathFilter | None): Files that are hashed, the others are
+            recorded as regular files without a hash and their payload is skipped
+        algorithm (str): One of `manifest.HashAlgorithm`
+
+    Returns:
+        pl.DataFrame: A partial manifest with the columns of `LAYER_MANIFEST_SCHEMA`.
+            Whiteouts are recorded with the type `WHITEOUT_TYPE` or `OPAQUE_TYPE` and
+            the path of the entry they hide. Hard links to a file of the same layer
+            are recorded as regular files pointing at the payload of their target.
+    """
+    rows: dict[str, list] = {column: [] for column in LAYER_MANIFEST_SCHEMA}
+    files: dict[str, tuple] = {}
+    buffer = memoryview(bytearray(block_size))
+
+    with (
+        open_source(layer.path, layer.offset, layer.size) as stream,
+        tarfile.open(fileobj=stream, mode="r|*", bufsize=block_size) as tar,
+    ):
+        for member in tar:
+            name = normalize_member_name(member.name)
+            if not name or name == ".":
+                continue
+            parent, base = posixpath.split(name)
+            digest = None
+            location = (
+                member.offset,
+                member.offset_data,
+                member.size,
+                member.mode,
+                member.uid,
+                member.gid,
+                int(member.mtime),
+            )
+            linkname = member.linkname
+            if base == OPAQUE_WHITEOUT:
+                name, kind = parent, OPAQUE_TYPE
+            elif base.startswith(WHITEOUT_PREFIX):
+                name = posixpath.join(parent, base[len(WHITEOUT_PREFIX) :])
+                kind = WHITEOUT_TYPE
+            elif (member.isfile() or member.islnk()) and (
+                path_filter is not None and not path_filter.keeps(name)
+            ):
+                # Skipped files still hide the lower ones, without taking a payload
+                kind = _REGULAR_FILE
+            elif member.islnk():
+                linkname = normalize_member_name(linkname)
+                kind = _HARD_LINK
+                if linkname in files:
+                    digest, *target_location = files[linkname]
+                    location = tuple(target_location)
+                    kind = _REGULAR_FILE
+            elif member.isfile():
+                digest = hash_stream(tar.extractfile(member), buffer, algorithm)
+                files[name] = (digest, *location)
+                kind = SPARSE_TYPE if member.issparse() else _REGULAR_FILE
+            else:
+                kind = member.type.decode("ascii")
+            rows["path"].append(name)
+            rows["hash"].append(digest)
+            rows["type"].append(kind)
+            rows["linkname"].append(linkname)
+            rows["header_offset"].append(location[0])
+            rows["data_offset"].append(location[1])
+            rows["size"].append(location[2])
+            rows["mode"].append(location[3])
+            rows["uid"].append(location[4])
+            rows["gid"].append(location[5])
+            rows["mtime"].append(location[6])
+    return pl.DataFrame(rows, schema=LAYER_MANIFEST_SCHEMA)
+
+
+def load_layer_manifest(
+    layer: Layer,
+    layer_cache: ContentCache | None = None,
+    block_size: int = HASH_BLOCK_SIZE,
+    path_filter: PathFilter | None = None,
+    algorithm: str = DEFAULT_HASH_ALGORITHM,
+) -> pl.DataFrame:
+    """
+    Get the partial manifest of a layer, hashing it only if it is not cached yet.
+
+    Args:
+        layer (Layer): Layer to read
+        layer_cache (ContentCache | None): Cache of partial manifests keyed by layer
+            digest, None to always hash the layer
+        block_size (int): Number of bytes read from the layer at once
+        path_filter (PathFilter | None): Files that are hashed, see `hash_layer`
+        algorithm (str): One of `manifest.HashAlgorithm`
+
+    Returns:
+        pl.DataFrame: The partial manifest returned by `hash_layer`
+
+    Offsets in a partial manifest are relative to the layer tar, so the same entry
+    is valid for every image sharing the layer. Layers without a content digest
+    (such as `docker save` archives lacking diff IDs) are never cached. Manifests
+    of filtered layers are cached under the fingerprint of the filter, and those
+    hashed with another algorithm than SHA256 under the name of the algorithm.
+    """
+    if layer_cache is None or not _CONTENT_DIGEST.fullmatch(layer.digest):
+        return hash_layer(layer, block_size, path_filter, algorithm)
+    key = f"layer-v{LAYER_CACHE_VERSION}-{layer.digest}"
+    if path_filter is not None:
+        key += f"-{path_filter.fingerprint}"
+    if algorithm != DEFAULT_HASH_ALGORITHM:
+        key += f"-{algorithm}"
+    partial = layer_cache.load(key, pl.read_parquet)
+    if partial is None:
+        partial = hash_layer(layer, block_size, path_filter, algorithm)
+        layer_cache.store(key, lambda path: partial.write_parquet(path))
+    return partial
+
+
+def _is_hidden(path: str, hidden_trees: set[str]) -> bool:
+    """
+    Check whether a path lies inside one of the hidden directory trees.
+
+    Args:
+        path (str): Path of the entry
+        hidden_trees (set[str]): Directories whose content is hidden
+
+    Returns:
+        bool: True if one of the ancestors of path is in hidden_trees
+    """
+    separator = path.rfind("/")
+    while separator > 0:
+        path = path[:separator]
+        if path in hidden_trees:
+            return True
+        separator = path.rfind("/")
+    return False
+
+
+def merge_layers(
+    layers: list[tuple[Layer, pl.DataFrame]],
+) -> tuple[pl.DataFrame, pl.DataFrame]:
+    """
+    Apply partial layer manifests in order to build the manifest of the image.
+
+    Args:
+        layers (list[tuple[Layer, pl.DataFrame]]): Layers from the bottom one to the
+            top one, each with the partial manifest returned by `hash_layer`
+
+    Returns:
+        tuple containing:
+            - manifest (pl.DataFrame): Manifest of the final filesystem
+            - index (pl.DataFrame): Member index of the final filesystem, pointing
+              every entry at the layer its content comes from
+
+    The merge follows the OCI whiteout rules: `.wh.<name>` deletes an entry of the
+    lower layers together with its children, `.wh..wh..opq` hides all lower
+    children of its directory, and a non-directory hides a lower directory tree.
+    """
+    state: dict[str, tuple] = {}
+    for layer, partial in layers:
+        rows = partial.rows()
+        hidden_entries: set[str] = set()
+        hidden_trees: set[str] = set()
+        for path, _, kind, *_ in rows:
+            lower = state.get(path)
+            if kind == OPAQUE_TYPE:
+                hidden_trees.add(path)
+            elif kind == WHITEOUT_TYPE:
+                hidden_entries.add(path)
+                hidden_trees.add(path)
+            elif kind != _DIRECTORY and lower is not None and lower[2] == _DIRECTORY:
+                hidden_trees.add(path)
+        if hidden_trees:
+            state = {
+                path: entry
+                for path, entry in state.items()
+                if path not in hidden_entries and not _is_hidden(path, hidden_trees)
+            }
+        else:
+            for path in hidden_entries:
+                state.pop(path, None)
+
+        for row in rows:
+            path, digest, kind, linkname = row[:4]
+            if kind in (WHITEOUT_TYPE, OPAQUE_TYPE):
+                continue
+            if kind == _HARD_LINK and linkname in state:
+                # Hard link to a file of a lower layer, take over its payload
+                target = state[linkname]
+                state[path] = (path, target[1], target[2], linkname, *target[4:])
+                continue
+            state[path] = row + (layer,)
+
+    manifest: dict[str, list] = {column: [] for column in MANIFEST_SCHEMA}
+    index: dict[str, list] = {column: [] for column in MEMBER_INDEX_SCHEMA}
+    for (
+        path,
+        digest,
+        kind,
+        linkname,
+        header_offset,
+        data_offset,
+        size,
+        mode,
+        uid,
+        gid,
+        mtime,
+        layer,
+    ) in state.values():
+        if digest is not None:
+            manifest["hash"].append(digest)
+            manifest["path"].append(path)
+        index["path"].append(path)
+        index["header_offset"].append(header_offset)
+        index["data_offset"].append(data_offset)
+        index["size"].append(size)
+        index["type"].append(kind)
+        index["linkname"].append(linkname)
+        index["source"].append(layer.path)
+        index["source_offset"].append(layer.offset)
+        index["source_size"].append(layer.size)
+        index["compressed"].append(layer.compressed)
+        index["mode"].append(mode)
+        index["uid"].append(uid)
+        index["gid"].append(gid)
+        index["mtime"].append(mtime)
+    return (
+        pl.DataFrame(manifest, schema=MANIFEST_SCHEMA),
+        pl.DataFrame(index, schema=MEMBER_INDEX_SCHEMA),
+    )
+
+
+def build_layered_manifest(
+    image: str,
+    source: str,
+    manifest_path: str,
+    index_path: str,
+    block_size: int = HASH_BLOCK_SIZE,
+    jobs: int = 1,
+    layer_cache: ContentCache | None = None,
+    path_filter: PathFilter | None = None,
+    algorithm: str = DEFAULT_HASH_ALGORITHM,
+) -> int:
+    """
+    Build the manifest and member index of an image stored as layers.
+
+    Args:
+        image (str): Path of the OCI layout directory or `docker save` archive
+        source (str): "oci" or "archive", see `detect_source`
+        manifest_path (str): Path of the manifest that should be written
+        index_path (str): Path of the member index that should be written
+        block_size (int): Number of bytes read from the layers at once
+        jobs (int): Number of layers hashed concurrently
+        layer_cache (ContentCache | None): Cache of partial layer manifests, see
+            `load_layer_manifest`
+        path_filter (PathFilter | None): Files that are hashed, see `hash_layer`
+        algorithm (str): One of `manifest.HashAlgorithm`, recorded in the manifest
+
+    Returns:
+        int: Number of files in the final filesystem
+    """
+    layers = read_image_layers(image, source)
+    with ThreadPoolExecutor(max_workers=jobs) as executor:
+        partials = list(
+            executor.map(
+                lambda layer: load_layer_manifest(
+                    layer, layer_cache, block_size, path_filter, algorithm
+                ),
+                layers,
+            )
+        )
+    manifest, index = merge_layers(list(zip(layers, partials)))
+    write_manifest(manifest, manifest_path, algorithm)
+    write_member_index(index, index_path)
+    return len(manifest)
@@ -1,49 +1,336 @@
-
 """
 Container-Diffoscope: Docker Filesystem Comparison Tool
 
 For detailed documentation, see: source_code/docs.md
 """
 
+import asyncio
+import json
 import os
+import sys
+import tempfile
 import polars as pl
 import atexit
 import shutil
 import typer
-from .extractor import export_filesystem_from_image, extract_file_from_tar, get_hash_file_list
-from .diffoscope_runner import get_detailed_file_comparison
-from .comparator import compare_file_lists, load_list_to_dataframe
+from collections import Counter
+from contextlib import ExitStack
+from dataclasses import dataclass
+from .cache import ContentCache, default_cache_dir, format_size, parse_size
+from .chunking import (
+    CHUNK_MODE,
+    DEFAULT_CHUNK_THRESHOLD,
+    comparison_mode,
+    get_chunk_comparison,
+)
+from .extractor import (
+    INDEX_FILE,
+    MANIFEST_FILE,
+    ImageSource,
+    find_missing_payloads,
+    load_excluded_count,
+    load_tree,
+    open_image,
+)
+from .diffoscope_runner import (
+    DIFF_OK,
+    DIFF_SKIPPED,
+    DiffResult,
+    comparison_labels,
+    get_detailed_file_comparison,
+    write_diff_report,
+)
+from .diff_cache import (
+    fan_out,
+    group_changed_files,
+    restore_cached_diff,
+    store_diff,
+)
+from .comparator import (
+    build_merkle_tree,
+    changed_directories,
+    compare_manifest_trees,
+    compare_sorted_manifests,
+    is_sorted_manifest,
+    scan_category,
+    summarize_by_directory,
+)
+from .globs import PathFilter, build_path_filter
+from .layers import STDIN_IMAGE, detect_source
+from .manifest import (
+    DEFAULT_HASH_ALGORITHM,
+    HashAlgorithm,
+    check_hash_algorithms,
+    load_hash_algorithm,
+    load_manifest,
+    write_manifest,
+)
+from .member_index import load_member_index
+from .pipeline import diff_changed_files
+from .profiling import StageTimes
+from .report import DEFAULT_REPORT_FORMAT, REPORT_DIR, ReportFormat, write_report
+from .quick import (
+    QuickComparison,
+    compare_metadata,
+    find_metadata_changes,
+    quick_compare,
+)
+from .server import (
+    DEFAULT_MAX_JOBS,
+    DEFAULT_MAX_QUEUED,
+    DEFAULT_SERVE_PORT,
+    DEFAULT_WARM_CACHE_SIZE,
+    ComparisonService,
+    WarmCache,
+    make_server,
+    request_daemon,
+)
+from .series import HISTORY_FILE, build_history, series_pairs
+from .spill import DEFAULT_SPILL_MAX_SIZE, PAYLOAD_NOT_KEPT, SpillPolicy
+from .scheduler import (
+    DEFAULT_PRIORITY_GLOBS,
+    DiffBudget,
+    apply_byte_budget,
+    parse_budget,
+    rank_changed_files,
+)
 
 NEW_FILE_PRINT_THRESHOLD = 20  # Number of files that can be different between the images and the list will be printed
-UPDATED_FILE_TRESHOLD = 15
+DIRECTORY_PRINT_LIMIT = 10  # Number of directories with the most changes printed
+
+IMAGE_STORE_DIR = "images"  # Manifests and member indexes of images, by image ID
+LAYER_CACHE_DIR = "layers"  # Partial manifests of layers, by layer digest
+DIFF_CACHE_DIR = "diffs"  # Detailed comparisons, by pair of file digests
+DEFAULT_CACHE_SIZE = "10G"
+DEFAULT_LAYER_CACHE_SIZE = "2G"
+DEFAULT_DIFF_CACHE_SIZE = "1G"
+
+DEFAULT_DIFF_TIMEOUT = 300.0  # Seconds a single diffoscope run may take
+
+
+@dataclass(frozen=True)
+class DiffOptions:
+    """
+    How the detailed comparisons of changed files are run.
+
+    Attributes:
+        jobs (int): Number of diffoscope processes running at the same time
+        timeout (float | None): Seconds after which a single diffoscope run is killed
+        budget (DiffBudget): Time and bytes all the comparisons may take together
+        cache (ContentCache | None): Comparisons kept between runs, see `diff_cache`
+        priority_globs (tuple[str, ...]): Paths compared first when the budget does
+            not allow comparing every file, see `scheduler.rank_changed_files`
+        chunk_threshold (int | None): Size from which files are compared chunk by
+            chunk instead of with diffoscope, see `chunking.get_chunk_comparison`
+    """
+
+    jobs: int = 1
+    timeout: float | None = DEFAULT_DIFF_TIMEOUT
+    budget: DiffBudget = DiffBudget()
+    cache: ContentCache | None = None
+    priority_globs: tuple[str, ...] = DEFAULT_PRIORITY_GLOBS
+    chunk_threshold: int | None = parse_size(DEFAULT_CHUNK_THRESHOLD)
+
 
 app = typer.Typer()
+cache_app = typer.Typer(help="Inspect and clean the persistent cache.")
+app.add_typer(cache_app, name="cache")
 
 
-def _analyze_changed_files(
-    changed_files: pl.DataFrame, image_1: str, image_2: str, export_dir: str
-) -> None:
+def _open_optional_cache(cache_dir: str, name: str, size: str) -> ContentCache | None:
+    max_bytes = parse_size(size)
+    return ContentCache(os.path.join(cache_dir, name), max_bytes) if max_bytes else None
+
+
+def open_caches(
+    cache_dir: str,
+    cache_size: str,
+    layer_cache_size: str,
+    diff_cache_size: str = DEFAULT_DIFF_CACHE_SIZE,
+) -> tuple[ContentCache, ContentCache | None, ContentCache | None]:
+    """
+    Open the persistent caches stored in cache_dir.
+
+    Args:
+        cache_dir (str): Root directory of the caches
+        cache_size (str): Maximum size of the image store, see `cache.parse_size`
+        layer_cache_size (str): Maximum size of the layer cache, "0" disables it
+        diff_cache_size (str): Maximum size of the diff cache, "0" disables it
+
+    Returns:
+        tuple containing:
+            - store (ContentCache): Image store, see `extractor.open_image`
+            - layer_cache (ContentCache | None): Layer cache, see
+              `layers.load_layer_manifest`
+            - diff_cache (ContentCache | None): Diff cache, see `diff_cache`
+    """
+    store = ContentCache(
+        os.path.join(cache_dir, IMAGE_STORE_DIR), parse_size(cache_size)
+    )
+    layer_cache = _open_optional_cache(cache_dir, LAYER_CACHE_DIR, layer_cache_size)
+    diff_cache = _open_optional_cache(cache_dir, DIFF_CACHE_DIR, diff_cache_size)
+    return store, layer_cache, diff_cache
+
+
+async def _analyze_changed_files(
+    changed_files: pl.DataFrame,
+    entry_1: str,
+    entry_2: str,
+    export_dir: str,
+    scratch_dir: str,
+    times: StageTimes,
+    options: DiffOptions,
+) -> list[DiffResult]:
     """
     Generate detailed comparisons for all files that are different between two Docker images.
 
     Args:
         changed_files (pl.DataFrame): DataFrame containing files that are different between the two images
-        image_1 (str): Name of the first Docker image
-        image_2 (str): Name of the second Docker image
+        entry_1 (str): Store entry of the first image, see `extractor.open_image`
+        entry_2 (str): Store entry of the second image, see `extractor.open_image`
         export_dir (str): Directory where the comparison files will be saved
+        scratch_dir (str): Temporary directory the changed files are extracted into
+        times (StageTimes): Timings of the comparison stages
+        options (DiffOptions): Concurrency, timeout and budget of the comparisons
+
+    Returns:
+        list[DiffResult]: One result per changed file, see `report.diff_index`
 
     For each changed file pair, they are extracted from .tar files and compared using diffoscope tool.
+    Files are compared in priority order (matching priority_globs, then the cheapest
+    first) until the budget is exhausted, the others are reported as skipped.
+    Files of chunk_threshold bytes or more are compared chunk by chunk, which only
+    locates the changed byte ranges but does not load them in memory.
+    Files with the same pair of digests are compared once and the comparisons found in
+    the diff cache are copied instead of being run again, neither is extracted.
+    Files of images hashed from a stream whose content was not kept are skipped.
+    Changed files are extracted in batches using the member index of each image, and
+    diffoscope starts on a batch while the next one is being extracted. Comparisons that
+    fail, time out or are skipped are listed in the report next to the successful ones.
     """
-    for row in changed_files.iter_rows(named=True):
-        path = row["path"]
+    paths = changed_files["path"].to_list()
+    sizes = pl.concat(
+        load_member_index(os.path.join(entry, INDEX_FILE), paths)
+        .unique("path", keep="last")
+        .select("path", "size")
+        for entry in (entry_1, entry_2)
+    )
+    ranked = rank_changed_files(changed_files, sizes, options.priority_globs)
+    costs = dict(zip(ranked["path"].to_list(), ranked["cost"].to_list()))
+    groups = group_changed_files(ranked)
+    missing = find_missing_payloads(entry_1, paths) | find_missing_payloads(
+        entry_2, paths
+    )
+    results: list[DiffResult] = []
+    pending = []
+    not_kept = []
+    for group in groups:
+        result = (
+            restore_cached_diff(
+                options.cache, group, export_dir, options.chunk_threshold
+            )
+            if options.cache is not None
+            else None
+        )
+        if result is not None:
+            results.extend(fan_out(result, group, export_dir))
+        elif group.path in missing:
+            not_kept.append(
+                DiffResult(group.path, DIFF_SKIPPED, message=PAYLOAD_NOT_KEPT)
+            )
+        else:
+            pending.append(group)
+    scheduled, skipped = apply_byte_budget(pending, costs, options.budget.bytes)
+    by_path = {group.path: group for group in groups}
+    # How each file was compared and the size of its larger copy, for the cache
+    modes: dict[str, tuple[str, int]] = {}
+    diffed = await diff_changed_files(
+        [group.path for group in scheduled],
+        entry_1,
+        entry_2,
+        scratch_dir,
+        lambda path, file_path_1, file_path_2, timeout: _compare_file(
+            path, file_path_1, file_path_2, export_dir, timeout, options, modes
+        ),
+        times,
+        options.jobs,
+        options.timeout,
+        options.budget.seconds,
+    )
+    for result in diffed + skipped + not_kept:
+        group = by_path[result.path]
+        if options.cache is not None and result.path in modes:
+            store_diff(options.cache, group, result, *modes[result.path])
+        results.extend(fan_out(result, group, export_dir))
+    times.count("diff", **Counter(result.status for result in results))
+    report_path = write_diff_report(results, export_dir)
+    if options.cache is not None:
+        print(
+            f"\nDiff cache: {options.cache.hits} hits, {options.cache.misses} misses",
+            flush=True,
+        )
+    if len(groups) < len(changed_files):
+        print(
+            f"{len(changed_files) - len(groups)} changed files share the changes of "
+            "others and were not compared again",
+            flush=True,
+        )
+    _print_incomplete(results)
+    print(f"\nDetailed comparison report: {report_path}", flush=True)
+    return results
+
 
-        extract_file_from_tar(path, image_1)
-        extract_file_from_tar(path, image_2)
+def _compare_file(
+    path: str,
+    file_path_1: str,
+    file_path_2: str,
+    export_dir: str,
+    timeout: float | None,
+    options: DiffOptions,
+    modes: dict[str, tuple[str, int]],
+) -> DiffResult:
+    files = (file_path_1, file_path_2)
+    size = (
+        max(os.path.getsize(file) for file in files)
+        if all(os.path.isfile(file) for file in files)
+        else 0
+    )
+    mode = comparison_mode(size, options.chunk_threshold)
+    modes[path] = (mode, size)
+    labels = comparison_labels(path)
+    if mode == CHUNK_MODE:
+        return get_chunk_comparison(
+            file_path_1, file_path_2, export_dir, path, timeout, labels
+        )
+    return get_detailed_file_comparison(
+        file_path_1, file_path_2, export_dir, path, timeout, labels
+    )
 
-        file_path_1 = f"cache/{image_1}/{path}"
-        file_path_2 = f"cache/{image_2}/{path}"
 
-        get_detailed_file_comparison(file_path_1, file_path_2, export_dir)
+def _print_incomplete(results: list[DiffResult]) -> None:
+    """
+    Print the comparisons that failed or timed out and why the others were skipped.
+
+    Args:
+        results (list[DiffResult]): Results of the changed files
+    """
+    failed = [
+        result for result in results if result.status not in (DIFF_OK, DIFF_SKIPPED)
+    ]
+    if failed:
+        print(f"\n⚠️ {len(failed)} detailed comparisons did not complete:", flush=True)
+        for result in failed:
+            print(f"  {result.path}: {result.status} {result.message}", flush=True)
+    reasons = Counter(
+        result.message for result in results if result.status == DIFF_SKIPPED
+    )
+    if reasons:
+        print(
+            f"\n⏭️ {sum(reasons.values())} detailed comparisons were skipped:",
+            flush=True,
+        )
+        for reason, count in reasons.most_common():
+            print(f"  {reason}: {count}", flush=True)
 
 
 def __cleanup_cache(cache_dir: str) -> None:
@@ -54,82 +341,1316 @@ def __cleanup_cache(cache_dir: str) -> None:
         cache_dir (str): Path to the cache directory to be removed
 
     This function is registered as an exit handler to ensure cleanup
-    of temporary files after the program finishes or crashes.
+    of the extracted files after the program finishes or crashes.
     """
     if os.path.exists(cache_dir):
         shutil.rmtree(cache_dir, ignore_errors=True)
 
 
-def compare_filesystem(image_1: str, image_2: str, export_dir: str) -> None:
+def compare_filesystem(
+    image_1: str,
+    image_2: str,
+    export_dir: str,
+    jobs: int = 1,
+    source: str = "auto",
+    store: ContentCache | None = None,
+    layer_cache: ContentCache | None = None,
+    diff_options: DiffOptions = DiffOptions(),
+    memory_limit: int | None = None,
+    path_filter: PathFilter | None = None,
+    quick: bool = False,
+    algorithm: str = DEFAULT_HASH_ALGORITHM,
+    spill: SpillPolicy | None = None,
+    times: StageTimes | None = None,
+    report_format: str = DEFAULT_REPORT_FORMAT,
+) -> None:
     """
     Compare filesystems of two Docker images and generate detailed comparisons of differences.
 
     Args:
-        image_1 (str): Name of the first Docker image to compare
-        image_2 (str): Name of the second Docker image to compare
+        image_1 (str): Name of the first Docker image to compare (or its OCI layout /
+            tar archive)
+        image_2 (str): Name of the second Docker image to compare (or its OCI layout /
+            tar archive)
         export_dir (str): Directory where detailed file comparisons will be saved
+        jobs (int): Number of threads used to hash the files of each image
+        source (str): How the images are read, one of `ImageSource`
+        store (ContentCache | None): Image store kept between runs, defaults to the one
+            in `cache.default_cache_dir`
+        layer_cache (ContentCache | None): Cache of partial layer manifests shared by
+            runs
+        diff_options (DiffOptions): Concurrency, timeout and budget of diffoscope
+        memory_limit (int | None): Memory the comparison of the manifests may use,
+            they are merged from disk instead of being loaded when it is set
+        path_filter (PathFilter | None): Files that are hashed and compared, the
+            others are skipped from their tar header
+        quick (bool): Compare the tar headers and only hash the files whose headers
+            are ambiguous, without detailed comparisons, see `quick.quick_compare`
+        algorithm (str): Hash of the file contents, one of `manifest.HashAlgorithm`
+        spill (SpillPolicy | None): Hash Docker exports from the pipe, only keeping
+            the payloads that may be compared in detail, see `extractor.ingest_image`
+        times (StageTimes | None): Timings the stages are recorded in, profiling
+            them when it was created with profile, a new one when None
+        report_format (str): Format of the lists of files of each category and of
+            the index of the detailed comparisons, one of `report.ReportFormat`
 
     The function performs the following steps:
-    1. Exports filesystems from both images as a tar archive
-    2. Generates the list of files with their SHA256 hashes
+    1. Exports filesystems from both images as a tar archive (layered images are
+       read in place)
+    2. Generates the manifest of files with their hashes (cached layers are not
+       hashed again)
     3. Find files that are identical, changed, or unique to each image
     4. Generates detailed comparisons for changed files
-    5. Cleans up temporary files
+    5. Writes the lists of files and the index of the comparisons to `report.REPORT_DIR`
+    6. Cleans up the extracted files
+
+    Steps 1 and 2 are skipped for images already in the store. Both images go
+    through steps 1 and 2 at the same time, Docker exports are hashed while they
+    stream, and step 4 diffs files while the next ones are being extracted. The
+    wall-clock time of every stage is printed at the end.
     """
-    cache_dir = "cache"
-    atexit.register(__cleanup_cache, cache_dir)
+    if store is None:
+        store, layer_cache, _ = open_caches(
+            default_cache_dir(), DEFAULT_CACHE_SIZE, DEFAULT_LAYER_CACHE_SIZE
+        )
+    asyncio.run(
+        _compare_filesystem(
+            image_1,
+            image_2,
+            export_dir,
+            jobs,
+            source,
+            store,
+            layer_cache,
+            diff_options,
+            memory_limit,
+            path_filter,
+            quick,
+            algorithm,
+            spill,
+            times or StageTimes(),
+            report_format,
+        )
+    )
 
-    export_filesystem_from_image(image_1)
-    export_filesystem_from_image(image_2)
 
-    get_hash_file_list(image_1)
-    get_hash_file_list(image_2)
+async def _compare_filesystem(
+    image_1: str,
+    image_2: str,
+    export_dir: str,
+    jobs: int,
+    source: str,
+    store: ContentCache,
+    layer_cache: ContentCache | None,
+    diff_options: DiffOptions,
+    memory_limit: int | None,
+    path_filter: PathFilter | None,
+    quick: bool,
+    algorithm: str,
+    spill: SpillPolicy | None,
+    times: StageTimes,
+    report_format: str,
+) -> None:
+    scratch_dir = tempfile.mkdtemp(prefix="container-diffoscope-")
+    atexit.register(__cleanup_cache, scratch_dir)
 
-    df1 = load_list_to_dataframe(f"cache/{image_1}_list.txt")
-    df2 = load_list_to_dataframe(f"cache/{image_2}_list.txt")
+    with ExitStack() as stack:
 
-    common_rows, changed_files, only_in_df1, only_in_df2 = compare_file_lists(df1, df2)
+        def ingest(image: str) -> str:
+            # Each entry is pinned as soon as it is stored, so storing the second
+            # image cannot evict the first one
+            return stack.enter_context(
+                open_image(
+                    image,
+                    store,
+                    source,
+                    jobs,
+                    layer_cache,
+                    path_filter,
+                    quick,
+                    algorithm,
+                    spill,
+                    times,
+                )
+            )
 
+        entry_1, entry_2 = await asyncio.gather(
+            *(
+                times.run(f"ingest {image}", ingest, image)
+                for image in (image_1, image_2)
+            )
+        )
+        if quick:
+            comparison = await times.run(
+                "compare",
+                quick_compare,
+                os.path.join(entry_1, INDEX_FILE),
+                os.path.join(entry_2, INDEX_FILE),
+                scratch_dir,
+                path_filter,
+                algorithm,
+            )
+            _print_quick_comparison(image_1, image_2, entry_1, entry_2, comparison)
+            report_dir = await times.run(
+                "report",
+                write_report,
+                {
+                    "changed": comparison.changed,
+                    "only_in_1": comparison.only_in_1,
+                    "only_in_2": comparison.only_in_2,
+                    "metadata": comparison.metadata_changes,
+                },
+                None,
+                export_dir,
+                report_format,
+            )
+            print(f"Lists of files: {report_dir}", flush=True)
+        else:
+            await _compare_entries(
+                image_1,
+                image_2,
+                entry_1,
+                entry_2,
+                export_dir,
+                scratch_dir,
+                times,
+                diff_options,
+                memory_limit,
+                report_format,
+            )
+
+    print("\n=== Stage Timings ===", flush=True)
+    print(times.report(), flush=True)
+
+
+def _sorted_manifest(entry: str, scratch_dir: str) -> str:
+    """
+    Path of the manifest of an entry sorted by path, sorting a copy when needed.
+
+    Args:
+        entry (str): Store entry of the image
+        scratch_dir (str): Temporary directory that receives the sorted copy
+
+    Returns:
+        str: The manifest of the entry, or its sorted copy for entries stored before
+             manifests were sorted (sorting the copy is not bounded in memory)
+    """
+    path = os.path.join(entry, MANIFEST_FILE)
+    if is_sorted_manifest(path):
+        return path
+    copy = os.path.join(scratch_dir, f"{os.path.basename(entry)}-{MANIFEST_FILE}")
+    write_manifest(load_manifest(path), copy, load_hash_algorithm(path))
+    return copy
+
+
+def _load_and_compare(
+    entry_1: str,
+    entry_2: str,
+    scratch_dir: str,
+    memory_limit: int | None,
+    times: StageTimes,
+) -> tuple[pl.LazyFrame, pl.DataFrame, pl.DataFrame, pl.DataFrame]:
+    """
+    Compare the manifests of two store entries.
+
+    Args:
+        entry_1 (str): Store entry of the first image
+        entry_2 (str): Store entry of the second image
+        scratch_dir (str): Temporary directory of the comparison
+        memory_limit (int | None): Memory the comparison may use, None to load both
+            manifests in memory
+        times (StageTimes): Timings the "load" and "join" stages are added to
+
+    Returns:
+        tuple: The categories of `comparator.compare_file_lists`, with the common
+            files (the largest category) left lazy
+
+    Raises:
+        ValueError: If the entries were hashed with different algorithms, see
+            `manifest.check_hash_algorithms`
+    """
+    check_hash_algorithms(
+        os.path.join(entry_1, MANIFEST_FILE), os.path.join(entry_2, MANIFEST_FILE)
+    )
+    with times.measure("load"):
+        tree_1 = load_tree(entry_1)
+        tree_2 = load_tree(entry_2)
+    if memory_limit is None:
+        with times.measure("load"):
+            df1 = load_manifest(os.path.join(entry_1, MANIFEST_FILE))
+            df2 = load_manifest(os.path.join(entry_2, MANIFEST_FILE))
+        with times.measure("join"):
+            return compare_manifest_trees(
+                df1,
+                build_merkle_tree(df1) if tree_1 is None else tree_1,
+                df2,
+                build_merkle_tree(df2) if tree_2 is None else tree_2,
+            )
+    output_dir = os.path.join(scratch_dir, "comparison")
+    with times.measure("join"):
+        compare_sorted_manifests(
+            _sorted_manifest(entry_1, scratch_dir),
+            _sorted_manifest(entry_2, scratch_dir),
+            output_dir,
+            memory_limit,
+            None
+            if tree_1 is None or tree_2 is None
+            else changed_directories(tree_1, tree_2),
+        )
+    with times.measure("load"):
+        changed_files, only_in_df1, only_in_df2 = (
+            scan_category(output_dir, category).collect()
+            for category in ("changed", "only_in_1", "only_in_2")
+        )
+    return scan_category(output_dir, "common"), changed_files, only_in_df1, only_in_df2
+
+
+async def _compare_entries(
+    image_1: str,
+    image_2: str,
+    entry_1: str,
+    entry_2: str,
+    export_dir: str,
+    scratch_dir: str,
+    times: StageTimes,
+    diff_options: DiffOptions,
+    memory_limit: int | None = None,
+    report_format: str = DEFAULT_REPORT_FORMAT,
+) -> None:
+    """
+    Compare the manifests of two store entries and print the differences.
+
+    Args:
+        image_1 (str): Name of the first image, as given on the command line
+        image_2 (str): Name of the second image, as given on the command line
+        entry_1 (str): Store entry of the first image
+        entry_2 (str): Store entry of the second image
+        export_dir (str): Directory where detailed file comparisons will be saved
+        scratch_dir (str): Temporary directory the changed files are extracted into
+        times (StageTimes): Timings of the comparison stages
+        diff_options (DiffOptions): Concurrency, timeout and budget of diffoscope
+        memory_limit (int | None): Memory the comparison of the manifests may use,
+            mode and owner changes are only looked for without a limit
+        report_format (str): Format of the lists of files, see `report.write_report`
+    """
+    comparison = await times.run(
+        "compare",
+        _load_and_compare,
+        entry_1,
+        entry_2,
+        scratch_dir,
+        memory_limit,
+        times,
+    )
+    metadata = (
+        await times.run(
+            "metadata",
+            find_metadata_changes,
+            os.path.join(entry_1, INDEX_FILE),
+            os.path.join(entry_2, INDEX_FILE),
+            comparison[0],
+        )
+        if memory_limit is None
+        else None
+    )
+    await _report_comparison(
+        image_1,
+        image_2,
+        entry_1,
+        entry_2,
+        comparison,
+        export_dir,
+        scratch_dir,
+        times,
+        diff_options,
+        metadata,
+        report_format,
+    )
+
+
+async def _report_comparison(
+    image_1: str,
+    image_2: str,
+    entry_1: str,
+    entry_2: str,
+    comparison: tuple[pl.LazyFrame, pl.DataFrame, pl.DataFrame, pl.DataFrame],
+    export_dir: str,
+    scratch_dir: str,
+    times: StageTimes,
+    diff_options: DiffOptions | None,
+    metadata: pl.DataFrame | None = None,
+    report_format: str = DEFAULT_REPORT_FORMAT,
+) -> None:
+    """
+    Print the differences between two images and compare their changed files.
+
+    Args:
+        image_1 (str): Name of the first image, as given on the command line
+        image_2 (str): Name of the second image, as given on the command line
+        entry_1 (str): Store entry of the first image
+        entry_2 (str): Store entry of the second image
+        comparison (tuple): Common, changed and unique files, see `_load_and_compare`
+        export_dir (str): Directory where detailed file comparisons will be saved
+        scratch_dir (str): Temporary directory the changed files are extracted into
+        times (StageTimes): Timings of the comparison stages
+        diff_options (DiffOptions | None): Concurrency, timeout and budget of
+            diffoscope, None to only report the lists of files
+        metadata (pl.DataFrame | None): Files with the same content but another mode
+            or owner, see `quick.find_metadata_changes`
+        report_format (str): Format of the lists of files and of the index of the
+            detailed comparisons, see `report.write_report`
+    """
+    common_rows, changed_files, only_in_df1, only_in_df2 = comparison
+    common = common_rows.select(pl.len()).collect().item()
+    times.count(
+        "join",
+        common=common,
+        changed=len(changed_files),
+        only_in_1=len(only_in_df1),
+        only_in_2=len(only_in_df2),
+    )
+    _print_summary(
+        image_1,
+        image_2,
+        entry_1,
+        entry_2,
+        common,
+        changed_files,
+        only_in_df1,
+        only_in_df2,
+        metadata,
+    )
+    results = (
+        await _analyze_changed_files(
+            changed_files,
+            entry_1,
+            entry_2,
+            export_dir,
+            scratch_dir,
+            times,
+            diff_options,
+        )
+        if diff_options is not None
+        else None
+    )
+    categories: dict[str, pl.DataFrame | pl.LazyFrame] = {
+        "common": common_rows,
+        "changed": changed_files,
+        "only_in_1": only_in_df1,
+        "only_in_2": only_in_df2,
+    }
+    if metadata is not None:
+        categories["metadata"] = metadata
+    report_dir = await times.run(
+        "report", write_report, categories, results, export_dir, report_format
+    )
+    print(f"Lists of files and index of the comparisons: {report_dir}", flush=True)
+
+
+def _print_quick_comparison(
+    image_1: str,
+    image_2: str,
+    entry_1: str,
+    entry_2: str,
+    comparison: QuickComparison,
+) -> None:
+    """
+    Print the differences found from the tar headers of two images.
+
+    Args:
+        image_1 (str): Name of the first image, as given on the command line
+        image_2 (str): Name of the second image, as given on the command line
+        entry_1 (str): Store entry of the first image
+        entry_2 (str): Store entry of the second image
+        comparison (QuickComparison): Result of `quick.quick_compare`
+    """
+    _print_summary(
+        image_1,
+        image_2,
+        entry_1,
+        entry_2,
+        comparison.common,
+        comparison.changed,
+        comparison.only_in_1,
+        comparison.only_in_2,
+        comparison.metadata_changes,
+    )
+    print(
+        f"Quick mode: {comparison.hashed} files with ambiguous headers were hashed, "
+        "the others were compared from their headers. Run without --quick for "
+        "detailed comparisons.",
+        flush=True,
+    )
+
+
+def _print_summary(
+    image_1: str,
+    image_2: str,
+    entry_1: str,
+    entry_2: str,
+    common_count: int,
+    changed_files: pl.DataFrame,
+    only_in_df1: pl.DataFrame,
+    only_in_df2: pl.DataFrame,
+    metadata: pl.DataFrame | None,
+) -> None:
+    """
+    Print the number of files in each category and where the differences are.
+
+    Args:
+        image_1 (str): Name of the first image, as given on the command line
+        image_2 (str): Name of the second image, as given on the command line
+        entry_1 (str): Store entry of the first image
+        entry_2 (str): Store entry of the second image
+        common_count (int): Number of files with the same content in both images
+        changed_files (pl.DataFrame): Files whose content changed
+        only_in_df1 (pl.DataFrame): Files only in the first image
+        only_in_df2 (pl.DataFrame): Files only in the second image
+        metadata (pl.DataFrame | None): Files with the same content but another mode
+            or owner, None when they were not looked for
+    """
     print("\n=== Filesystem Comparison Summary ===", flush=True)
-    print(f"🔄 Common files (identical content): {len(common_rows)}", flush=True)
+    print(f"🔄 Common files (identical content): {common_count}", flush=True)
     print(f"📝 Modified files: {len(changed_files)}", flush=True)
     print(f"➖ Files unique to {image_1}: {len(only_in_df1)}", flush=True)
     print(f"➕ Files unique to {image_2}: {len(only_in_df2)}", flush=True)
+    if metadata is not None:
+        print(f"🔐 Files with only a mode or owner change: {len(metadata)}", flush=True)
+    excluded = [load_excluded_count(entry) for entry in (entry_1, entry_2)]
+    if excluded != [None, None]:
+        print(
+            "🚫 Files excluded by the path filters: "
+            f"{excluded[0] or 0} in {image_1}, {excluded[1] or 0} in {image_2}",
+            flush=True,
+        )
     print("================================\n", flush=True)
 
-    if len(only_in_df2) < NEW_FILE_PRINT_THRESHOLD:
-        print(f"\nFiles only in {image_2}:", flush=True)
-        for row in only_in_df2.iter_rows(named=True):
-            print(f"  {row['path']}", flush=True)
+    by_directory = summarize_by_directory(changed_files, only_in_df1, only_in_df2)
+    if not by_directory.is_empty():
+        print("Directories with the most changes:", flush=True)
+        for directory, changed, removed, added, _ in by_directory.head(
+            DIRECTORY_PRINT_LIMIT
+        ).iter_rows():
+            print(
+                f"  /{directory}: {changed} modified, {removed} removed, {added} added",
+                flush=True,
+            )
+        if len(by_directory) > DIRECTORY_PRINT_LIMIT:
+            print(
+                f"  ... and {len(by_directory) - DIRECTORY_PRINT_LIMIT} more "
+                "directories",
+                flush=True,
+            )
         print("", flush=True)
 
-    if len(changed_files) < UPDATED_FILE_TRESHOLD:
-        _analyze_changed_files(changed_files, image_1, image_2, export_dir)
-    else:
-        print(
-            f"\nThere are too many files that are different between the images ({len(changed_files)}).",
-            flush=True,
+    if metadata is not None and 0 < len(metadata) < NEW_FILE_PRINT_THRESHOLD:
+        lines = [
+            f"  {path}: {_format_mode(mode)} {uid}:{gid} → "
+            f"{_format_mode(mode_2)} {uid_2}:{gid_2}"
+            for path, mode, mode_2, uid, uid_2, gid, gid_2, _ in metadata.iter_rows()
+        ]
+        print("\n".join(["Mode and owner changes:", *lines, ""]), flush=True)
+
+    if len(only_in_df2) < NEW_FILE_PRINT_THRESHOLD:
+        lines = [f"  {path}" for path in only_in_df2["path"].to_list()]
+        print("\n".join([f"\nFiles only in {image_2}:", *lines, ""]), flush=True)
+
+
+def _format_mode(mode: int | None) -> str:
+    return "?" if mode is None else f"{mode:04o}"
+
+
+def compare_series(
+    images: list[str],
+    export_dir: str,
+    jobs: int = 1,
+    source: str = "auto",
+    store: ContentCache | None = None,
+    layer_cache: ContentCache | None = None,
+    diff_options: DiffOptions | None = DiffOptions(),
+    all_pairs: bool = False,
+    path_filter: PathFilter | None = None,
+    algorithm: str = DEFAULT_HASH_ALGORITHM,
+    spill: SpillPolicy | None = None,
+    times: StageTimes | None = None,
+    report_format: str = DEFAULT_REPORT_FORMAT,
+) -> pl.DataFrame:
+    """
+    Compare an ordered series of images and build the history of their files.
+
+    Args:
+        images (list[str]): Docker images (or OCI layouts / tar archives), oldest first
+        export_dir (str): Directory that receives `series.HISTORY_FILE` and the
+            detailed comparisons of each pair, in a "<i>-<j>" subdirectory
+        jobs (int): Number of threads used to hash the files of each image
+        source (str): How the images are read, one of `ImageSource`
+        store (ContentCache | None): Image store kept between runs, defaults to the one
+            in `cache.default_cache_dir`
+        layer_cache (ContentCache | None): Cache of partial layer manifests shared by
+            runs
+        diff_options (DiffOptions | None): Concurrency, timeout and budget of
+            diffoscope, None to only compare the manifests
+        all_pairs (bool): Compare every pair of images instead of consecutive ones
+        path_filter (PathFilter | None): Files that are hashed and compared
+        algorithm (str): Hash of the file contents, one of `manifest.HashAlgorithm`
+        spill (SpillPolicy | None): Hash Docker exports from the pipe, see
+            `extractor.ingest_image`
+        times (StageTimes | None): Timings the stages are recorded in, a new one
+            when None
+        report_format (str): Format of the lists of files of each pair, see
+            `report.write_report`
+
+    Returns:
+        pl.DataFrame: The history of the files, see `series.build_history`
+
+    Every image is ingested once and its manifest loaded once, the pairs are then
+    compared from the manifests in memory. The history only needs consecutive
+    images, so its cost grows linearly with the number of images. At most
+    max(2, jobs) images are exported and hashed at the same time.
+    """
+    if store is None:
+        store, layer_cache, _ = open_caches(
+            default_cache_dir(), DEFAULT_CACHE_SIZE, DEFAULT_LAYER_CACHE_SIZE
         )
-        print("changes files are:")
-        for row in changed_files.iter_rows(named=True):
-            print(f"  {row['path']}", flush=True)
+    return asyncio.run(
+        _compare_series(
+            images,
+            export_dir,
+            jobs,
+            source,
+            store,
+            layer_cache,
+            diff_options,
+            all_pairs,
+            path_filter,
+            algorithm,
+            spill,
+            times or StageTimes(),
+            report_format,
+        )
+    )
+
+
+def _load_entry(entry: str) -> tuple[pl.DataFrame, pl.DataFrame]:
+    manifest = load_manifest(os.path.join(entry, MANIFEST_FILE))
+    tree = load_tree(entry)
+    return manifest, build_merkle_tree(manifest) if tree is None else tree
+
+
+async def _compare_series(
+    images: list[str],
+    export_dir: str,
+    jobs: int,
+    source: str,
+    store: ContentCache,
+    layer_cache: ContentCache | None,
+    diff_options: DiffOptions | None,
+    all_pairs: bool,
+    path_filter: PathFilter | None,
+    algorithm: str,
+    spill: SpillPolicy | None,
+    times: StageTimes,
+    report_format: str,
+) -> pl.DataFrame:
+    scratch_dir = tempfile.mkdtemp(prefix="container-diffoscope-")
+    atexit.register(__cleanup_cache, scratch_dir)
+
+    with ExitStack() as stack:
+
+        def ingest(image: str) -> tuple[str, pl.DataFrame, pl.DataFrame]:
+            entry = stack.enter_context(
+                open_image(
+                    image,
+                    store,
+                    source,
+                    jobs,
+                    layer_cache,
+                    path_filter,
+                    algorithm=algorithm,
+                    spill=spill,
+                    times=times,
+                )
+            )
+            return entry, *_load_entry(entry)
+
+        # Bounded like `compare` by default: two exports and hashers at a time
+        slots = asyncio.Semaphore(max(2, jobs))
+
+        async def bounded_ingest(image: str) -> tuple[str, pl.DataFrame, pl.DataFrame]:
+            async with slots:
+                return await times.run(f"ingest {image}", ingest, image)
+
+        ingested = await asyncio.gather(*(bounded_ingest(image) for image in images))
+        entries = [entry for entry, _, _ in ingested]
+        check_hash_algorithms(
+            *(os.path.join(entry, MANIFEST_FILE) for entry in entries)
+        )
+        manifests = [manifest for _, manifest, _ in ingested]
+        trees = [tree for _, _, tree in ingested]
+
+        history = await times.run(
+            "history", build_history, manifests, trees, list(images)
+        )
+        os.makedirs(export_dir, exist_ok=True)
+        history_path = os.path.join(export_dir, HISTORY_FILE)
+        history.write_parquet(history_path)
+        print("\n=== Series History ===", flush=True)
+        for image in images[1:]:
+            events = history[image].value_counts()
+            counts = dict(zip(events[image].to_list(), events["count"].to_list()))
+            print(
+                f"{image}: {counts.get('changed', 0)} modified, "
+                f"{counts.get('removed', 0)} removed, {counts.get('added', 0)} added",
+                flush=True,
+            )
+        print(f"History of {len(history)} files: {history_path}", flush=True)
+
+        if diff_options is not None:
+            for i, j in series_pairs(len(images), all_pairs):
+                print(f"\n=== {images[i]} → {images[j]} ===", flush=True)
+                pair_dir = f"{i}-{j}"
+                comparison = await times.run(
+                    f"compare {pair_dir}",
+                    compare_manifest_trees,
+                    manifests[i],
+                    trees[i],
+                    manifests[j],
+                    trees[j],
+                )
+                common_rows, changed_files, only_in_1, only_in_2 = comparison
+                metadata = await times.run(
+                    f"metadata {pair_dir}",
+                    find_metadata_changes,
+                    os.path.join(entries[i], INDEX_FILE),
+                    os.path.join(entries[j], INDEX_FILE),
+                    common_rows,
+                )
+                await _report_comparison(
+                    images[i],
+                    images[j],
+                    entries[i],
+                    entries[j],
+                    (common_rows, changed_files, only_in_1, only_in_2),
+                    os.path.join(export_dir, pair_dir, "file_diff"),
+                    os.path.join(scratch_dir, pair_dir),
+                    times,
+                    diff_options,
+                    metadata,
+                    report_format,
+                )
+
+    print("\n=== Stage Timings ===", flush=True)
+    print(times.report(), flush=True)
+    return history
+
+
+def run_served_job(
+    job: dict,
+    store: ContentCache,
+    layer_cache: ContentCache | None,
+    diff_options: DiffOptions,
+    warm_cache: WarmCache,
+    jobs: int = 1,
+) -> dict:
+    """
+    Compare two images for the daemon, reusing the frames kept in memory.
+
+    Args:
+        job (dict): image_1, image_2 and output_dir (an absolute path), and
+            optionally source, hash, include, exclude, details and report_format,
+            with the meaning of the `compare` options
+        store (ContentCache): Image store shared by the jobs
+        layer_cache (ContentCache | None): Cache of partial layer manifests
+        diff_options (DiffOptions): Concurrency, timeout and budget of diffoscope
+        warm_cache (WarmCache): Manifests, Merkle trees and headers of the entries
+            used by the previous jobs
+        jobs (int): Number of threads used to hash the files of each image
+
+    Returns:
+        dict: The report directory (see `report.write_report`), the number of files
+            in each category, of mode and owner changes and of detailed comparisons
+            by status, and the metrics of the stages (see `StageTimes.metrics`)
+
+    Raises:
+        ValueError: If the job is missing a parameter or has an invalid one
+    """
+    images = [job["image_1"], job["image_2"]]
+    if STDIN_IMAGE in images:
+        raise ValueError("The daemon cannot read images from stdin")
+    output_dir = job["output_dir"]
+    if not os.path.isabs(output_dir):
+        raise ValueError(f"output_dir must be an absolute path, got {output_dir}")
+    return asyncio.run(
+        _run_served_job(
+            images,
+            os.path.join(output_dir, "file_diff"),
+            ImageSource(job.get("source", ImageSource.auto)).value,
+            HashAlgorithm(job.get("hash", DEFAULT_HASH_ALGORITHM)).value,
+            build_path_filter(job.get("include", []), job.get("exclude", []), None),
+            diff_options if job.get("details", True) else None,
+            ReportFormat(job.get("report_format", DEFAULT_REPORT_FORMAT)).value,
+            store,
+            layer_cache,
+            warm_cache,
+            jobs,
+        )
+    )
+
+
+async def _run_served_job(
+    images: list[str],
+    export_dir: str,
+    source: str,
+    algorithm: str,
+    path_filter: PathFilter | None,
+    diff_options: DiffOptions | None,
+    report_format: str,
+    store: ContentCache,
+    layer_cache: ContentCache | None,
+    warm_cache: WarmCache,
+    jobs: int,
+) -> dict:
+    scratch_dir = tempfile.mkdtemp(prefix="container-diffoscope-")
+    times = StageTimes()
+    try:
+        with ExitStack() as stack:
+
+            def ingest(image: str) -> str:
+                return stack.enter_context(
+                    open_image(
+                        image,
+                        store,
+                        source,
+                        jobs,
+                        layer_cache,
+                        path_filter,
+                        algorithm=algorithm,
+                        times=times,
+                    )
+                )
+
+            entry_1, entry_2 = await asyncio.gather(
+                *(times.run(f"ingest {image}", ingest, image) for image in images)
+            )
+            check_hash_algorithms(
+                os.path.join(entry_1, MANIFEST_FILE),
+                os.path.join(entry_2, MANIFEST_FILE),
+            )
+            warm_1, warm_2 = await asyncio.gather(
+                *(
+                    times.run("load", warm_cache.get, entry)
+                    for entry in (entry_1, entry_2)
+                )
+            )
+            common_rows, changed_files, only_in_1, only_in_2 = await times.run(
+                "join",
+                compare_manifest_trees,
+                warm_1.manifest,
+                warm_1.tree,
+                warm_2.manifest,
+                warm_2.tree,
+            )
+            metadata = await times.run(
+                "metadata",
+                compare_metadata,
+                warm_1.headers,
+                warm_2.headers,
+                common_rows,
+            )
+            await _report_comparison(
+                images[0],
+                images[1],
+                entry_1,
+                entry_2,
+                (common_rows, changed_files, only_in_1, only_in_2),
+                export_dir,
+                scratch_dir,
+                times,
+                diff_options,
+                metadata,
+                report_format,
+            )
+    finally:
+        shutil.rmtree(scratch_dir, ignore_errors=True)
+    return {
+        "report_dir": os.path.join(export_dir, REPORT_DIR),
+        "files": times.counters["join"],
+        "metadata": len(metadata),
+        "diffs": times.counters.get("diff", {}),
+        "stages": times.metrics()["stages"],
+    }
+
+
+CACHE_DIR_OPTION = typer.Option(
+    default_cache_dir(), help="Directory of the caches kept between runs"
+)
+CACHE_SIZE_OPTION = typer.Option(
+    DEFAULT_CACHE_SIZE,
+    help="Maximum size of the image store (e.g. 512M, 10G)",
+)
+LAYER_CACHE_SIZE_OPTION = typer.Option(
+    DEFAULT_LAYER_CACHE_SIZE,
+    help="Maximum size of the layer manifest cache (e.g. 512M, 2G), 0 disables it",
+)
+DIFF_CACHE_SIZE_OPTION = typer.Option(
+    DEFAULT_DIFF_CACHE_SIZE,
+    help="Maximum size of the cache of detailed comparisons (e.g. 512M), 0 disables it",
+)
+JOBS_OPTION = typer.Option(
+    1,
+    "--jobs",
+    "-j",
+    min=1,
+    help="Number of threads used to hash the files of each image",
+)
+SOURCE_OPTION = typer.Option(
+    ImageSource.auto,
+    help="How the images are read: auto, docker (CLI export), oci (image layout "
+    "directory), archive (docker save tar), rootfs (flattened tar) or stream "
+    "(flattened tar read from stdin, given as -)",
+)
+DIFF_JOBS_OPTION = typer.Option(
+    1, min=1, help="Number of diffoscope processes running at the same time"
+)
+DIFF_TIMEOUT_OPTION = typer.Option(
+    DEFAULT_DIFF_TIMEOUT,
+    min=0,
+    help="Seconds after which a single diffoscope run is killed, 0 for no limit",
+)
+
+
+def _check_images(images: list[str], source: ImageSource) -> None:
+    if source != ImageSource.auto:
+        return
+    for image in images:
+        try:
+            detect_source(image)
+        except ValueError as error:
+            raise typer.BadParameter(str(error)) from error
+
+
+def _check_budget(budget: str) -> str:
+    try:
+        parse_budget(budget)
+    except ValueError as error:
+        raise typer.BadParameter(str(error)) from error
+    return budget
+
+
+DIFF_BUDGET_OPTION = typer.Option(
+    "0",
+    help="Time (e.g. 300s, 5min) and/or bytes (e.g. 2GiB) all detailed "
+    "comparisons may take together, comma separated, 0 for no limit",
+    callback=_check_budget,
+)
+CHUNK_THRESHOLD_OPTION = typer.Option(
+    DEFAULT_CHUNK_THRESHOLD,
+    help="Size from which changed files are compared chunk by chunk (changed "
+    "byte ranges and similarity) instead of with diffoscope, 0 to disable",
+)
+INCLUDE_OPTION = typer.Option(
+    [],
+    help="Glob of the paths hashed and compared (e.g. /etc), can be repeated, "
+    "every path when not given",
+)
+EXCLUDE_OPTION = typer.Option(
+    [],
+    help="Glob of the paths skipped without reading them (e.g. /usr/share/doc or "
+    "*.pyc), can be repeated",
+)
+FILTER_FILE_OPTION = typer.Option(
+    None,
+    help="File of globs, one per line: '+ <glob>' to include, '- <glob>' or a bare "
+    "glob to exclude, '#' for comments",
+)
+STREAM_OPTION = typer.Option(
+    False,
+    help="Hash Docker exports from the pipe without writing them to the cache, only "
+    "keeping the files that may be compared in detail. Implied when an image is "
+    "read from stdin (-)",
+)
+SPILL_MAX_SIZE_OPTION = typer.Option(
+    DEFAULT_SPILL_MAX_SIZE,
+    help="Size of the largest file kept from an image hashed from a pipe (e.g. 8M), "
+    "larger files are hashed but not compared in detail",
+)
+HASH_OPTION = typer.Option(
+    HashAlgorithm.sha256,
+    "--hash",
+    help="Hash of the file contents: sha256, or blake2b which is faster on CPUs "
+    "without SHA instructions. Images hashed with each algorithm are cached separately",
+)
+REPORT_FORMAT_OPTION = typer.Option(
+    ReportFormat.ndjson,
+    help="Format of the lists of files of each category and of the index of the "
+    "detailed comparisons written to <output-dir>/file_diff/report: ndjson, "
+    "parquet or json",
+)
+PROFILE_OPTION = typer.Option(
+    None,
+    help="Write a trace of every stage run (threads, wall-clock and CPU time, "
+    "file compared) to this path, in the Chrome trace format Perfetto opens",
+)
+METRICS_OPTION = typer.Option(
+    None,
+    help="Write a JSON summary of the stages to this path: wall-clock and CPU "
+    "time, files and bytes hashed per second, join row counts, diff durations",
+)
+DIFF_PRIORITY_OPTION = typer.Option(
+    list(DEFAULT_PRIORITY_GLOBS),
+    help="Glob of paths compared first when the budget runs out (e.g. /etc/**), "
+    "can be repeated, earlier globs rank first",
+)
+
+
+def _write_profile(
+    times: StageTimes, trace_path: str | None, metrics_path: str | None
+) -> None:
+    """
+    Write the trace and the metrics summary of a comparison when they were requested.
+
+    Args:
+        times (StageTimes): Timings of the comparison
+        trace_path (str | None): Where to write the trace, see `StageTimes.write_trace`
+        metrics_path (str | None): Where to write the summary, see
+            `StageTimes.write_metrics`
+    """
+    if trace_path is not None:
+        times.write_trace(trace_path)
+        print(f"Trace of the stages: {trace_path}", flush=True)
+    if metrics_path is not None:
+        times.write_metrics(metrics_path)
+        print(f"Metrics of the stages: {metrics_path}", flush=True)
 
 
 @app.command()
-def main(
-    image_1: str = typer.Argument(..., help="First Docker image to compare"),
-    image_2: str = typer.Argument(..., help="Second Docker image to compare"),
-    output_dir: str = typer.Option("temp_results", help="Output directory for comparison results"),
+def compare(
+    image_1: str = typer.Argument(
+        ..., help="First Docker image, OCI layout directory or tar archive to compare"
+    ),
+    image_2: str = typer.Argument(
+        ..., help="Second Docker image, OCI layout directory or tar archive to compare"
+    ),
+    output_dir: str = typer.Option(
+        "temp_results", help="Output directory for comparison results"
+    ),
+    jobs: int = JOBS_OPTION,
+    source: ImageSource = SOURCE_OPTION,
+    cache_dir: str = CACHE_DIR_OPTION,
+    cache_size: str = CACHE_SIZE_OPTION,
+    layer_cache_size: str = LAYER_CACHE_SIZE_OPTION,
+    diff_cache_size: str = DIFF_CACHE_SIZE_OPTION,
+    diff_jobs: int = DIFF_JOBS_OPTION,
+    diff_timeout: float = DIFF_TIMEOUT_OPTION,
+    diff_budget: str = DIFF_BUDGET_OPTION,
+    chunk_threshold: str = CHUNK_THRESHOLD_OPTION,
+    quick: bool = typer.Option(
+        False,
+        help="Compare the tar headers (size, mode, owner, mtime, link target) "
+        "without reading the files, only hash those with the same size but another "
+        "mtime, and skip the detailed comparisons",
+    ),
+    memory_limit: str = typer.Option(
+        "0",
+        help="Memory the comparison of the manifests may use (e.g. 512M), they are "
+        "merged from disk in sorted order instead of being loaded, 0 for no limit",
+    ),
+    diff_priority: list[str] = DIFF_PRIORITY_OPTION,
+    include: list[str] = INCLUDE_OPTION,
+    exclude: list[str] = EXCLUDE_OPTION,
+    filter_file: str | None = FILTER_FILE_OPTION,
+    hash_algorithm: HashAlgorithm = HASH_OPTION,
+    stream: bool = STREAM_OPTION,
+    spill_max_size: str = SPILL_MAX_SIZE_OPTION,
+    report_format: ReportFormat = REPORT_FORMAT_OPTION,
+    profile: str | None = PROFILE_OPTION,
+    metrics: str | None = METRICS_OPTION,
 ):
     """
     Compare two Docker images' filesystems and generate detailed comparisons of changed files.
     """
+    if image_1 == image_2 == STDIN_IMAGE:
+        raise typer.BadParameter("Only one image can be read from stdin")
+    _check_images([image_1, image_2], source)
     full_output_dir = f"{output_dir}/file_diff"
-    compare_filesystem(image_1, image_2, full_output_dir)
+    times = StageTimes(profile=profile is not None or metrics is not None)
+    store, layer_cache, diff_cache = open_caches(
+        cache_dir, cache_size, layer_cache_size, diff_cache_size
+    )
+    diff_options = DiffOptions(
+        diff_jobs,
+        diff_timeout or None,
+        parse_budget(diff_budget),
+        diff_cache,
+        tuple(diff_priority),
+        parse_size(chunk_threshold) or None,
+    )
+    compare_filesystem(
+        image_1,
+        image_2,
+        full_output_dir,
+        jobs,
+        source.value,
+        store,
+        layer_cache,
+        diff_options,
+        parse_size(memory_limit) or None,
+        build_path_filter(include, exclude, filter_file),
+        quick,
+        hash_algorithm.value,
+        SpillPolicy(parse_size(spill_max_size))
+        if stream or STDIN_IMAGE in (image_1, image_2)
+        else None,
+        times,
+        report_format.value,
+    )
+    _write_profile(times, profile, metrics)
+
+
+@app.command("compare-series")
+def compare_series_command(
+    images: list[str] = typer.Argument(
+        ...,
+        help="Docker images, OCI layout directories or tar archives, oldest first",
+    ),
+    output_dir: str = typer.Option(
+        "temp_results", help="Output directory for the history and comparison results"
+    ),
+    all_pairs: bool = typer.Option(
+        False, help="Compare every pair of images instead of consecutive ones"
+    ),
+    details: bool = typer.Option(
+        True, help="Generate detailed comparisons of the changed files of each pair"
+    ),
+    jobs: int = JOBS_OPTION,
+    source: ImageSource = SOURCE_OPTION,
+    cache_dir: str = CACHE_DIR_OPTION,
+    cache_size: str = CACHE_SIZE_OPTION,
+    layer_cache_size: str = LAYER_CACHE_SIZE_OPTION,
+    diff_cache_size: str = DIFF_CACHE_SIZE_OPTION,
+    diff_jobs: int = DIFF_JOBS_OPTION,
+    diff_timeout: float = DIFF_TIMEOUT_OPTION,
+    diff_budget: str = DIFF_BUDGET_OPTION,
+    chunk_threshold: str = CHUNK_THRESHOLD_OPTION,
+    diff_priority: list[str] = DIFF_PRIORITY_OPTION,
+    include: list[str] = INCLUDE_OPTION,
+    exclude: list[str] = EXCLUDE_OPTION,
+    filter_file: str | None = FILTER_FILE_OPTION,
+    hash_algorithm: HashAlgorithm = HASH_OPTION,
+    stream: bool = STREAM_OPTION,
+    spill_max_size: str = SPILL_MAX_SIZE_OPTION,
+    report_format: ReportFormat = REPORT_FORMAT_OPTION,
+    profile: str | None = PROFILE_OPTION,
+    metrics: str | None = METRICS_OPTION,
+):
+    """
+    Compare a series of image versions and record when each file appeared, changed
+    or disappeared.
+    """
+    if len(images) < 2:
+        raise typer.BadParameter("A series needs at least two images")
+    if len(set(images)) != len(images):
+        raise typer.BadParameter(
+            "The images of a series must be different, only one can be read from stdin"
+        )
+    _check_images(images, source)
+    store, layer_cache, diff_cache = open_caches(
+        cache_dir, cache_size, layer_cache_size, diff_cache_size
+    )
+    diff_options = (
+        DiffOptions(
+            diff_jobs,
+            diff_timeout or None,
+            parse_budget(diff_budget),
+            diff_cache,
+            tuple(diff_priority),
+            parse_size(chunk_threshold) or None,
+        )
+        if details
+        else None
+    )
+    times = StageTimes(profile=profile is not None or metrics is not None)
+    compare_series(
+        images,
+        output_dir,
+        jobs,
+        source.value,
+        store,
+        layer_cache,
+        diff_options,
+        all_pairs,
+        build_path_filter(include, exclude, filter_file),
+        hash_algorithm.value,
+        SpillPolicy(parse_size(spill_max_size))
+        if stream or STDIN_IMAGE in images
+        else None,
+        times,
+        report_format.value,
+    )
+    _write_profile(times, profile, metrics)
+
+
+@app.command()
+def serve(
+    host: str = typer.Option("127.0.0.1", help="Address the daemon listens on"),
+    port: int = typer.Option(DEFAULT_SERVE_PORT, help="Port the daemon listens on"),
+    socket_path: str | None = typer.Option(
+        None, "--socket", help="Unix socket the daemon listens on instead of a port"
+    ),
+    max_jobs: int = typer.Option(
+        DEFAULT_MAX_JOBS, min=1, help="Number of comparisons running at the same time"
+    ),
+    max_queued: int = typer.Option(
+        DEFAULT_MAX_QUEUED,
+        min=0,
+        help="Number of comparisons waiting for a slot, more are refused",
+    ),
+    warm_cache_size: str = typer.Option(
+        DEFAULT_WARM_CACHE_SIZE,
+        help="Memory taken by the manifests, Merkle trees and headers kept between "
+        "comparisons (e.g. 2G)",
+    ),
+    jobs: int = JOBS_OPTION,
+    cache_dir: str = CACHE_DIR_OPTION,
+    cache_size: str = CACHE_SIZE_OPTION,
+    layer_cache_size: str = LAYER_CACHE_SIZE_OPTION,
+    diff_cache_size: str = DIFF_CACHE_SIZE_OPTION,
+    diff_jobs: int = DIFF_JOBS_OPTION,
+    diff_timeout: float = DIFF_TIMEOUT_OPTION,
+    diff_budget: str = DIFF_BUDGET_OPTION,
+    chunk_threshold: str = CHUNK_THRESHOLD_OPTION,
+    diff_priority: list[str] = DIFF_PRIORITY_OPTION,
+):
+    """
+    Run a daemon comparing the images submitted to it, keeping recent manifests in
+    memory.
+    """
+    store, layer_cache, diff_cache = open_caches(
+        cache_dir, cache_size, layer_cache_size, diff_cache_size
+    )
+    diff_options = DiffOptions(
+        diff_jobs,
+        diff_timeout or None,
+        parse_budget(diff_budget),
+        diff_cache,
+        tuple(diff_priority),
+        parse_size(chunk_threshold) or None,
+    )
+    warm_cache = WarmCache(parse_size(warm_cache_size))
+    service = ComparisonService(
+        lambda job: run_served_job(
+            job, store, layer_cache, diff_options, warm_cache, jobs
+        ),
+        warm_cache,
+        max_jobs,
+        max_queued,
+    )
+    server = make_server(service, host, port, socket_path)
+    print(f"Serving comparisons on {socket_path or f'{host}:{port}'}", flush=True)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+@app.command()
+def submit(
+    image_1: str = typer.Argument(
+        ..., help="First Docker image, OCI layout directory or tar archive to compare"
+    ),
+    image_2: str = typer.Argument(
+        ..., help="Second Docker image, OCI layout directory or tar archive to compare"
+    ),
+    server: str = typer.Option(
+        f"127.0.0.1:{DEFAULT_SERVE_PORT}",
+        help="host:port or Unix socket of the daemon started with serve",
+    ),
+    output_dir: str = typer.Option(
+        "temp_results", help="Output directory for comparison results"
+    ),
+    details: bool = typer.Option(
+        True, help="Generate detailed comparisons of the changed files"
+    ),
+    source: ImageSource = SOURCE_OPTION,
+    include: list[str] = INCLUDE_OPTION,
+    exclude: list[str] = EXCLUDE_OPTION,
+    hash_algorithm: HashAlgorithm = HASH_OPTION,
+    report_format: ReportFormat = REPORT_FORMAT_OPTION,
+):
+    """
+    Submit a comparison to a running daemon and print its result as JSON.
+    """
+    status, result = request_daemon(
+        server,
+        "POST",
+        "/compare",
+        {
+            "image_1": os.path.abspath(image_1) if os.path.exists(image_1) else image_1,
+            "image_2": os.path.abspath(image_2) if os.path.exists(image_2) else image_2,
+            "output_dir": os.path.abspath(output_dir),
+            "details": details,
+            "source": source.value,
+            "include": include,
+            "exclude": exclude,
+            "hash": hash_algorithm.value,
+            "report_format": report_format.value,
+        },
+    )
+    print(json.dumps(result, indent=2), flush=True)
+    if status != 200:
+        raise typer.Exit(1)
+
+
+@cache_app.command("stats")
+def cache_stats(cache_dir: str = CACHE_DIR_OPTION):
+    """
+    Show the number of entries and the size of the persistent caches.
+    """
+    for name in (IMAGE_STORE_DIR, LAYER_CACHE_DIR, DIFF_CACHE_DIR):
+        stats = ContentCache(os.path.join(cache_dir, name)).stats()
+        print(
+            f"{name}: {stats['entries']} entries, {format_size(stats['bytes'])}",
+            flush=True,
+        )
+
+
+@cache_app.command("prune")
+def cache_prune(
+    cache_dir: str = CACHE_DIR_OPTION,
+    cache_size: str = CACHE_SIZE_OPTION,
+    layer_cache_size: str = LAYER_CACHE_SIZE_OPTION,
+    diff_cache_size: str = DIFF_CACHE_SIZE_OPTION,
+):
+    """
+    Evict the least recently used entries until the caches fit in their size limits.
+
+    Entries used by a running comparison are kept, a size of 0 removes all the others.
+    """
+    for name, size in (
+        (IMAGE_STORE_DIR, cache_size),
+        (LAYER_CACHE_DIR, layer_cache_size),
+        (DIFF_CACHE_DIR, diff_cache_size),
+    ):
+        evicted = ContentCache(os.path.join(cache_dir, name)).prune(parse_size(size))
+        print(f"{name}: evicted {evicted} entries", flush=True)
 
 
 def cli():
-    """Entry point for the CLI."""
+    """Entry point for the CLI, `compare` is the default command."""
+    commands = {
+        "compare",
+        "compare-series",
+        "serve",
+        "submit",
+        "cache",
+        "--help",
+        "--install-completion",
+        "--show-completion",
+    }
+    if len(sys.argv) > 1 and sys.argv[1] not in commands:
+        sys.argv.insert(1, "compare")
     app()
 
 
@@ -0,0 +1,166 @@
+import json
+import os
+from enum import Enum
+import polars as pl
+from .comparator import load_list_to_dataframe
+
+MANIFEST_SCHEMA = {"hash": pl.Binary, "path": pl.String}
+# Rows read at once by `comparator.iter_manifest_batches`
+MANIFEST_ROW_GROUP_SIZE = 65536
+
+MANIFEST_HEADER_SUFFIX = ".json"  # Header written next to each manifest
+
+
+class HashAlgorithm(str, Enum):
+    """Digest of the file contents recorded in a manifest, see `hasher.new_digest`."""
+
+    sha256 = "sha256"
+    blake2b = "blake2b"
+
+
+DEFAULT_HASH_ALGORITHM = HashAlgorithm.sha256.value
+
+
+def write_manifest(
+    df: pl.DataFrame, path: str, algorithm: str = DEFAULT_HASH_ALGORITHM
+) -> None:
+    """
+    Write a file manifest in the binary columnar format.
+
+    Args:
+        df (pl.DataFrame): Manifest with the binary digest in hash and the file path
+        path (str): Path of the Parquet file
+        algorithm (str): One of `HashAlgorithm`, the digests were computed with it
+
+    The digests are stored as raw bytes (32 per digest) and the file is
+    zstd compressed, which shrinks the long shared path prefixes. Rows are sorted by
+    path and stored in small row groups, so two manifests can be merged without
+    loading them (see `comparator.compare_sorted_manifests`). The hash algorithm
+    and the order of the rows are recorded in a JSON header next to the Parquet
+    file, see `load_hash_algorithm` and `load_manifest`.
+    """
+    df.select(pl.col(name).cast(dtype) for name, dtype in MANIFEST_SCHEMA.items()).sort(
+        "path"
+    ).write_parquet(path, compression="zstd", row_group_size=MANIFEST_ROW_GROUP_SIZE)
+    with open(f"{path}{MANIFEST_HEADER_SUFFIX}", "w", encoding="utf-8") as header:
+        json.dump({"hash": algorithm, "sorted": True}, header)
+
+
+def load_hash_algorithm(path: str) -> str:
+    """
+    Read the hash algorithm a manifest was written with.
+
+    Args:
+        path (str): Path of the Parquet file, see `write_manifest`
+
+    Returns:
+        str: One of `HashAlgorithm`, SHA256 for manifests written before the
+             algorithm was recorded
+    """
+    header_path = f"{path}{MANIFEST_HEADER_SUFFIX}"
+    if not os.path.exists(header_path):
+        return DEFAULT_HASH_ALGORITHM
+    with open(header_path, encoding="utf-8") as header:
+        return json.load(header)["hash"]
+
+
+def _is_written_sorted(path: str) -> bool:
+    header_path = f"{path}{MANIFEST_HEADER_SUFFIX}"
+    if not os.path.exists(header_path):
+        return False
+    with open(header_path, encoding="utf-8") as header:
+        return json.load(header).get("sorted", False)
+
+
+def check_hash_algorithms(*paths: str) -> str:
+    """
+    Make sure manifests can be compared, their digests being of the same algorithm.
+
+    Args:
+        *paths (str): Paths of the manifests, see `write_manifest`
+
+    Returns:
+        str: The algorithm shared by the manifests
+
+    Raises:
+        ValueError: If the manifests were written with different algorithms, the
+            same content would never have the same digest
+    """
+    algorithms = {path: load_hash_algorithm(path) for path in paths}
+    found = sorted(set(algorithms.values()))
+    if len(found) > 1:
+        details = ", ".join(f"{path}: {name}" for path, name in algorithms.items())
+        raise ValueError(
+            "Manifests hashed with different algorithms cannot be compared "
+            f"({details}), hash the images again with the same --hash"
+        )
+    return found[0] if found else DEFAULT_HASH_ALGORITHM
+
+
+def load_manifest(path: str) -> pl.DataFrame:
+    """
+    Load a file manifest written by `write_manifest`.
+
+    Args:
+        path (str): Path of the Parquet file
+
+    Returns:
+        pl.DataFrame: A DataFrame with two columns:
+            - hash: Binary digest of the file
+            - path: Path of the file in the container
+
+    The file is memory mapped instead of being read into a buffer first. The path
+    column is flagged as sorted when the header records that the rows were written
+    sorted, so `comparator.compare_manifest_trees` does not check the order again.
+    """
+    manifest = pl.read_parquet(path, memory_map=True)
+    if _is_written_sorted(path):
+        return manifest.with_columns(pl.col("path").set_sorted())
+    return manifest
+
+
+def scan_manifest(path: str) -> pl.LazyFrame:
+    """
+    Lazily scan a file manifest written by `write_manifest`.
+
+    Args:
+        path (str): Path of the Parquet file
+
+    Returns:
+        pl.LazyFrame: The manifest, read only when the plan using it is collected
+    """
+    return pl.scan_parquet(path)
+
+
+def import_text_manifest(path: str) -> pl.DataFrame:
+    """
+    Load a `sha256sum` style hash list as a binary manifest.
+
+    Args:
+        path (str): Path of the hash list
+
+    Returns:
+        pl.DataFrame: A DataFrame with the columns of `MANIFEST_SCHEMA`
+    """
+    df = load_list_to_dataframe(path)
+    if df.is_empty():
+        return pl.DataFrame(schema=MANIFEST_SCHEMA)
+    return df.select(
+        pl.col("hash").cast(pl.String).str.decode("hex"),
+        pl.col("path").cast(pl.String),
+    )
+
+
+def export_text_manifest(df: pl.DataFrame, path: str) -> None:
+    """
+    Write a binary manifest as a `sha256sum` style hash list.
+
+    Args:
+        df (pl.DataFrame): Manifest with the binary digest in hash and the file path
+        path (str): Path of the hash list
+    """
+    lines = df.select(
+        pl.concat_str(pl.col("hash").bin.encode("hex"), pl.col("path"), separator="  ")
+    ).to_series()
+    with open(path, "w", encoding="utf-8") as output:
+        output.write("".join(f"{line}\n" for line in lines))
@@ -0,0 +1,215 @@
+import io
+import os
+import tarfile
+import polars as pl
+
+MEMBER_INDEX_SCHEMA = {
+    "path": pl.String,
+    "header_offset": pl.UInt64,
+    "data_offset": pl.UInt64,
+    "size": pl.UInt64,
+    "type": pl.String,
+    "linkname": pl.String,
+    "source": pl.String,
+    "source_offset": pl.UInt64,
+    "source_size": pl.UInt64,
+    "compressed": pl.Boolean,
+    "mode": pl.UInt32,
+    "uid": pl.UInt32,
+    "gid": pl.UInt32,
+    "mtime": pl.Int64,
+}
+# Header fields compared by the quick mode, see `quick.compare_headers`
+HEADER_METADATA_COLUMNS = ("mode", "uid", "gid", "mtime")
+
+# Offsets are relative to the uncompressed tar stream stored in `source`, starting at
+# `source_offset` and spanning `source_size` bytes (until end of file when null).
+# Payloads of streams that are not `compressed` can be read with a single seek.
+# Sources stored next to the index file are recorded relative to its directory, so
+# an index and its tar archive can be moved together. Members whose payload was not
+# kept (see `spill.SpillStore`) have no source and no offsets.
+
+SPARSE_TYPE = "S"  # Type recorded for sparse members, their payload is not contiguous
+
+
+def normalize_member_name(name: str) -> str:
+    """
+    Normalize the name of a tar member so all image sources use the same paths.
+
+    Args:
+        name (str): Name of the member as stored in the tar archive
+
+    Returns:
+        str: The name without a leading "./" or "/"
+    """
+    while name.startswith("./"):
+        name = name[2:]
+    return name.lstrip("/")
+
+
+class _RangeReader(io.RawIOBase):
+    """
+    Read-only raw stream over a byte range of a file, used to read layers stored
+    inside another archive.
+    """
+
+    def __init__(self, path: str, offset: int, size: int | None):
+        self._fd = os.open(path, os.O_RDONLY)
+        self._position = offset
+        self._end = offset + size if size is not None else os.fstat(self._fd).st_size
+
+    def readable(self) -> bool:
+        return True
+
+    def readinto(self, buffer) -> int:
+        length = min(len(buffer), self._end - self._position)
+        if length <= 0:
+            return 0
+        chunk = os.pread(self._fd, length, self._position)
+        buffer[: len(chunk)] = chunk
+        self._position += len(chunk)
+        return len(chunk)
+
+    def close(self) -> None:
+        if not self.closed:
+            os.close(self._fd)
+        super().close()
+
+
+def open_source(
+    path: str, offset: int = 0, size: int | None = None
+) -> io.BufferedReader:
+    """
+    Open the tar stream a member index entry points to.
+
+    Args:
+        path (str): Path of the file holding the tar stream
+        offset (int): Offset of the tar stream inside the file
+        size (int | None): Length of the tar stream, None to read until end of file
+
+    Returns:
+        io.BufferedReader: Binary stream limited to the requested range
+    """
+    return io.BufferedReader(_RangeReader(path, offset, size))
+
+
+def new_member_index() -> dict[str, list]:
+    """
+    Create an empty member index that can be filled while walking a tar archive.
+
+    Returns:
+        dict[str, list]: One list per column of `MEMBER_INDEX_SCHEMA`
+    """
+    return {column: [] for column in MEMBER_INDEX_SCHEMA}
+
+
+def add_member(
+    index: dict[str, list],
+    member: tarfile.TarInfo,
+    source: str | None,
+    location: tuple[int, int] | None = None,
+) -> None:
+    """
+    Record the position of a tar member in the member index.
+
+    Args:
+        index (dict[str, list]): Member index created by `new_member_index`
+        member (tarfile.TarInfo): Member read from the tar archive
+        source (str | None): Path of the tar archive the member can be read from,
+            None when it was read from a stream that was not kept
+        location (tuple[int, int] | None): Offsets of the header and of the payload
+            of the member in source, when it was copied there from another archive
+
+    Offsets are relative to the start of the tar stream (see `MEMBER_INDEX_SCHEMA`),
+    which for a plain tar archive is the start of the file.
+    """
+    if source is None:
+        header_offset = data_offset = None
+    elif location is None:
+        header_offset, data_offset = member.offset, member.offset_data
+    else:
+        header_offset, data_offset = location
+    index["path"].append(normalize_member_name(member.name))
+    index["header_offset"].append(header_offset)
+    index["data_offset"].append(data_offset)
+    index["size"].append(member.size)
+    index["type"].append(
+        SPARSE_TYPE if member.issparse() else member.type.decode("ascii")
+    )
+    index["linkname"].append(
+        normalize_member_name(member.linkname) if member.islnk() else member.linkname
+    )
+    index["source"].append(source)
+    index["source_offset"].append(0)
+    index["source_size"].append(None)
+    index["compressed"].append(False)
+    index["mode"].append(member.mode)
+    index["uid"].append(member.uid)
+    index["gid"].append(member.gid)
+    index["mtime"].append(int(member.mtime))
+
+
+def _stored_source(source: str, directory: str) -> str:
+    """
+    Path of a source as recorded in a member index written to directory.
+
+    Args:
+        source (str): Path of the file holding the tar stream
+        directory (str): Absolute path of the directory of the index file
+
+    Returns:
+        str: The file name for sources inside directory, the absolute path otherwise
+    """
+    source = os.path.abspath(source)
+    if os.path.dirname(source) == directory:
+        return os.path.basename(source)
+    return source
+
+
+def write_member_index(index: dict[str, list] | pl.DataFrame, path: str) -> None:
+    """
+    Persist the member index as a Parquet file.
+
+    Args:
+        index (dict[str, list] | pl.DataFrame): Member index created by
+            `new_member_index`, or a DataFrame with the columns of `MEMBER_INDEX_SCHEMA`
+        path (str): Path of the Parquet file
+    """
+    index = pl.DataFrame(index, schema=MEMBER_INDEX_SCHEMA)
+    directory = os.path.dirname(os.path.abspath(path))
+    sources = {
+        source: _stored_source(source, directory)
+        for source in index["source"].drop_nulls().unique().to_list()
+    }
+    index.with_columns(pl.col("source").replace(sources)).write_parquet(path)
+
+
+def load_member_index(path: str, paths: list[str] | None = None) -> pl.DataFrame:
+    """
+    Load the member index of a tar archive.
+
+    Args:
+        path (str): Path of the Parquet file written by `write_member_index`
+        paths (list[str] | None): Only load the entries of these members
+
+    Returns:
+        pl.DataFrame: A DataFrame with the columns of `MEMBER_INDEX_SCHEMA`, with
+            every source turned into an absolute path. Indexes written before the
+            header metadata was recorded have null `HEADER_METADATA_COLUMNS`.
+    """
+    directory = os.path.dirname(os.path.abspath(path))
+    index = pl.scan_parquet(path)
+    if paths is not None:
+        index = index.filter(pl.col("path").is_in(paths))
+    columns = index.collect_schema().names()
+    return index.with_columns(
+        *(
+            pl.lit(None, dtype=MEMBER_INDEX_SCHEMA[column]).alias(column)
+            for column in HEADER_METADATA_COLUMNS
+            if column not in columns
+        ),
+        pl.when(pl.col("source").str.starts_with("/"))
+        .then(pl.col("source"))
+        .otherwise(pl.concat_str(pl.lit(directory + os.sep), pl.col("source")))
+        .alias("source"),
+    ).collect()
@@ -0,0 +1,110 @@
+import asyncio
+import time
+from collections.abc import Callable
+from .diffoscope_runner import DIFF_SKIPPED, DiffResult
+from .extractor import extract_files_from_tar
+from .profiling import StageTimes
+from .scheduler import TIME_BUDGET_EXHAUSTED
+
+DIFF_QUEUE_SIZE = 8  # Number of extracted files waiting for a diff worker per worker
+EXTRACT_BATCH_SIZE = 32  # Number of changed files extracted from each image at once
+
+
+async def diff_changed_files(
+    paths: list[str],
+    entry_1: str,
+    entry_2: str,
+    scratch_dir: str,
+    diff: Callable[[str, str, str, float | None], DiffResult],
+    times: StageTimes,
+    diff_jobs: int = 1,
+    timeout: float | None = None,
+    budget: float | None = None,
+) -> list[DiffResult]:
+    """
+    Extract changed files from both images and diff them, overlapping both stages.
+
+    Args:
+        paths (list[str]): Paths of the files that differ between the images, in
+            the order they are compared
+        entry_1 (str): Store entry of the first image, see `extractor.open_image`
+        entry_2 (str): Store entry of the second image, see `extractor.open_image`
+        scratch_dir (str): Temporary directory the changed files are extracted into
+        diff (Callable[[str, str, str, float | None], DiffResult]): Blocking function
+            called with the path of the file in the image, its two extracted copies
+            and the timeout of the comparison
+        times (StageTimes): Timings the "extract" and "diff" stages are added to
+        diff_jobs (int): Number of diffs running at the same time
+        timeout (float | None): Seconds a single diff may run
+        budget (float | None): Seconds all the diffs may run, counted from the call
+
+    Returns:
+        list[DiffResult]: One result per path, paths left when the budget is
+            exhausted are recorded as skipped
+
+    Files are extracted in batches (both images at the same time) and handed to the
+    diff workers through a bounded queue, so extraction stops running ahead, and
+    filling the scratch directory, when the diffs are slower.
+    """
+    queue: asyncio.Queue[str | None] = asyncio.Queue(
+        maxsize=diff_jobs * DIFF_QUEUE_SIZE
+    )
+    output_1 = f"{scratch_dir}/image_1"
+    output_2 = f"{scratch_dir}/image_2"
+    deadline = time.perf_counter() + budget if budget is not None else None
+    results: list[DiffResult] = []
+
+    def remaining() -> float | None:
+        return deadline - time.perf_counter() if deadline is not None else None
+
+    def skip(path: str) -> None:
+        results.append(DiffResult(path, DIFF_SKIPPED, message=TIME_BUDGET_EXHAUSTED))
+
+    async def extract() -> None:
+        for start in range(0, len(paths), EXTRACT_BATCH_SIZE):
+            batch = paths[start : start + EXTRACT_BATCH_SIZE]
+            left = remaining()
+            if left is not None and left <= 0:
+                for path in paths[start:]:
+                    skip(path)
+                break
+            await asyncio.gather(
+                times.run("extract", extract_files_from_tar, batch, entry_1, output_1),
+                times.run("extract", extract_files_from_tar, batch, entry_2, output_2),
+            )
+            for path in batch:
+                await queue.put(path)
+        for _ in range(diff_jobs):
+            await queue.put(None)
+
+    async def worker() -> None:
+        while (path := await queue.get()) is not None:
+            left = remaining()
+            if left is not None and left <= 0:
+                skip(path)
+                continue
+            file_timeout = timeout
+            if left is not None:
+                file_timeout = left if timeout is None else min(timeout, left)
+            results.append(
+                await times.run(
+                    "diff",
+                    diff,
+                    path,
+                    f"{output_1}/{path}",
+                    f"{output_2}/{path}",
+                    file_timeout,
+                    name=path,
+                )
+            )
+
+    tasks = [asyncio.create_task(extract())]
+    tasks.extend(asyncio.create_task(worker()) for _ in range(diff_jobs))
+    try:
+        await asyncio.gather(*tasks)
+    finally:
+        # When a stage fails the others would wait on the queue forever
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+    return results
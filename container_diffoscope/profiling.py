@@ -0,0 +1,217 @@
+import asyncio
+import json
+import os
+import resource
+import threading
+import time
+from collections.abc import Callable, Iterator
+from contextlib import contextmanager
+from typing import TypeVar
+
+T = TypeVar("T")
+
+
+class StageTimes:
+    """
+    Wall-clock time spent in each stage of a comparison.
+
+    Stages can overlap, a stage started several times (for example one per batch)
+    spans from its first start to its last end.
+
+    When profiling, every run of a stage is also recorded with the CPU time of the
+    thread it ran in, and can be written as a Chrome trace (see `write_trace`) next
+    to a summary of the stages and of their counters (see `metrics`). The CPU time
+    of the threads and processes a stage starts itself is only part of the totals.
+    """
+
+    def __init__(self, profile: bool = False):
+        self.stages: dict[str, tuple[float, float]] = {}
+        self.profile = profile
+        self.counters: dict[str, dict[str, float]] = {}
+        self.events: list[dict] = []
+        self._cpu: dict[str, float] = {}
+        self._runs: dict[str, int] = {}
+        self._threads: dict[int, str] = {}
+        self._lock = threading.Lock()
+        self._started = time.perf_counter()
+
+    @contextmanager
+    def measure(self, stage: str, name: str | None = None) -> Iterator[None]:
+        """
+        Record the time spent in the body of the context as part of a stage.
+
+        Args:
+            stage (str): Name of the stage
+            name (str | None): Name of this run in the trace (for example the file
+                it compares), defaults to the stage
+        """
+        start = time.perf_counter()
+        cpu_start = time.thread_time() if self.profile else 0.0
+        try:
+            yield
+        finally:
+            end = time.perf_counter()
+            with self._lock:
+                first_start, _ = self.stages.get(stage, (start, end))
+                self.stages[stage] = (min(first_start, start), end)
+                if self.profile:
+                    self._record(
+                        stage, name, start, end, time.thread_time() - cpu_start
+                    )
+
+    def _record(
+        self, stage: str, name: str | None, start: float, end: float, cpu: float
+    ) -> None:
+        thread = threading.get_ident()
+        self._threads.setdefault(thread, threading.current_thread().name)
+        self._cpu[stage] = self._cpu.get(stage, 0.0) + cpu
+        self._runs[stage] = self._runs.get(stage, 0) + 1
+        self.events.append(
+            {
+                "name": name or stage,
+                "cat": stage,
+                "ph": "X",
+                "ts": (start - self._started) * 1e6,
+                "dur": (end - start) * 1e6,
+                "pid": os.getpid(),
+                "tid": thread,
+                "args": {"cpu_ms": cpu * 1e3},
+            }
+        )
+
+    async def run(
+        self,
+        stage: str,
+        function: Callable[..., T],
+        *args,
+        name: str | None = None,
+    ) -> T:
+        """
+        Run a blocking function in a worker thread as part of a stage.
+
+        Args:
+            stage (str): Name of the stage
+            function (Callable[..., T]): Function to run
+            *args: Arguments of the function
+            name (str | None): Name of this run in the trace, see `measure`
+
+        Returns:
+            T: Value returned by the function
+        """
+
+        def measured() -> T:
+            with self.measure(stage, name):
+                return function(*args)
+
+        return await asyncio.to_thread(measured)
+
+    def count(self, stage: str, **values: float) -> None:
+        """
+        Add to the counters of a stage, reported by `metrics`.
+
+        Args:
+            stage (str): Name of the stage
+            **values (float): Amount added to each counter, "files" and "bytes" are
+                also reported per second of the stage
+        """
+        with self._lock:
+            counters = self.counters.setdefault(stage, {})
+            for counter, value in values.items():
+                counters[counter] = counters.get(counter, 0) + value
+
+    def _sorted_stages(self) -> list[tuple[str, tuple[float, float]]]:
+        return sorted(self.stages.items(), key=lambda item: item[1][0])
+
+    def report(self) -> str:
+        """
+        Format the stage timings, in the order the stages started.
+
+        Returns:
+            str: One line per stage with its wall-clock time and when it started
+        """
+        total = time.perf_counter() - self._started
+        lines = [
+            f"  {stage}: {end - start:.2f}s (started at +{start - self._started:.2f}s)"
+            for stage, (start, end) in self._sorted_stages()
+        ]
+        lines.append(f"  total: {total:.2f}s")
+        return "\n".join(lines)
+
+    def metrics(self) -> dict:
+        """
+        Summarize the stages and the resources used by the process.
+
+        Returns:
+            dict: Total wall-clock and CPU time (of the process and of the processes
+                it started, such as diffoscope), peak RSS, and per stage its
+                wall-clock time, counters and, when profiling, its CPU time, number
+                of runs and the duration of every named run
+        """
+        usage = resource.getrusage(resource.RUSAGE_SELF)
+        children = resource.getrusage(resource.RUSAGE_CHILDREN)
+        named_runs: dict[str, list[dict]] = {}
+        for event in self.events:
+            if event["name"] != event["cat"]:
+                named_runs.setdefault(event["cat"], []).append(
+                    {"name": event["name"], "seconds": event["dur"] / 1e6}
+                )
+        stages = {}
+        for stage, (start, end) in self._sorted_stages():
+            wall = end - start
+            counters = self.counters.get(stage, {})
+            summary: dict = {
+                "started_at": start - self._started,
+                "wall_seconds": wall,
+                **counters,
+            }
+            for counter in ("files", "bytes"):
+                if counter in counters and wall > 0:
+                    summary[f"{counter}_per_second"] = counters[counter] / wall
+            if self.profile:
+                summary["cpu_seconds"] = self._cpu.get(stage, 0.0)
+                summary["runs"] = self._runs.get(stage, 0)
+            if stage in named_runs:
+                summary["named_runs"] = named_runs[stage]
+            stages[stage] = summary
+        return {
+            "wall_seconds": time.perf_counter() - self._started,
+            "cpu_seconds": usage.ru_utime + usage.ru_stime,
+            "children_cpu_seconds": children.ru_utime + children.ru_stime,
+            "peak_rss_mb": usage.ru_maxrss / 1024,
+            "stages": stages,
+        }
+
+    def write_metrics(self, path: str) -> None:
+        """
+        Write the summary returned by `metrics` as JSON.
+
+        Args:
+            path (str): Path of the JSON file
+        """
+        with open(path, "w") as metrics_file:
+            json.dump(self.metrics(), metrics_file, indent=2)
+
+    def write_trace(self, path: str) -> None:
+        """
+        Write the runs recorded while profiling in the Chrome trace event format,
+        which Perfetto and chrome://tracing open.
+
+        Args:
+            path (str): Path of the JSON file
+        """
+        pid = os.getpid()
+        threads = [
+            {
+                "name": "thread_name",
+                "ph": "M",
+                "pid": pid,
+                "tid": tid,
+                "args": {"name": name},
+            }
+            for tid, name in self._threads.items()
+        ]
+        with open(path, "w") as trace_file:
+            json.dump(
+                {"traceEvents": threads + self.events, "displayTimeUnit": "ms"},
+                trace_file,
+            )
@@ -0,0 +1,281 @@
+import os
+import tarfile
+from dataclasses import dataclass
+import polars as pl
+from .extractor import FILE_TYPES, extract_members
+from .globs import PathFilter
+from .hasher import HASH_BLOCK_SIZE, hash_stream
+from .manifest import DEFAULT_HASH_ALGORITHM, MANIFEST_SCHEMA
+from .member_index import HEADER_METADATA_COLUMNS, load_member_index
+
+HEADER_SCHEMA = {
+    "path": pl.String,
+    "size": pl.UInt64,
+    "mode": pl.UInt32,
+    "uid": pl.UInt32,
+    "gid": pl.UInt32,
+    "mtime": pl.Int64,
+    "linkname": pl.String,
+}
+
+_HARD_LINK = tarfile.LNKTYPE.decode()
+
+
+@dataclass(frozen=True)
+class QuickComparison:
+    """
+    Differences between two images found from their tar headers.
+
+    Attributes:
+        common (int): Number of files with the same content in both images
+        changed (pl.DataFrame): Files whose content changed, with a path column
+        only_in_1 (pl.DataFrame): Files only in the first image
+        only_in_2 (pl.DataFrame): Files only in the second image
+        metadata_changes (pl.DataFrame): Files with the same content but another
+            mode or owner, see `metadata_changes`
+        hashed (int): Number of files whose headers were ambiguous and that were
+            hashed in both images
+    """
+
+    common: int
+    changed: pl.DataFrame
+    only_in_1: pl.DataFrame
+    only_in_2: pl.DataFrame
+    metadata_changes: pl.DataFrame
+    hashed: int
+
+
+def load_headers(
+    index_path: str, path_filter: PathFilter | None = None
+) -> pl.DataFrame:
+    """
+    Build a manifest of the files of an image from the headers in its member index.
+
+    Args:
+        index_path (str): Path of the member index, see `member_index.add_member`
+        path_filter (PathFilter | None): Files that are listed
+
+    Returns:
+        pl.DataFrame: One row per file with the columns of `HEADER_SCHEMA`, hard links
+            carry the size, mode, owner and modification time of their target
+    """
+    index = load_member_index(index_path).filter(pl.col("type").is_in(FILE_TYPES))
+    links = index.filter(pl.col("type") == _HARD_LINK)
+    files = index.filter(pl.col("type") != _HARD_LINK)
+    targets = files.unique("path", keep="last").select(
+        pl.col("path").alias("linkname"), "size", *HEADER_METADATA_COLUMNS
+    )
+    resolved = links.select("path", "linkname").join(targets, on="linkname")
+    headers = pl.concat(
+        [files.select(list(HEADER_SCHEMA)), resolved.select(list(HEADER_SCHEMA))]
+    ).unique("path", keep="last")
+    if path_filter is not None:
+        headers = headers.filter(
+            pl.Series([path_filter.keeps(path) for path in headers["path"]])
+        )
+    return headers.sort("path")
+
+
+def metadata_changes(files: pl.DataFrame) -> pl.DataFrame:
+    """
+    Select the files whose mode or owner differ between two images.
+
+    Args:
+        files (pl.DataFrame): Files of both images joined on path, with the mode,
+            uid and gid columns of the first image and the same columns suffixed
+            with "_2" for the second one
+
+    Returns:
+        pl.DataFrame: path, mode, mode_2, uid, uid_2, gid, gid_2 and change columns,
+            change being "mode", "owner" or "mode, owner"
+    """
+    mode_changed = ~pl.col("mode").eq_missing(pl.col("mode_2"))
+    owner_changed = ~(
+        pl.col("uid").eq_missing(pl.col("uid_2"))
+        & pl.col("gid").eq_missing(pl.col("gid_2"))
+    )
+    return (
+        files.filter(mode_changed | owner_changed)
+        .select(
+            "path",
+            "mode",
+            "mode_2",
+            "uid",
+            "uid_2",
+            "gid",
+            "gid_2",
+            pl.when(mode_changed & owner_changed)
+            .then(pl.lit("mode, owner"))
+            .when(mode_changed)
+            .then(pl.lit("mode"))
+            .otherwise(pl.lit("owner"))
+            .alias("change"),
+        )
+        .sort("path")
+    )
+
+
+def compare_headers(
+    headers_1: pl.DataFrame, headers_2: pl.DataFrame
+) -> tuple[pl.DataFrame, pl.DataFrame, pl.DataFrame, pl.DataFrame, pl.DataFrame]:
+    """
+    Classify the files of two images from their tar headers alone.
+
+    Args:
+        headers_1 (pl.DataFrame): Headers of the first image, see `load_headers`
+        headers_2 (pl.DataFrame): Headers of the second image
+
+    Returns:
+        tuple containing:
+            - common (pl.DataFrame): Files with the same size, modification time and
+              link target, assumed to have the same content
+            - ambiguous (pl.DataFrame): Files with the same size but another
+              modification time or link target, only a hash can tell
+            - changed (pl.DataFrame): Files whose size changed
+            - only_in_1 (pl.DataFrame): Files only in the first image
+            - only_in_2 (pl.DataFrame): Files only in the second image
+        The first three have the columns of both images, suffixed with "_2" for
+        the second one.
+    """
+    both = headers_1.join(headers_2, on="path", suffix="_2")
+    same_size = pl.col("size").eq_missing(pl.col("size_2"))
+    same_header = pl.col("mtime").eq_missing(pl.col("mtime_2")) & pl.col(
+        "linkname"
+    ).eq_missing(pl.col("linkname_2"))
+    return (
+        both.filter(same_size & same_header),
+        both.filter(same_size & ~same_header),
+        both.filter(~same_size),
+        headers_1.join(headers_2, on="path", how="anti"),
+        headers_2.join(headers_1, on="path", how="anti"),
+    )
+
+
+def hash_members(
+    index_path: str,
+    paths: list[str],
+    scratch_dir: str,
+    algorithm: str = DEFAULT_HASH_ALGORITHM,
+) -> pl.DataFrame:
+    """
+    Hash a few files of an image, reading them with its member index.
+
+    Args:
+        index_path (str): Path of the member index of the image
+        paths (list[str]): Paths of the files that should be hashed
+        scratch_dir (str): Temporary directory the files are extracted into, each
+            one is removed once hashed
+        algorithm (str): One of `manifest.HashAlgorithm`
+
+    Returns:
+        pl.DataFrame: Manifest of the files, see `manifest.MANIFEST_SCHEMA`
+    """
+    extract_members(index_path, paths, scratch_dir)
+    manifest: dict[str, list] = {column: [] for column in MANIFEST_SCHEMA}
+    buffer = memoryview(bytearray(HASH_BLOCK_SIZE))
+    for path in paths:
+        file_path = os.path.join(scratch_dir, path)
+        if not os.path.isfile(file_path):
+            continue
+        with open(file_path, "rb") as extracted:
+            manifest["hash"].append(hash_stream(extracted, buffer, algorithm))
+        manifest["path"].append(path)
+        os.remove(file_path)
+    return pl.DataFrame(manifest, schema=MANIFEST_SCHEMA)
+
+
+def quick_compare(
+    index_path_1: str,
+    index_path_2: str,
+    scratch_dir: str,
+    path_filter: PathFilter | None = None,
+    algorithm: str = DEFAULT_HASH_ALGORITHM,
+) -> QuickComparison:
+    """
+    Compare two images from their tar headers, hashing only the ambiguous files.
+
+    Args:
+        index_path_1 (str): Member index of the first image
+        index_path_2 (str): Member index of the second image
+        scratch_dir (str): Temporary directory the ambiguous files are extracted into
+        path_filter (PathFilter | None): Files that are compared
+        algorithm (str): One of `manifest.HashAlgorithm`, the ambiguous files are
+            hashed with
+
+    Returns:
+        QuickComparison: The differences between the images
+
+    Files whose size changed are changed, files with the same size, modification
+    time and link target are assumed unchanged. The others (same size but touched)
+    are hashed in both images to decide. A file with the same content but another
+    mode or owner is reported in `QuickComparison.metadata_changes`.
+    """
+    common, ambiguous, changed, only_in_1, only_in_2 = compare_headers(
+        load_headers(index_path_1, path_filter),
+        load_headers(index_path_2, path_filter),
+    )
+    paths = ambiguous["path"].to_list()
+    hashes_1, hashes_2 = (
+        hash_members(index_path, paths, os.path.join(scratch_dir, name), algorithm)
+        for index_path, name in ((index_path_1, "image_1"), (index_path_2, "image_2"))
+    )
+    verified = ambiguous.join(hashes_1, on="path", how="left").join(
+        hashes_2, on="path", how="left", suffix="_2"
+    )
+    # Files whose content was not kept (streamed images) can not be told identical
+    same_content = (pl.col("hash") == pl.col("hash_2")).fill_null(False)
+    unchanged = pl.concat(
+        [common, verified.filter(same_content).drop("hash", "hash_2")]
+    )
+    changed = pl.concat(
+        [changed, verified.filter(~same_content).drop("hash", "hash_2")]
+    ).sort("path")
+    return QuickComparison(
+        len(unchanged),
+        changed,
+        only_in_1,
+        only_in_2,
+        metadata_changes(unchanged),
+        len(paths),
+    )
+
+
+def find_metadata_changes(
+    index_path_1: str, index_path_2: str, common_files: pl.LazyFrame
+) -> pl.DataFrame:
+    """
+    Find the files with the same content but another mode or owner.
+
+    Args:
+        index_path_1 (str): Member index of the first image
+        index_path_2 (str): Member index of the second image
+        common_files (pl.LazyFrame): Files with the same hash in both images, with
+            a path column, see `comparator.compare_file_lists`
+
+    Returns:
+        pl.DataFrame: The files whose mode or owner changed, see `metadata_changes`
+    """
+    return compare_metadata(
+        load_headers(index_path_1), load_headers(index_path_2), common_files
+    )
+
+
+def compare_metadata(
+    headers_1: pl.DataFrame, headers_2: pl.DataFrame, common_files: pl.LazyFrame
+) -> pl.DataFrame:
+    """
+    Find the files with the same content but another mode or owner from headers
+    already loaded.
+
+    Args:
+        headers_1 (pl.DataFrame): Headers of the first image, see `load_headers`
+        headers_2 (pl.DataFrame): Headers of the second image
+        common_files (pl.LazyFrame): Files with the same hash in both images
+
+    Returns:
+        pl.DataFrame: The files whose mode or owner changed, see `metadata_changes`
+    """
+    files = headers_1.join(headers_2, on="path", suffix="_2")
+    return metadata_changes(
+        files.join(common_files.select("path").collect(), on="path", how="semi")
+    )
@@ -0,0 +1,123 @@
+import os
+from collections.abc import Mapping
+from enum import Enum
+import polars as pl
+from .diffoscope_runner import DiffResult
+
+REPORT_DIR = "report"  # Machine-readable lists of the files, at the top of export_dir
+DIFF_INDEX = "diffs"  # Name of the index of the detailed comparisons in REPORT_DIR
+DIFF_INDEX_SCHEMA = {
+    "path": pl.String,
+    "status": pl.String,
+    "output": pl.String,
+    "duration": pl.Float64,
+    "message": pl.String,
+}
+
+
+class ReportFormat(str, Enum):
+    """File format of the machine-readable report."""
+
+    ndjson = "ndjson"
+    parquet = "parquet"
+    json = "json"
+
+
+DEFAULT_REPORT_FORMAT = ReportFormat.ndjson.value
+
+
+def write_frame(
+    frame: pl.DataFrame | pl.LazyFrame, path: str, report_format: str
+) -> None:
+    """
+    Write a list of files in one of the report formats.
+
+    Args:
+        frame (pl.DataFrame | pl.LazyFrame): Files to write, a LazyFrame is streamed
+            to the file unless the format is JSON
+        path (str): Path of the file
+        report_format (str): One of `ReportFormat`, binary digests are written as
+            hex strings in the text formats
+
+    Raises:
+        ValueError: If the format is unknown
+    """
+    if report_format == ReportFormat.parquet:
+        if isinstance(frame, pl.DataFrame):
+            frame.write_parquet(path)
+        else:
+            frame.sink_parquet(path)
+        return
+    lazy = frame.lazy().with_columns(pl.col(pl.Binary).bin.encode("hex"))
+    if report_format == ReportFormat.ndjson:
+        lazy.sink_ndjson(path)
+    elif report_format == ReportFormat.json:
+        # A JSON document is a single array, it is built in memory
+        lazy.collect().write_json(path)
+    else:
+        raise ValueError(
+            f"Unknown report format {report_format}, expected one of "
+            f"{[report_format.value for report_format in ReportFormat]}"
+        )
+
+
+def diff_index(results: list[DiffResult], export_dir: str) -> pl.DataFrame:
+    """
+    Build the index of the detailed comparisons.
+
+    Args:
+        results (list[DiffResult]): Results of the changed files
+        export_dir (str): Directory where the comparison markdown files are saved
+
+    Returns:
+        pl.DataFrame: One row per changed file sorted by path, with the columns of
+            `DIFF_INDEX_SCHEMA` and the comparison file relative to export_dir
+    """
+    # Comparisons are written under export_dir, see `diff_output_path`
+    return (
+        pl.DataFrame(
+            {
+                "path": [result.path for result in results],
+                "status": [result.status for result in results],
+                "output": [result.output for result in results],
+                "duration": [result.duration for result in results],
+                "message": [result.message for result in results],
+            },
+            schema=DIFF_INDEX_SCHEMA,
+        )
+        .with_columns(pl.col("output").str.strip_prefix(os.path.join(export_dir, "")))
+        .sort("path")
+    )
+
+
+def write_report(
+    categories: Mapping[str, pl.DataFrame | pl.LazyFrame],
+    results: list[DiffResult] | None,
+    export_dir: str,
+    report_format: str = DEFAULT_REPORT_FORMAT,
+) -> str:
+    """
+    Write every category of files of a comparison and the index of its detailed
+    comparisons, one file each.
+
+    Args:
+        categories (Mapping[str, pl.DataFrame | pl.LazyFrame]): Files of each category
+            (for example "changed" or "only_in_1"), keyed by the file name they are
+            written to
+        results (list[DiffResult] | None): Results of the changed files, written to
+            `DIFF_INDEX`, None when no detailed comparison was run
+        export_dir (str): Directory where the comparison markdown files are saved
+        report_format (str): One of `ReportFormat`
+
+    Returns:
+        str: The `REPORT_DIR` directory holding the files
+    """
+    report_dir = os.path.join(export_dir, REPORT_DIR)
+    os.makedirs(report_dir, exist_ok=True)
+    if results is not None:
+        categories = {**categories, DIFF_INDEX: diff_index(results, export_dir)}
+    for name, frame in categories.items():
+        write_frame(
+            frame, os.path.join(report_dir, f"{name}.{report_format}"), report_format
+        )
+    return report_dir
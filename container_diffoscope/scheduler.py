@@ -0,0 +1,159 @@
+import re
+from dataclasses import dataclass
+import polars as pl
+from .cache import parse_size
+from .diff_cache import ChangeGroup
+from .diffoscope_runner import DIFF_SKIPPED, DiffResult
+from .globs import glob_to_regex
+
+DEFAULT_PRIORITY_GLOBS = ("/etc/**",)
+# Compiled or packed files, slow to compare and rarely reviewed line by line
+LOW_PRIORITY_SUFFIXES = (
+    ".a",
+    ".bz2",
+    ".db",
+    ".gz",
+    ".jar",
+    ".o",
+    ".pyc",
+    ".so",
+    ".sqlite",
+    ".whl",
+    ".xz",
+    ".zip",
+    ".zst",
+)
+
+TIME_BUDGET_EXHAUSTED = "time budget exhausted"
+BYTE_BUDGET_EXHAUSTED = "byte budget exhausted"
+TIME_UNITS = {"s": 1, "sec": 1, "min": 60, "h": 3600}
+
+
+@dataclass(frozen=True)
+class DiffBudget:
+    """
+    Limits of the detailed comparisons of a run, None for no limit.
+
+    Attributes:
+        seconds (float | None): Wall-clock time all the comparisons may take
+        bytes (int | None): Total size of the compared files (both copies)
+    """
+
+    seconds: float | None = None
+    bytes: int | None = None
+
+
+def parse_budget(budget: str) -> DiffBudget:
+    """
+    Parse a diff budget given as a duration, a size or both.
+
+    Args:
+        budget (str): Comma separated limits, each with an explicit unit: a duration
+            in seconds, minutes or hours ("90s", "5min", "1h") or a size in bytes
+            ("100B", "500MiB", "2GiB"), "0" for no limit
+
+    Returns:
+        DiffBudget: The parsed limits
+
+    Raises:
+        ValueError: If a limit has no unit or an ambiguous one, such as "300" or
+            "5m" (minutes or MiB)
+    """
+    seconds = None
+    size = None
+    for limit in filter(None, (part.strip() for part in budget.split(","))):
+        if limit == "0":
+            continue
+        match = re.fullmatch(r"([0-9.]+)\s*(s|sec|min|h)", limit.lower())
+        if match is not None:
+            seconds = float(match.group(1)) * TIME_UNITS[match.group(2)] or None
+        elif re.fullmatch(r"[0-9.]+\s*([kmgt]i?)?b", limit.lower()):
+            size = parse_size(limit) or None
+        else:
+            raise ValueError(
+                f"Invalid budget {limit!r}, expected a duration (90s, 5min, 1h) or "
+                "a size (100B, 500MiB, 2GiB)"
+            )
+    return DiffBudget(seconds, size)
+
+
+def rank_changed_files(
+    changed_files: pl.DataFrame,
+    sizes: pl.DataFrame,
+    priority_globs: list[str] | tuple[str, ...] = DEFAULT_PRIORITY_GLOBS,
+) -> pl.DataFrame:
+    """
+    Order the changed files by the priority of their comparison.
+
+    Args:
+        changed_files (pl.DataFrame): Changed files with the hash, path and hash_2
+            columns, see `comparator.compare_file_lists`
+        sizes (pl.DataFrame): Sizes of the files in both images, with the path and
+            size columns, see `member_index.load_member_index`
+        priority_globs (list[str] | tuple[str, ...]): Globs matched against
+            "/<path>", see `globs.glob_to_regex`, earlier ones rank first
+
+    Returns:
+        pl.DataFrame: changed_files with a `cost` column (bytes read by the
+            comparison), sorted by matching glob, then with compiled or packed files
+            last, then by increasing cost
+    """
+    path = pl.concat_str(pl.lit("/"), pl.col("path"))
+    priority = pl.lit(len(priority_globs), dtype=pl.UInt32)
+    for rank, pattern in reversed(list(enumerate(priority_globs))):
+        priority = (
+            pl.when(path.str.contains(glob_to_regex(pattern)))
+            .then(pl.lit(rank, dtype=pl.UInt32))
+            .otherwise(priority)
+        )
+    costs = sizes.group_by("path").agg(pl.col("size").sum().alias("cost"))
+    return (
+        changed_files.join(costs, on="path", how="left")
+        .with_columns(
+            pl.col("cost").fill_null(0),
+            priority.alias("_priority"),
+            pl.any_horizontal(
+                pl.col("path").str.to_lowercase().str.ends_with(suffix)
+                for suffix in LOW_PRIORITY_SUFFIXES
+            ).alias("_packed"),
+        )
+        .sort("_priority", "_packed", "cost", "path", maintain_order=True)
+        .drop("_priority", "_packed")
+    )
+
+
+def apply_byte_budget(
+    groups: list[ChangeGroup], costs: dict[str, int], max_bytes: int | None
+) -> tuple[list[ChangeGroup], list[DiffResult]]:
+    """
+    Keep the groups whose comparisons fit in the byte budget, in priority order.
+
+    Args:
+        groups (list[ChangeGroup]): Changes to compare, highest priority first
+        costs (dict[str, int]): Bytes read by the comparison of each path
+        max_bytes (int | None): Byte budget, None for no limit
+
+    Returns:
+        tuple containing:
+            - scheduled (list[ChangeGroup]): Groups to compare
+            - skipped (list[DiffResult]): Skipped result of the first path of every
+              other group, see `diff_cache.fan_out`
+
+    A change too big for the rest of the budget is skipped, smaller changes of lower
+    priority are still compared when they fit.
+    """
+    if max_bytes is None:
+        return groups, []
+    scheduled = []
+    skipped = []
+    used = 0
+    for group in groups:
+        cost = costs.get(group.path, 0)
+        if used + cost > max_bytes:
+            skipped.append(
+                DiffResult(group.path, DIFF_SKIPPED, message=BYTE_BUDGET_EXHAUSTED)
+            )
+            continue
+        used += cost
+        scheduled.append(group)
+    return scheduled, skipped
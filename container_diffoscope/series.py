@@ -0,0 +1,97 @@
+import polars as pl
+from .comparator import compare_manifest_trees
+
+HISTORY_EVENT = pl.Enum(["added", "changed", "removed"])
+HISTORY_FILE = "history.parquet"
+
+
+def series_pairs(count: int, all_pairs: bool = False) -> list[tuple[int, int]]:
+    """
+    Pairs of positions compared in a series of images.
+
+    Args:
+        count (int): Number of images in the series
+        all_pairs (bool): Compare every pair instead of consecutive images only
+
+    Returns:
+        list[tuple[int, int]]: Positions (earlier, later) of the compared images
+    """
+    if all_pairs:
+        return [(i, j) for i in range(count) for j in range(i + 1, count)]
+    return [(i, i + 1) for i in range(count - 1)]
+
+
+def transition_events(
+    changed_files: pl.DataFrame, only_in_1: pl.DataFrame, only_in_2: pl.DataFrame
+) -> pl.DataFrame:
+    """
+    Events of the files between two consecutive images of a series.
+
+    Args:
+        changed_files (pl.DataFrame): Files whose content changed
+        only_in_1 (pl.DataFrame): Files only in the earlier image
+        only_in_2 (pl.DataFrame): Files only in the later image
+
+    Returns:
+        pl.DataFrame: path and event columns, see `HISTORY_EVENT`
+    """
+    return pl.concat(
+        df.select("path", pl.lit(event, dtype=HISTORY_EVENT).alias("event"))
+        for df, event in (
+            (only_in_2, "added"),
+            (changed_files, "changed"),
+            (only_in_1, "removed"),
+        )
+    )
+
+
+def build_history(
+    manifests: list[pl.DataFrame], trees: list[pl.DataFrame], labels: list[str]
+) -> pl.DataFrame:
+    """
+    Build the history of every file that appeared, changed or disappeared in a series.
+
+    Args:
+        manifests (list[pl.DataFrame]): Manifest of each image, in series order
+        trees (list[pl.DataFrame]): Merkle tree of each manifest, see
+            `comparator.build_merkle_tree`
+        labels (list[str]): Name of each image, used as column names
+
+    Returns:
+        pl.DataFrame: One row per path with an event, a path column then one column
+            per image after the first with the event of the path between the
+            previous image and that one (null when the file did not change)
+
+    Only consecutive images are compared, so building the history of N images
+    takes N - 1 comparisons. Files identical in every image are not listed.
+    """
+    if len(set(labels)) != len(labels):
+        raise ValueError("The images of a series must be different")
+    events = []
+    for position in range(1, len(manifests)):
+        _, changed_files, only_in_1, only_in_2 = compare_manifest_trees(
+            manifests[position - 1],
+            trees[position - 1],
+            manifests[position],
+            trees[position],
+        )
+        events.append(
+            transition_events(changed_files, only_in_1, only_in_2).with_columns(
+                pl.lit(labels[position]).alias("image")
+            )
+        )
+    columns = labels[1:]
+    if not events:
+        return pl.DataFrame(
+            schema={"path": pl.String, **dict.fromkeys(columns, HISTORY_EVENT)}
+        )
+    history = pl.concat(events).pivot(on="image", index="path", values="event")
+    return (
+        history.with_columns(
+            pl.lit(None, dtype=HISTORY_EVENT).alias(label)
+            for label in columns
+            if label not in history.columns
+        )
+        .select("path", *columns)
+        .sort("path")
+    )
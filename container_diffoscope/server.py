@@ -0,0 +1,334 @@
+import http.client
+import json
+import os
+import socket
+import socketserver
+import threading
+from collections import OrderedDict
+from collections.abc import Callable
+from dataclasses import dataclass
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import polars as pl
+from .comparator import build_merkle_tree
+from .extractor import INDEX_FILE, MANIFEST_FILE, load_tree
+from .manifest import load_manifest
+from .quick import load_headers
+
+DEFAULT_SERVE_PORT = 8470
+DEFAULT_WARM_CACHE_SIZE = "2G"  # Memory taken by the manifests kept between jobs
+DEFAULT_MAX_JOBS = 2  # Comparisons running at the same time
+DEFAULT_MAX_QUEUED = 16  # Comparisons waiting for a slot, more are refused
+
+
+@dataclass(frozen=True)
+class WarmEntry:
+    """
+    Frames of a store entry kept in memory between comparisons.
+
+    Attributes:
+        manifest (pl.DataFrame): Hash and path of every file, see
+            `manifest.load_manifest`
+        tree (pl.DataFrame): Hash of every directory, see
+            `comparator.build_merkle_tree`
+        headers (pl.DataFrame): Size, mode and owner of every file from the member
+            index, see `quick.load_headers`
+    """
+
+    manifest: pl.DataFrame
+    tree: pl.DataFrame
+    headers: pl.DataFrame
+
+    @property
+    def size(self) -> int:
+        """Estimated memory taken by the frames, in bytes."""
+        return sum(
+            int(frame.estimated_size())
+            for frame in (self.manifest, self.tree, self.headers)
+        )
+
+
+def load_warm_entry(entry_dir: str) -> WarmEntry:
+    """
+    Load the frames of a store entry.
+
+    Args:
+        entry_dir (str): Directory of the entry, see `extractor.open_image`
+
+    Returns:
+        WarmEntry: The manifest, Merkle tree and headers of the entry, the tree is
+            built when the entry was stored before trees were added
+    """
+    manifest = load_manifest(os.path.join(entry_dir, MANIFEST_FILE))
+    tree = load_tree(entry_dir)
+    return WarmEntry(
+        manifest,
+        build_merkle_tree(manifest) if tree is None else tree,
+        load_headers(os.path.join(entry_dir, INDEX_FILE)),
+    )
+
+
+class WarmCache:
+    """
+    Least recently used store entries, with their frames loaded in memory.
+
+    Entries are keyed by their directory and the modification time of their
+    manifest, so an entry evicted from the store and stored again is loaded again.
+    """
+
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._entries: OrderedDict[tuple[str, int], WarmEntry] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, entry_dir: str) -> WarmEntry:
+        """
+        Get the frames of a store entry, loading them when they are not in memory.
+
+        Args:
+            entry_dir (str): Directory of the entry, pinned by the caller
+
+        Returns:
+            WarmEntry: The frames of the entry
+
+        The least recently used entries are dropped until the cache fits in
+        max_bytes, the entry returned is always kept.
+        """
+        key = (entry_dir, os.stat(os.path.join(entry_dir, MANIFEST_FILE)).st_mtime_ns)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry
+            self.misses += 1
+        # Loading is not locked, two jobs missing the same entry both load it
+        entry = load_warm_entry(entry_dir)
+        with self._lock:
+            self._entries[key] = entry
+            self._entries.move_to_end(key)
+            while len(self._entries) > 1 and self.size() > self.max_bytes:
+                self._entries.popitem(last=False)
+        return entry
+
+    def size(self) -> int:
+        """Estimated memory taken by the entries, in bytes."""
+        return sum(entry.size for entry in self._entries.values())
+
+    def stats(self) -> dict[str, int]:
+        """
+        Describe the content of the cache.
+
+        Returns:
+            dict[str, int]: Number of entries, their estimated size in bytes, and
+                the hits and misses since the cache was created
+        """
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "bytes": self.size(),
+                "hits": self.hits,
+                "misses": self.misses,
+            }
+
+
+class QueueFullError(Exception):
+    """Raised when a job is submitted while the queue of waiting jobs is full."""
+
+
+class ComparisonService:
+    """
+    Run the comparisons submitted to the daemon, a limited number at a time.
+
+    Jobs beyond max_jobs wait for a slot, and are refused with `QueueFullError`
+    once max_queued jobs are already waiting.
+    """
+
+    def __init__(
+        self,
+        run_job: Callable[[dict], dict],
+        warm_cache: WarmCache,
+        max_jobs: int = DEFAULT_MAX_JOBS,
+        max_queued: int = DEFAULT_MAX_QUEUED,
+    ):
+        self.run_job = run_job
+        self.warm_cache = warm_cache
+        self.max_jobs = max_jobs
+        self.max_queued = max_queued
+        self._counts = {"queued": 0, "running": 0, "completed": 0, "failed": 0}
+        self._lock = threading.Lock()
+        self._slots = threading.Semaphore(max_jobs)
+
+    def _add(self, **changes: int) -> None:
+        with self._lock:
+            for name, change in changes.items():
+                self._counts[name] += change
+
+    def submit(self, job: dict) -> dict:
+        """
+        Run a job once a slot is free.
+
+        Args:
+            job (dict): Parameters of the comparison, passed to run_job
+
+        Returns:
+            dict: Result of run_job
+
+        Raises:
+            QueueFullError: If max_queued jobs are already waiting
+        """
+        if not self._slots.acquire(blocking=False):
+            with self._lock:
+                if self._counts["queued"] >= self.max_queued:
+                    raise QueueFullError(f"{self.max_queued} jobs are already waiting")
+                self._counts["queued"] += 1
+            try:
+                self._slots.acquire()
+            finally:
+                self._add(queued=-1)
+        self._add(running=1)
+        outcome = "failed"
+        try:
+            result = self.run_job(job)
+            outcome = "completed"
+            return result
+        finally:
+            # Also reached on BaseException, so a cancelled job frees its slot
+            self._add(running=-1, **{outcome: 1})
+            self._slots.release()
+
+    def status(self) -> dict:
+        """
+        Describe the jobs and the warm cache of the daemon.
+
+        Returns:
+            dict: Jobs waiting, running, completed and failed, the limits, and the
+                statistics of the warm cache, see `WarmCache.stats`
+        """
+        with self._lock:
+            counts = dict(self._counts)
+        return {
+            **counts,
+            "max_jobs": self.max_jobs,
+            "max_queued": self.max_queued,
+            "warm_cache": self.warm_cache.stats(),
+        }
+
+
+class _Handler(BaseHTTPRequestHandler):
+    """
+    JSON API of the daemon: GET /status, and POST /compare with the job as body.
+    """
+
+    def address_string(self) -> str:
+        # Clients of a Unix socket have no address
+        return self.client_address[0] if self.client_address else "unix"
+
+    def _reply(self, status: int, body: dict) -> None:
+        payload = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def do_GET(self) -> None:
+        service: ComparisonService = getattr(self.server, "service")
+        if self.path == "/status":
+            self._reply(200, service.status())
+        else:
+            self._reply(404, {"error": f"Unknown path {self.path}"})
+
+    def do_POST(self) -> None:
+        service: ComparisonService = getattr(self.server, "service")
+        if self.path != "/compare":
+            self._reply(404, {"error": f"Unknown path {self.path}"})
+            return
+        try:
+            length = int(self.headers.get("Content-Length", 0))
+            job = json.loads(self.rfile.read(length))
+            if not isinstance(job, dict):
+                raise ValueError("The job must be a JSON object")
+            result = service.submit(job)
+        except QueueFullError as error:
+            self._reply(503, {"error": str(error)})
+        except (ValueError, KeyError, TypeError) as error:
+            self._reply(400, {"error": f"Invalid job: {error}"})
+        except Exception as error:
+            self._reply(500, {"error": f"{type(error).__name__}: {error}"})
+        else:
+            self._reply(200, result)
+
+
+class _UnixHTTPServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+
+def make_server(
+    service: ComparisonService,
+    host: str = "127.0.0.1",
+    port: int = DEFAULT_SERVE_PORT,
+    socket_path: str | None = None,
+) -> socketserver.TCPServer:
+    """
+    Create the HTTP server of the daemon, each request is handled in its own thread.
+
+    Args:
+        service (ComparisonService): Service running the submitted jobs
+        host (str): Address the server listens on
+        port (int): Port the server listens on, 0 picks a free one
+        socket_path (str | None): Unix socket to listen on instead of host and port,
+            replaced when it exists
+
+    Returns:
+        socketserver.TCPServer: The server, run with `serve_forever`
+    """
+    if socket_path is not None:
+        if os.path.exists(socket_path):
+            os.remove(socket_path)
+        server = _UnixHTTPServer(socket_path, _Handler)
+    else:
+        server = ThreadingHTTPServer((host, port), _Handler)
+    setattr(server, "service", service)
+    return server
+
+
+class _UnixHTTPConnection(http.client.HTTPConnection):
+    def __init__(self, socket_path: str, timeout: float | None):
+        super().__init__("localhost", timeout=timeout)
+        self.socket_path = socket_path
+
+    def connect(self) -> None:
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.sock.settimeout(self.timeout)
+        self.sock.connect(self.socket_path)
+
+
+def request_daemon(
+    address: str, method: str, path: str, body: dict | None = None
+) -> tuple[int, dict]:
+    """
+    Send a request to a running daemon.
+
+    Args:
+        address (str): "host:port" of the daemon, or the path of its Unix socket
+        method (str): "GET" or "POST"
+        path (str): "/status" or "/compare"
+        body (dict | None): Job sent as JSON
+
+    Returns:
+        tuple[int, dict]: HTTP status and JSON body of the reply
+    """
+    if os.sep in address:
+        connection = _UnixHTTPConnection(address, timeout=None)
+    else:
+        host, _, port = address.rpartition(":")
+        connection = http.client.HTTPConnection(host, int(port), timeout=None)
+    try:
+        payload = json.dumps(body).encode() if body is not None else None
+        connection.request(method, path, payload, {"Content-Type": "application/json"})
+        response = connection.getresponse()
+        return response.status, json.loads(response.read())
+    finally:
+        connection.close()
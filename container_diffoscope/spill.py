@@ -0,0 +1,124 @@
+import hashlib
+import tarfile
+from dataclasses import dataclass
+from functools import cached_property
+from .cache import parse_size
+from .globs import PathFilter
+from .scheduler import LOW_PRIORITY_SUFFIXES
+
+SPILL_FILE = "spill.tar"  # Payloads kept while an image is read from a stream
+DEFAULT_SPILL_MAX_SIZE = "8M"  # Larger files are hashed but not kept
+PAYLOAD_NOT_KEPT = "content not kept when the image was streamed"
+
+
+@dataclass(frozen=True)
+class SpillPolicy:
+    """
+    Files whose content is kept when an image is read from a stream, so they can
+    still be compared in detail once the stream is gone.
+
+    Attributes:
+        max_size (int): Size of the largest file kept, in bytes
+        path_filter (PathFilter | None): Files that are compared, the others are
+            never kept
+        skipped_suffixes (tuple[str, ...]): Compiled or packed files, not kept since
+            they are rarely reviewed line by line
+
+    Empty files are not kept either, their content is known from their size.
+    """
+
+    max_size: int = parse_size(DEFAULT_SPILL_MAX_SIZE)
+    path_filter: PathFilter | None = None
+    skipped_suffixes: tuple[str, ...] = LOW_PRIORITY_SUFFIXES
+
+    def keeps(self, path: str, member: tarfile.TarInfo) -> bool:
+        """
+        Check whether the content of a member is kept.
+
+        Args:
+            path (str): Normalized path of the member, see
+                `member_index.normalize_member_name`
+            member (tarfile.TarInfo): Header of the member
+
+        Returns:
+            bool: True for regular files that may need a detailed comparison
+        """
+        return (
+            member.isfile()
+            and 0 < member.size <= self.max_size
+            and not path.endswith(self.skipped_suffixes)
+            and (self.path_filter is None or self.path_filter.keeps(path))
+        )
+
+    @cached_property
+    def fingerprint(self) -> str:
+        """Short digest of the policy, distinguishing the entries it produces."""
+        filter_fingerprint = (
+            "" if self.path_filter is None else self.path_filter.fingerprint
+        )
+        policy = "\0".join(
+            map(str, (self.max_size, filter_fingerprint, *self.skipped_suffixes))
+        )
+        return hashlib.sha256(policy.encode()).hexdigest()[:16]
+
+
+class _DigestReader:
+    """
+    Read-only stream updating a hash object with every block read from another one,
+    so a payload is hashed while it is copied.
+    """
+
+    def __init__(self, source, digest):
+        self._source = source
+        self._digest = digest
+
+    def read(self, size: int = -1) -> bytes:
+        block = self._source.read(size)
+        if self._digest is not None:
+            self._digest.update(block)
+        return block
+
+
+class SpillStore:
+    """
+    Uncompressed tar archive receiving the payloads a `SpillPolicy` keeps.
+
+    Payloads are stored one after the other, so a member index can point at them
+    like at any other tar archive (see `member_index.add_member`).
+    """
+
+    def __init__(self, path: str, policy: SpillPolicy, block_size: int):
+        self.path = path
+        self.policy = policy
+        self._tar = tarfile.TarFile(
+            path, "w", format=tarfile.PAX_FORMAT, copybufsize=block_size
+        )
+
+    def add(
+        self, path: str, member: tarfile.TarInfo, payload, digest
+    ) -> tuple[int, int]:
+        """
+        Copy the payload of a member into the store.
+
+        Args:
+            path (str): Normalized path of the member
+            member (tarfile.TarInfo): Header of the member
+            payload: Binary stream with the content of the member
+            digest: Hash object updated with the content, see `hasher.new_digest`,
+                None to only copy it
+
+        Returns:
+            tuple[int, int]: Offsets of the header and of the payload in the store
+        """
+        info = tarfile.TarInfo(path)
+        info.size = member.size
+        info.mode = member.mode
+        info.mtime = member.mtime
+        header_offset = self._tar.offset
+        self._tar.addfile(info, _DigestReader(payload, digest))
+        blocks, remainder = divmod(member.size, tarfile.BLOCKSIZE)
+        padded_size = (blocks + (remainder > 0)) * tarfile.BLOCKSIZE
+        return header_offset, self._tar.offset - padded_size
+
+    def close(self) -> None:
+        self._tar.close()
@@ -0,0 +1,125 @@
+import random
+from container_diffoscope.chunking import (
+    MAX_CHUNK_SIZE,
+    MIN_CHUNK_SIZE,
+    chunk_ends,
+    compare_chunks,
+    get_chunk_comparison,
+)
+from container_diffoscope.diffoscope_runner import DIFF_OK, DIFF_TIMEOUT
+
+
+def _random_bytes(size: int, seed: int = 0) -> bytes:
+    return random.Random(seed).randbytes(size)
+
+
+def test_chunk_ends_respect_the_chunk_sizes():
+    # Arrange
+    data = _random_bytes(4 * 1024**2)
+
+    # Act
+    ends = chunk_ends(data)
+
+    # Assert
+    sizes = [end - start for start, end in zip([0] + ends, ends)]
+    assert ends[-1] == len(data)
+    assert all(size <= MAX_CHUNK_SIZE for size in sizes)
+    assert all(size >= MIN_CHUNK_SIZE for size in sizes[:-1])
+    assert len(ends) > 1
+
+
+def test_chunk_ends_average_size_of_random_data():
+    # Arrange
+    data = _random_bytes(8 * 1024**2)
+
+    # Act
+    ends = chunk_ends(data)
+
+    # Assert
+    average = len(data) / len(ends)
+    assert 16 * 1024 < average < 19 * 1024
+
+
+def test_chunk_ends_of_uniform_data_are_capped():
+    # Act
+    ends = chunk_ends(bytes(3 * MAX_CHUNK_SIZE + 1))
+
+    # Assert
+    assert ends == [
+        MAX_CHUNK_SIZE,
+        2 * MAX_CHUNK_SIZE,
+        3 * MAX_CHUNK_SIZE,
+        3 * MAX_CHUNK_SIZE + 1,
+    ]
+
+
+def test_insertion_only_changes_the_chunks_around_it(tmp_path):
+    # Arrange
+    data = _random_bytes(2 * 1024**2)
+    first = tmp_path / "first"
+    second = tmp_path / "second"
+    first.write_bytes(data)
+    second.write_bytes(data[:1_000_000] + b"inserted" + data[1_000_000:])
+
+    # Act
+    comparison = compare_chunks(str(first), str(second))
+
+    # Assert
+    assert len(comparison.removed) == 1
+    assert len(comparison.added) == 1
+    start, end = comparison.added[0]
+    assert start <= 1_000_000 < end
+    assert end - start <= 2 * MAX_CHUNK_SIZE + len(b"inserted")
+    assert comparison.similarity > 90
+
+
+def test_identical_and_empty_files_are_similar(tmp_path):
+    # Arrange
+    empty = tmp_path / "empty"
+    empty.write_bytes(b"")
+
+    # Act
+    comparison = compare_chunks(str(empty), str(empty))
+
+    # Assert
+    assert comparison.similarity == 100.0
+    assert comparison.removed == comparison.added == []
+
+
+def test_chunk_comparison_is_written_as_markdown(tmp_path):
+    # Arrange
+    first = tmp_path / "first"
+    second = tmp_path / "second"
+    first.write_bytes(_random_bytes(256 * 1024, seed=1))
+    second.write_bytes(_random_bytes(256 * 1024, seed=2))
+
+    # Act
+    result = get_chunk_comparison(
+        str(first), str(second), str(tmp_path / "out"), "usr/lib/libbig.so"
+    )
+
+    # Assert
+    assert result.status == DIFF_OK
+    assert result.message == "0.0% similar"
+    assert result.output is not None
+    markdown = open(result.output).read()
+    assert "## Ranges only in the first file" in markdown
+    assert "| 0x0 | 0x40000 | 262144 |" in markdown
+
+
+def test_chunk_comparison_stops_at_the_timeout(tmp_path):
+    # Arrange
+    first = tmp_path / "first"
+    second = tmp_path / "second"
+    first.write_bytes(_random_bytes(256 * 1024, seed=1))
+    second.write_bytes(_random_bytes(256 * 1024, seed=2))
+
+    # Act
+    result = get_chunk_comparison(
+        str(first), str(second), str(tmp_path / "out"), "usr/lib/libbig.so", 0
+    )
+
+    # Assert
+    assert result.status == DIFF_TIMEOUT
+    assert result.output is None
+    assert result.message == "stopped after 0s"
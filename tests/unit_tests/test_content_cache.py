@@ -0,0 +1,107 @@
+import os
+import pytest
+from container_diffoscope.cache import ContentCache, parse_size
+
+
+def _write(content: bytes):
+    def writer(path: str) -> None:
+        with open(path, "wb") as file:
+            file.write(content)
+
+    return writer
+
+
+def _read(path: str) -> bytes:
+    with open(path, "rb") as file:
+        return file.read()
+
+
+def test_store_and_load(tmp_path):
+    # Arrange
+    cache = ContentCache(str(tmp_path))
+
+    # Act
+    cache.store("sha256:abc", _write(b"partial manifest"))
+
+    # Assert
+    assert cache.load("sha256:abc", _read) == b"partial manifest"
+    assert cache.load("sha256:missing", _read) is None
+    assert (cache.hits, cache.misses) == (1, 1)
+    assert not [name for name in os.listdir(tmp_path) if name.endswith(".tmp")]
+
+
+def test_least_recently_used_entry_is_evicted(tmp_path):
+    # Arrange
+    cache = ContentCache(str(tmp_path), max_bytes=25)
+    cache.store("first", _write(b"1" * 10))
+    cache.store("second", _write(b"2" * 10))
+    os.utime(cache.path("first"), (1, 1))
+    os.utime(cache.path("second"), (2, 2))
+    cache.load("first", _read)
+
+    # Act
+    cache.store("third", _write(b"3" * 10))
+
+    # Assert
+    assert cache.contains("first")
+    assert not cache.contains("second")
+    assert cache.contains("third")
+    assert cache.stats()["bytes"] == 20
+
+
+def test_prune_to_smaller_size(tmp_path):
+    # Arrange
+    cache = ContentCache(str(tmp_path))
+    cache.store("first", _write(b"1" * 10))
+    cache.store("second", _write(b"2" * 10))
+    os.utime(cache.path("first"), (1, 1))
+
+    # Act
+    evicted = cache.prune(max_bytes=10)
+
+    # Assert
+    assert evicted == 1
+    assert cache.stats()["entries"] == 1
+    assert cache.contains("second")
+
+
+@pytest.mark.parametrize(
+    "size,expected",
+    [("1024", 1024), ("512M", 512 * 1024**2), ("1.5GiB", 1536 * 1024**2)],
+)
+def test_parse_size(size, expected):
+    # Act & Assert
+    assert parse_size(size) == expected
+
+
+def test_pinned_entry_is_not_evicted(tmp_path):
+    # Arrange
+    cache = ContentCache(str(tmp_path))
+    cache.store("in-use", _write(b"1" * 10))
+    cache.store("unused", _write(b"2" * 10))
+
+    # Act
+    with cache.pin("in-use") as path:
+        assert path is not None
+        evicted = cache.prune(max_bytes=0)
+        pinned = os.path.exists(path)
+
+    # Assert
+    assert evicted == 1
+    assert pinned
+    assert not cache.contains("unused")
+
+
+def test_pin_or_store_keeps_pinned_entries(tmp_path):
+    # Arrange
+    cache = ContentCache(str(tmp_path), max_bytes=15)
+
+    # Act
+    with (
+        cache.pin_or_store("first", _write(b"1" * 10)) as first,
+        cache.pin_or_store("second", _write(b"2" * 10)) as second,
+    ):
+        both_kept = os.path.exists(first) and os.path.exists(second)
+
+    # Assert
+    assert both_kept
@@ -0,0 +1,155 @@
+import os
+import polars as pl
+from container_diffoscope.cache import ContentCache
+from container_diffoscope.chunking import CHUNK_MODE
+from container_diffoscope.diff_cache import (
+    ChangeGroup,
+    diff_cache_key,
+    fan_out,
+    group_changed_files,
+    restore_cached_diff,
+    store_diff,
+)
+from container_diffoscope.diffoscope_runner import (
+    DIFF_FAILED,
+    DIFF_OK,
+    DETAILED_MODE,
+    DiffResult,
+    diff_output_path,
+)
+
+
+def _changed_files(rows: list[tuple[bytes, str, bytes]]) -> pl.DataFrame:
+    return pl.DataFrame(
+        rows,
+        schema={"hash": pl.Binary, "path": pl.String, "hash_2": pl.Binary},
+        orient="row",
+    )
+
+
+def _diffed(export_dir: str, path: str, content: str) -> DiffResult:
+    output = diff_output_path(export_dir, path)
+    os.makedirs(os.path.dirname(output), exist_ok=True)
+    with open(output, "w") as file:
+        file.write(content)
+    return DiffResult(path, DIFF_OK, output)
+
+
+def test_group_changed_files_groups_identical_changes():
+    # Arrange
+    changed_files = _changed_files(
+        [
+            (b"a", "lib/one.so", b"b"),
+            (b"c", "etc/config", b"d"),
+            (b"a", "lib/two.so", b"b"),
+        ]
+    )
+
+    # Act
+    groups = group_changed_files(changed_files)
+
+    # Assert
+    assert groups == [
+        ChangeGroup("lib/one.so", b"a", b"b", ("lib/two.so",)),
+        ChangeGroup("etc/config", b"c", b"d"),
+    ]
+
+
+def test_diff_cache_key_depends_on_the_direction():
+    # Act / Assert
+    assert diff_cache_key(b"\x01", b"\x02") != diff_cache_key(b"\x02", b"\x01")
+
+
+def test_stored_diff_is_restored_for_another_path(tmp_path):
+    # Arrange
+    cache = ContentCache(str(tmp_path / "diffs"))
+    stored = ChangeGroup("etc/config", b"a", b"b")
+    store_diff(
+        cache,
+        stored,
+        _diffed(
+            str(tmp_path / "run_1"),
+            stored.path,
+            "--- image_1/etc/config\n+++ image_2/etc/config\n",
+        ),
+        DETAILED_MODE,
+        100,
+    )
+    moved = ChangeGroup("etc/moved", b"a", b"b")
+
+    # Act
+    result = restore_cached_diff(cache, moved, str(tmp_path / "run_2"), None)
+
+    # Assert
+    assert result is not None
+    assert result.path == "etc/moved"
+    output = diff_output_path(str(tmp_path / "run_2"), "etc/moved")
+    assert result.output == output
+    with open(output) as file:
+        assert file.read() == "--- image_1/etc/moved\n+++ image_2/etc/moved\n"
+    assert (cache.hits, cache.misses) == (1, 0)
+
+
+def test_diff_compared_another_way_is_not_restored(tmp_path):
+    # Arrange
+    cache = ContentCache(str(tmp_path / "diffs"))
+    group = ChangeGroup("etc/config", b"a", b"b")
+    result = _diffed(str(tmp_path / "run_1"), group.path, "chunks")
+    store_diff(cache, group, result, CHUNK_MODE, 100)
+
+    # Act
+    same_threshold = restore_cached_diff(cache, group, str(tmp_path / "run_2"), 50)
+    raised_threshold = restore_cached_diff(cache, group, str(tmp_path / "run_3"), 1000)
+
+    # Assert
+    assert same_threshold is not None
+    assert raised_threshold is None
+    assert (cache.hits, cache.misses) == (1, 1)
+
+
+def test_missing_diff_is_counted_as_a_miss(tmp_path):
+    # Arrange
+    cache = ContentCache(str(tmp_path / "diffs"))
+
+    # Act
+    result = restore_cached_diff(
+        cache, ChangeGroup("etc/config", b"a", b"b"), str(tmp_path / "out"), None
+    )
+
+    # Assert
+    assert result is None
+    assert (cache.hits, cache.misses) == (0, 1)
+
+
+def test_failed_diff_is_not_stored(tmp_path):
+    # Arrange
+    cache = ContentCache(str(tmp_path / "diffs"))
+    group = ChangeGroup("etc/config", b"a", b"b")
+
+    # Act
+    store_diff(
+        cache,
+        group,
+        DiffResult(group.path, DIFF_FAILED, message="crashed"),
+        DETAILED_MODE,
+        100,
+    )
+
+    # Assert
+    assert not cache.contains(diff_cache_key(b"a", b"b"))
+
+
+def test_fan_out_copies_the_diff_to_duplicates(tmp_path):
+    # Arrange
+    export_dir = str(tmp_path / "out")
+    group = ChangeGroup("lib/one.so", b"a", b"b", ("lib/two.so",))
+    result = _diffed(export_dir, group.path, "# Comparing image_1/lib/one.so\n")
+
+    # Act
+    results = fan_out(result, group, export_dir)
+
+    # Assert
+    assert [result.path for result in results] == ["lib/one.so", "lib/two.so"]
+    assert results[1].message == "same change as lib/one.so"
+    with open(diff_output_path(export_dir, "lib/two.so")) as file:
+        assert file.read() == "# Comparing image_1/lib/two.so\n"
@@ -0,0 +1,186 @@
+import os
+import stat
+import pytest
+from container_diffoscope.diffoscope_runner import (
+    DIFF_FAILED,
+    DIFF_OK,
+    DIFF_TIMEOUT,
+    DiffResult,
+    comparison_labels,
+    diff_output_path,
+    get_detailed_file_comparison,
+    write_diff_report,
+)
+
+
+@pytest.fixture
+def fake_diffoscope(tmp_path, monkeypatch):
+    """Put a `diffoscope` script on PATH whose behaviour is set by the test."""
+    bin_dir = tmp_path / "bin"
+    bin_dir.mkdir()
+    monkeypatch.setenv("PATH", f"{bin_dir}{os.pathsep}{os.environ['PATH']}")
+
+    def install(body: str) -> None:
+        script = bin_dir / "diffoscope"
+        script.write_text("#!/bin/sh\n" + body + "\n")
+        script.chmod(script.stat().st_mode | stat.S_IEXEC)
+
+    return install
+
+
+@pytest.fixture
+def files(tmp_path):
+    """Two binary files, which are compared with diffoscope."""
+    first = tmp_path / "first"
+    second = tmp_path / "second"
+    first.write_bytes(b"\x7fELF\x00a")
+    second.write_bytes(b"\x7fELF\x00b")
+    return str(first), str(second)
+
+
+@pytest.fixture
+def text_files(tmp_path):
+    first = tmp_path / "first.conf"
+    second = tmp_path / "second.conf"
+    first.write_text("user = app\nport = 80\nworkers = 2\n")
+    second.write_text("user = app\nport = 8080\nworkers = 2")
+    return str(first), str(second)
+
+
+def test_output_path_keeps_same_basenames_apart(tmp_path):
+    # Act
+    outputs = {
+        diff_output_path(str(tmp_path), name)
+        for name in ["etc/config", "usr/etc/config", "report"]
+    }
+
+    # Assert
+    assert len(outputs) == 3
+    assert os.path.join(str(tmp_path), "report.md") not in outputs
+
+
+def test_comparison_with_differences(fake_diffoscope, files, tmp_path):
+    # Arrange
+    fake_diffoscope('echo diff > "$7"; exit 1')
+
+    # Act
+    result = get_detailed_file_comparison(
+        files[0], files[1], str(tmp_path / "out"), "etc/config"
+    )
+
+    # Assert
+    assert result.status == DIFF_OK
+    assert result.output is not None
+    assert open(result.output).read() == "diff\n"
+
+
+def test_text_files_are_compared_without_diffoscope(
+    fake_diffoscope, text_files, tmp_path
+):
+    # Arrange
+    fake_diffoscope("exit 2")
+
+    # Act
+    result = get_detailed_file_comparison(
+        text_files[0], text_files[1], str(tmp_path / "out"), "etc/app.conf"
+    )
+
+    # Assert
+    assert result.status == DIFF_OK
+    assert result.output is not None
+    markdown = open(result.output).read()
+    assert (
+        " user = app\n-port = 80\n-workers = 2\n+port = 8080\n"
+        "+workers = 2\n\\ No newline at end of file\n"
+    ) in markdown
+    assert markdown.startswith(f"# Comparing `{text_files[0]}` & `{text_files[1]}`")
+
+
+@pytest.mark.parametrize(
+    "content",
+    [b"\x1f\x8b\x08compressed", b"text\x00with a nul byte", b"\xff\xfe latin-1"],
+)
+def test_non_text_files_go_to_diffoscope(fake_diffoscope, content, tmp_path):
+    # Arrange
+    fake_diffoscope('echo diffoscope > "$7"; exit 1')
+    first = tmp_path / "first"
+    second = tmp_path / "second"
+    first.write_bytes(content)
+    second.write_text("plain text")
+
+    # Act
+    result = get_detailed_file_comparison(
+        str(first), str(second), str(tmp_path / "out"), "data"
+    )
+
+    # Assert
+    assert result.output is not None
+    assert open(result.output).read() == "diffoscope\n"
+
+
+def test_labelled_comparisons_hide_the_extraction_paths(
+    fake_diffoscope, files, text_files, tmp_path
+):
+    # Arrange
+    fake_diffoscope('echo "--- $1" > "$7"; echo "+++ $2" >> "$7"; exit 1')
+    labels = comparison_labels("/etc/app.conf")
+
+    # Act
+    results = [
+        get_detailed_file_comparison(
+            first, second, str(tmp_path / "out"), name, labels=labels
+        )
+        for first, second, name in [(*text_files, "text"), (*files, "binary")]
+    ]
+
+    # Assert
+    assert labels == ("image_1/etc/app.conf", "image_2/etc/app.conf")
+    for result in results:
+        assert result.output is not None
+        markdown = open(result.output).read()
+        assert "--- image_1/etc/app.conf\n+++ image_2/etc/app.conf\n" in markdown
+        assert str(tmp_path) not in markdown
+
+
+def test_failed_comparison_is_recorded(fake_diffoscope, files, tmp_path):
+    # Arrange
+    fake_diffoscope("echo broken >&2; exit 2")
+
+    # Act
+    result = get_detailed_file_comparison(
+        files[0], files[1], str(tmp_path / "out"), "bin/tool"
+    )
+
+    # Assert
+    assert result == DiffResult(
+        "bin/tool", DIFF_FAILED, duration=result.duration, message="broken"
+    )
+
+
+def test_comparison_is_killed_after_timeout(fake_diffoscope, files, tmp_path):
+    # Arrange
+    fake_diffoscope("sleep 30")
+
+    # Act
+    result = get_detailed_file_comparison(
+        files[0], files[1], str(tmp_path / "out"), "bin/tool", timeout=0.2
+    )
+
+    # Assert
+    assert result.status == DIFF_TIMEOUT
+    assert result.duration < 10
+
+
+def test_report_lists_every_result(tmp_path):
+    # Arrange
+    results = [
+        DiffResult("bin/tool", DIFF_TIMEOUT, message="killed after 1s"),
+        DiffResult("etc/config", DIFF_OK, str(tmp_path / "files/etc/config.md")),
+    ]
+
+    # Act
+    report = open(write_diff_report(results, str(tmp_path))).read()
+
+    # Assert
+    assert "| `bin/tool` | timeout | 0.0s | killed after 1s |" in report
+    assert "[diff](files/etc/config.md)" in report
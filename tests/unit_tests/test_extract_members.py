@@ -0,0 +1,90 @@
+import io
+import os
+import tarfile
+import pytest
+from container_diffoscope.extractor import extract_members
+from container_diffoscope.hasher import hash_tar_members
+from container_diffoscope.member_index import load_member_index
+
+
+def _add_file(tar: tarfile.TarFile, name: str, content: bytes) -> None:
+    info = tarfile.TarInfo(name)
+    info.size = len(content)
+    tar.addfile(info, io.BytesIO(content))
+
+
+@pytest.fixture
+def indexed_tar(tmp_path):
+    """Create a tar archive and its member index."""
+    tar_path = tmp_path / "image.tar"
+    with tarfile.open(tar_path, "w") as tar:
+        _add_file(tar, "etc/config", b"key=value\n")
+        _add_file(tar, "usr/lib/big.so", b"y" * 5000)
+        _add_file(tar, "bin/tool", b"#!/bin/sh\n")
+        hard_link = tarfile.TarInfo("bin/tool-link")
+        hard_link.type = tarfile.LNKTYPE
+        hard_link.linkname = "bin/tool"
+        tar.addfile(hard_link)
+        symlink = tarfile.TarInfo("etc/alias")
+        symlink.type = tarfile.SYMTYPE
+        symlink.linkname = "config"
+        tar.addfile(symlink)
+    index_path = tmp_path / "index.parquet"
+    hash_tar_members(
+        str(tar_path), str(tmp_path / "manifest.parquet"), index_path=str(index_path)
+    )
+    return str(index_path)
+
+
+def test_member_index_records_offsets(indexed_tar):
+    # Arrange
+    index_path = indexed_tar
+
+    # Act
+    index = load_member_index(index_path, ["usr/lib/big.so"])
+
+    # Assert
+    assert index["size"].to_list() == [5000]
+    with open(index["source"][0], "rb") as archive:
+        archive.seek(index["data_offset"][0])
+        assert archive.read(5000) == b"y" * 5000
+
+
+def test_extract_members_regular_files(indexed_tar, tmp_path):
+    # Arrange
+    index_path = indexed_tar
+    output_dir = tmp_path / "out"
+
+    # Act
+    extract_members(index_path, ["etc/config", "usr/lib/big.so"], str(output_dir))
+
+    # Assert
+    assert (output_dir / "etc/config").read_bytes() == b"key=value\n"
+    assert (output_dir / "usr/lib/big.so").read_bytes() == b"y" * 5000
+    assert not (output_dir / "bin").exists()
+
+
+def test_extract_members_links(indexed_tar, tmp_path):
+    # Arrange
+    index_path = indexed_tar
+    output_dir = tmp_path / "out"
+
+    # Act
+    extract_members(index_path, ["bin/tool-link", "etc/alias"], str(output_dir))
+
+    # Assert
+    assert (output_dir / "bin/tool-link").read_bytes() == b"#!/bin/sh\n"
+    assert os.readlink(output_dir / "etc/alias") == "config"
+
+
+def test_extract_members_skips_unknown_paths(indexed_tar, tmp_path):
+    # Arrange
+    index_path = indexed_tar
+    output_dir = tmp_path / "out"
+
+    # Act
+    extract_members(index_path, ["etc/config", "missing"], str(output_dir))
+
+    # Assert
+    assert (output_dir / "etc/config").read_bytes() == b"key=value\n"
+    assert not (output_dir / "missing").exists()
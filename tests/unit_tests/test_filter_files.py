@@ -1,5 +1,5 @@
 import polars as pl
-from container_diffoscope.comparator import _filter_files
+from container_diffoscope.comparator import compare_file_lists
 
 
 def test_basic_filter():
@@ -8,7 +8,7 @@ def test_basic_filter():
     )
     df2 = pl.DataFrame({"hash": ["123", "999"], "path": ["/bin/a", "/bin/d"]})
 
-    result = _filter_files(df1, df2)
+    result = compare_file_lists(df1, df2)[2]
     assert len(result) == 2
     assert result["path"].to_list() == ["/bin/b", "/bin/c"]
     assert result["hash"].to_list() == ["456", "789"]
@@ -20,8 +20,8 @@ def test_empty_dataframes():
     df2 = pl.DataFrame({"hash": ["123"], "path": ["/bin/a"]})
 
     # Act
-    result_1 = _filter_files(df1, df2)
-    result_2 = _filter_files(df2, df1)
+    result_1 = compare_file_lists(df1, df2)[2]
+    result_2 = compare_file_lists(df2, df1)[2]
 
     # Assert
     assert len(result_1) == 0
@@ -33,7 +33,7 @@ def test_identical_dataframes():
     df = pl.DataFrame({"hash": ["123", "456"], "path": ["/bin/a", "/bin/b"]})
 
     # Act
-    result = _filter_files(df, df)
+    result = compare_file_lists(df, df)[2]
     # Assert
     assert len(result) == 0
 
@@ -44,6 +44,6 @@ def test_same_hash_different_paths():
     df2 = pl.DataFrame({"hash": ["123", "456"], "path": ["/bin/x", "/bin/y"]})
 
     # Act
-    result = _filter_files(df1, df2)
+    result = compare_file_lists(df1, df2)[2]
     # Assert
     assert len(result) == 2
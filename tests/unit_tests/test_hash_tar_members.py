@@ -0,0 +1,174 @@
+import hashlib
+import io
+import tarfile
+import pytest
+from container_diffoscope import hasher
+from container_diffoscope.extractor import _TeeReader, extract_members
+from container_diffoscope.globs import PathFilter
+from container_diffoscope.hasher import hash_tar_members, hash_tar_stream
+from container_diffoscope.manifest import load_hash_algorithm, load_manifest
+
+
+def _add_file(tar: tarfile.TarFile, name: str, content: bytes) -> None:
+    info = tarfile.TarInfo(name)
+    info.size = len(content)
+    tar.addfile(info, io.BytesIO(content))
+
+
+@pytest.fixture
+def sample_tar(tmp_path):
+    """Create a tar archive with files, a directory and a symlink."""
+    tar_path = tmp_path / "image.tar"
+    with tarfile.open(tar_path, "w") as tar:
+        directory = tarfile.TarInfo("etc")
+        directory.type = tarfile.DIRTYPE
+        tar.addfile(directory)
+        _add_file(tar, "etc/config", b"key=value\n")
+        _add_file(tar, "bin/empty", b"")
+        _add_file(tar, "usr/lib/big.so", b"x" * 3000)
+        link = tarfile.TarInfo("bin/link")
+        link.type = tarfile.SYMTYPE
+        link.linkname = "empty"
+        tar.addfile(link)
+    return str(tar_path)
+
+
+def test_hash_tar_members_hashes_regular_files(sample_tar, tmp_path):
+    # Arrange
+    output = tmp_path / "manifest.parquet"
+
+    # Act
+    hashed_files = hash_tar_members(sample_tar, str(output), block_size=1024)
+
+    # Assert
+    assert hashed_files == 3
+    assert load_manifest(str(output)).rows() == [
+        (hashlib.sha256(b"").digest(), "bin/empty"),
+        (hashlib.sha256(b"key=value\n").digest(), "etc/config"),
+        (hashlib.sha256(b"x" * 3000).digest(), "usr/lib/big.so"),
+    ]
+
+
+@pytest.mark.parametrize("jobs", [1, 2])
+def test_hash_tar_members_skips_filtered_payloads(
+    sample_tar, tmp_path, monkeypatch, jobs
+):
+    # Arrange
+    output = tmp_path / "manifest.parquet"
+    hashed = []
+    hash_range = hasher._hash_range
+    hash_stream = hasher.hash_stream
+
+    def recording_range(*args):
+        hashed.append(hash_range(*args))
+        return hashed[-1]
+
+    def recording_stream(*args):
+        hashed.append(hash_stream(*args))
+        return hashed[-1]
+
+    monkeypatch.setattr(hasher, "_hash_range", recording_range)
+    monkeypatch.setattr(hasher, "hash_stream", recording_stream)
+
+    # Act
+    hashed_files = hash_tar_members(
+        sample_tar,
+        str(output),
+        jobs=jobs,
+        path_filter=PathFilter(exclude=("*.so", "/bin")),
+    )
+
+    # Assert
+    assert hashed_files == 1
+    assert load_manifest(str(output))["path"].to_list() == ["etc/config"]
+    assert hashed == [hashlib.sha256(b"key=value\n").digest()]
+
+
+def test_hash_tar_members_empty_archive(tmp_path):
+    # Arrange
+    tar_path = tmp_path / "empty.tar"
+    with tarfile.open(tar_path, "w"):
+        pass
+    output = tmp_path / "manifest.parquet"
+
+    # Act
+    hashed_files = hash_tar_members(str(tar_path), str(output))
+
+    # Assert
+    assert hashed_files == 0
+    assert load_manifest(str(output)).is_empty()
+
+
+@pytest.mark.parametrize("jobs", [1, 2])
+def test_hash_tar_members_with_blake2b(sample_tar, tmp_path, jobs):
+    # Arrange
+    output = tmp_path / "manifest.parquet"
+
+    # Act
+    hash_tar_members(sample_tar, str(output), jobs=jobs, algorithm="blake2b")
+
+    # Assert
+    assert load_manifest(str(output)).rows() == [
+        (hashlib.blake2b(content, digest_size=32).digest(), path)
+        for content, path in [
+            (b"", "bin/empty"),
+            (b"key=value\n", "etc/config"),
+            (b"x" * 3000, "usr/lib/big.so"),
+        ]
+    ]
+    assert load_hash_algorithm(str(output)) == "blake2b"
+
+
+def test_unknown_hash_algorithm_is_refused(sample_tar, tmp_path):
+    # Act / Assert
+    with pytest.raises(ValueError, match="Unsupported hash algorithm"):
+        hash_tar_members(
+            sample_tar, str(tmp_path / "manifest.parquet"), algorithm="md5"
+        )
+
+
+def test_hash_tar_members_parallel_matches_serial(tmp_path):
+    # Arrange
+    tar_path = tmp_path / "image.tar"
+    with tarfile.open(tar_path, "w") as tar:
+        for index in range(50):
+            _add_file(tar, f"data/file_{index}", bytes([index]) * (index * 997))
+    serial_output = tmp_path / "serial.parquet"
+    parallel_output = tmp_path / "parallel.parquet"
+
+    # Act
+    serial_count = hash_tar_members(str(tar_path), str(serial_output))
+    parallel_count = hash_tar_members(
+        str(tar_path), str(parallel_output), block_size=4096, jobs=4
+    )
+
+    # Assert
+    assert serial_count == parallel_count == 50
+    assert load_manifest(str(parallel_output)).equals(load_manifest(str(serial_output)))
+
+
+def test_hash_tar_stream_while_copying_archive(sample_tar, tmp_path):
+    # Arrange
+    with open(sample_tar, "rb") as archive:
+        pipe = io.BytesIO(archive.read())
+    copy_path = tmp_path / "copy.tar"
+    output = tmp_path / "manifest.parquet"
+    index_path = tmp_path / "index.parquet"
+
+    # Act
+    with open(copy_path, "wb") as copy:
+        tee = _TeeReader(pipe, copy)
+        hashed_files = hash_tar_stream(
+            io.BufferedReader(tee, 1024),
+            str(copy_path),
+            str(output),
+            block_size=1024,
+            index_path=str(index_path),
+        )
+        tee.drain()
+
+    # Assert
+    assert hashed_files == 3
+    assert copy_path.read_bytes() == open(sample_tar, "rb").read()
+    extract_members(str(index_path), ["usr/lib/big.so"], str(tmp_path / "out"))
+    assert (tmp_path / "out/usr/lib/big.so").read_bytes() == b"x" * 3000
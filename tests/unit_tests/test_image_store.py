@@ -0,0 +1,106 @@
+import io
+import os
+import tarfile
+import pytest
+from container_diffoscope import extractor
+from container_diffoscope.cache import ContentCache
+from container_diffoscope.extractor import MANIFEST_FILE, open_image
+from container_diffoscope.globs import PathFilter
+from container_diffoscope.manifest import load_hash_algorithm, load_manifest
+
+
+@pytest.fixture
+def rootfs(tmp_path):
+    """Create a flattened filesystem tar archive."""
+    path = tmp_path / "rootfs.tar"
+    with tarfile.open(path, "w") as tar:
+        for name, content in [("etc/hostname", b"box"), ("bin/tool", b"tool")]:
+            info = tarfile.TarInfo(name)
+            info.size = len(content)
+            tar.addfile(info, io.BytesIO(content))
+    return str(path)
+
+
+def test_stored_image_is_not_ingested_again(rootfs, tmp_path, monkeypatch):
+    # Arrange
+    store = ContentCache(str(tmp_path / "images"))
+    with open_image(rootfs, store) as entry_dir:
+        first_entry = entry_dir
+
+    def fail(*args, **kwargs):
+        raise AssertionError("image ingested again")
+
+    monkeypatch.setattr(extractor, "ingest_image", fail)
+
+    # Act
+    with open_image(rootfs, store) as entry_dir:
+        manifest = load_manifest(os.path.join(entry_dir, MANIFEST_FILE))
+
+    # Assert
+    assert entry_dir == first_entry
+    assert sorted(manifest["path"]) == ["bin/tool", "etc/hostname"]
+
+
+def test_extract_files_from_stored_image(rootfs, tmp_path):
+    # Arrange
+    store = ContentCache(str(tmp_path / "images"))
+    output_dir = tmp_path / "out"
+
+    # Act
+    with open_image(rootfs, store, source="rootfs") as entry_dir:
+        extractor.extract_files_from_tar(["bin/tool"], entry_dir, str(output_dir))
+
+    # Assert
+    assert (output_dir / "bin/tool").read_bytes() == b"tool"
+
+
+def test_stored_image_has_a_merkle_tree(rootfs, tmp_path):
+    # Arrange
+    store = ContentCache(str(tmp_path / "images"))
+
+    # Act
+    with open_image(rootfs, store) as entry_dir:
+        tree = extractor.load_tree(entry_dir)
+
+    # Assert
+    assert tree is not None
+    assert sorted(tree["directory"]) == ["", "bin", "etc"]
+
+
+def test_filtered_image_is_stored_separately(rootfs, tmp_path):
+    # Arrange
+    store = ContentCache(str(tmp_path / "images"))
+    with open_image(rootfs, store) as entry_dir:
+        full_entry = entry_dir
+
+    # Act
+    with open_image(
+        rootfs, store, path_filter=PathFilter(exclude=("/etc",))
+    ) as entry_dir:
+        manifest = load_manifest(os.path.join(entry_dir, MANIFEST_FILE))
+        excluded = extractor.load_excluded_count(entry_dir)
+
+    # Assert
+    assert entry_dir != full_entry
+    assert manifest["path"].to_list() == ["bin/tool"]
+    assert excluded == 1
+    assert extractor.load_excluded_count(full_entry) is None
+
+
+def test_images_hashed_with_another_algorithm_are_stored_separately(rootfs, tmp_path):
+    # Arrange
+    store = ContentCache(str(tmp_path / "images"))
+    with open_image(rootfs, store) as entry_dir:
+        sha256_entry = entry_dir
+
+    # Act
+    with open_image(rootfs, store, algorithm="blake2b") as entry_dir:
+        manifest_path = os.path.join(entry_dir, MANIFEST_FILE)
+        algorithm = load_hash_algorithm(manifest_path)
+        manifest = load_manifest(manifest_path)
+
+    # Assert
+    assert entry_dir != sha256_entry
+    assert algorithm == "blake2b"
+    assert load_hash_algorithm(os.path.join(sha256_entry, MANIFEST_FILE)) == "sha256"
+    assert sorted(manifest["path"]) == ["bin/tool", "etc/hostname"]
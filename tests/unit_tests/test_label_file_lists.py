@@ -0,0 +1,63 @@
+import polars as pl
+import pytest
+from container_diffoscope.comparator import compare_file_lists, label_file_lists
+
+
+@pytest.fixture
+def file_lists():
+    df1 = pl.DataFrame(
+        {
+            "hash": ["h1", "h2", "h3"],
+            "path": ["/bin/common", "/bin/modified", "/bin/removed"],
+        }
+    )
+    df2 = pl.DataFrame(
+        {
+            "hash": ["h1", "h9", "h4"],
+            "path": ["/bin/common", "/bin/modified", "/bin/added"],
+        }
+    )
+    return df1, df2
+
+
+def test_label_file_lists_labels_every_path(file_lists):
+    # Arrange
+    df1, df2 = file_lists
+
+    # Act
+    result = label_file_lists(df1, df2).collect()
+
+    # Assert
+    statuses = dict(zip(result["path"].to_list(), result["status"].to_list()))
+    assert statuses == {
+        "/bin/common": "common",
+        "/bin/modified": "changed",
+        "/bin/removed": "only_in_1",
+        "/bin/added": "only_in_2",
+    }
+
+
+def test_label_file_lists_accepts_lazy_frames(file_lists):
+    # Arrange
+    df1, df2 = file_lists
+
+    # Act
+    result = label_file_lists(df1.lazy(), df2.lazy()).collect()
+
+    # Assert
+    assert result.columns == ["path", "hash", "hash_2", "status"]
+    assert len(result) == 4
+
+
+def test_compare_file_lists_streaming_engine(file_lists):
+    # Arrange
+    df1, df2 = file_lists
+
+    # Act
+    common, changed, only_1, only_2 = compare_file_lists(df1, df2, engine="streaming")
+
+    # Assert
+    assert common["path"].to_list() == ["/bin/common"]
+    assert changed.rows() == [("h2", "/bin/modified", "h9")]
+    assert only_1.rows() == [("h3", "/bin/removed")]
+    assert only_2.rows() == [("h4", "/bin/added")]
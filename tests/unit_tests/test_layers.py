@@ -0,0 +1,300 @@
+import gzip
+import hashlib
+import io
+import json
+import tarfile
+import pytest
+from container_diffoscope import layers
+from container_diffoscope.cache import ContentCache
+from container_diffoscope.extractor import extract_members
+from container_diffoscope.globs import PathFilter
+from container_diffoscope.layers import build_layered_manifest, detect_source
+from container_diffoscope.manifest import load_manifest
+
+
+def _layer(entries: list[tuple[str, bytes | str]]) -> bytes:
+    """Build a layer tar, entries are (name, content) or (name, "->target") links."""
+    buffer = io.BytesIO()
+    with tarfile.open(fileobj=buffer, mode="w") as tar:
+        for name, content in entries:
+            info = tarfile.TarInfo(name)
+            if isinstance(content, str):
+                info.type = tarfile.LNKTYPE
+                info.linkname = content.removeprefix("->")
+                tar.addfile(info)
+            else:
+                info.size = len(content)
+                tar.addfile(info, io.BytesIO(content))
+    return buffer.getvalue()
+
+
+BASE_LAYER = _layer(
+    [
+        ("etc/config", b"v1"),
+        ("etc/old", b"old"),
+        ("usr/lib/dir/a", b"a"),
+        ("usr/lib/dir/b", b"b"),
+        ("opt/data/keep", b"keep"),
+        ("bin/tool", b"tool"),
+    ]
+)
+TOP_LAYER = _layer(
+    [
+        ("./etc/config", b"v2"),
+        ("etc/.wh.old", b""),
+        ("usr/lib/.wh.dir", b""),
+        ("opt/data/.wh..wh..opq", b""),
+        ("opt/data/new", b"new"),
+        ("bin/tool-link", "->bin/tool"),
+    ]
+)
+EXPECTED_FILES = {
+    "etc/config": hashlib.sha256(b"v2").digest(),
+    "bin/tool": hashlib.sha256(b"tool").digest(),
+    "opt/data/new": hashlib.sha256(b"new").digest(),
+    "bin/tool-link": hashlib.sha256(b"tool").digest(),
+}
+
+
+def _digest(content: bytes) -> str:
+    return "sha256:" + hashlib.sha256(content).hexdigest()
+
+
+@pytest.fixture
+def oci_layout(tmp_path):
+    """Create an OCI image layout with a plain base layer and a gzip top layer."""
+    layout = tmp_path / "layout"
+    blobs = layout / "blobs" / "sha256"
+    blobs.mkdir(parents=True)
+
+    def add_blob(content: bytes) -> str:
+        digest = _digest(content)
+        (blobs / digest.split(":")[1]).write_bytes(content)
+        return digest
+
+    top_blob = gzip.compress(TOP_LAYER)
+    config = json.dumps(
+        {
+            "rootfs": {
+                "type": "layers",
+                "diff_ids": [_digest(BASE_LAYER), _digest(TOP_LAYER)],
+            }
+        }
+    ).encode()
+    manifest = json.dumps(
+        {
+            "config": {"digest": add_blob(config)},
+            "layers": [
+                {
+                    "mediaType": "application/vnd.oci.image.layer.v1.tar",
+                    "digest": add_blob(BASE_LAYER),
+                },
+                {
+                    "mediaType": "application/vnd.oci.image.layer.v1.tar+gzip",
+                    "digest": add_blob(top_blob),
+                },
+            ],
+        }
+    ).encode()
+    (layout / "index.json").write_text(
+        json.dumps({"manifests": [{"digest": add_blob(manifest)}]})
+    )
+    (layout / "oci-layout").write_text('{"imageLayoutVersion": "1.0.0"}')
+    return str(layout)
+
+
+@pytest.fixture
+def docker_archive(tmp_path):
+    """Create a `docker save` archive with two uncompressed layers."""
+    archive = tmp_path / "image.tar"
+    config = json.dumps(
+        {"rootfs": {"diff_ids": [_digest(BASE_LAYER), _digest(TOP_LAYER)]}}
+    )
+    manifest = json.dumps(
+        [{"Config": "config.json", "Layers": ["base/layer.tar", "top/layer.tar"]}]
+    )
+    with tarfile.open(archive, "w") as tar:
+        for name, content in [
+            ("base/layer.tar", BASE_LAYER),
+            ("top/layer.tar", TOP_LAYER),
+            ("config.json", config.encode()),
+            ("manifest.json", manifest.encode()),
+        ]:
+            info = tarfile.TarInfo(name)
+            info.size = len(content)
+            tar.addfile(info, io.BytesIO(content))
+    return str(archive)
+
+
+def test_detect_source(oci_layout, docker_archive, tmp_path):
+    # Arrange
+    rootfs = tmp_path / "rootfs.tar"
+    rootfs.write_bytes(BASE_LAYER)
+
+    # Act & Assert
+    assert detect_source(oci_layout) == "oci"
+    assert detect_source(docker_archive) == "archive"
+    assert detect_source(str(rootfs)) == "rootfs"
+    assert detect_source("ubuntu:22.04") == "docker"
+
+
+def test_detect_source_rootfs_with_manifest_json(tmp_path):
+    # Arrange
+    rootfs = tmp_path / "rootfs.tar"
+    with tarfile.open(rootfs, "w") as tar:
+        for name, content in [
+            ("manifest.json", b'{"name": "app", "version": "1.0"}'),
+            ("etc/hostname", b"app\n"),
+        ]:
+            info = tarfile.TarInfo(name)
+            info.size = len(content)
+            tar.addfile(info, io.BytesIO(content))
+
+    # Act & Assert
+    assert detect_source(str(rootfs)) == "rootfs"
+
+
+def test_detect_source_stops_at_deep_members(tmp_path, monkeypatch):
+    # Arrange
+    rootfs = tmp_path / "rootfs.tar"
+    with tarfile.open(rootfs, "w") as tar:
+        for number in range(10):
+            info = tarfile.TarInfo(f"usr/share/doc/pkg{number}/copyright")
+            tar.addfile(info, io.BytesIO(b""))
+    read = []
+    next_member = tarfile.TarFile.next
+
+    def counting_next(self):
+        read.append(1)
+        return next_member(self)
+
+    monkeypatch.setattr(tarfile.TarFile, "next", counting_next)
+
+    # Act
+    source = detect_source(str(rootfs))
+
+    # Assert
+    assert source == "rootfs"
+    # tarfile.open reads the first header to check the archive
+    assert len(read) <= 2
+
+
+def test_detect_source_rejects_compressed_archive(tmp_path):
+    # Arrange
+    archive = tmp_path / "rootfs.tar.gz"
+    with tarfile.open(archive, "w:gz") as tar:
+        tar.addfile(tarfile.TarInfo("etc/hostname"), io.BytesIO(b""))
+
+    # Act & Assert
+    with pytest.raises(ValueError, match="not an uncompressed tar archive"):
+        detect_source(str(archive))
+
+
+@pytest.mark.parametrize(
+    "image_fixture,source", [("oci_layout", "oci"), ("docker_archive", "archive")]
+)
+def test_build_layered_manifest_applies_whiteouts(
+    image_fixture, source, request, tmp_path
+):
+    # Arrange
+    image = request.getfixturevalue(image_fixture)
+    manifest_path = tmp_path / "manifest.parquet"
+
+    # Act
+    files = build_layered_manifest(
+        image, source, str(manifest_path), str(tmp_path / "index.parquet")
+    )
+
+    # Assert
+    manifest = load_manifest(str(manifest_path))
+    assert files == 4
+    assert dict(zip(manifest["path"], manifest["hash"])) == EXPECTED_FILES
+
+
+@pytest.mark.parametrize(
+    "image_fixture,source", [("oci_layout", "oci"), ("docker_archive", "archive")]
+)
+def test_extract_members_from_layers(image_fixture, source, request, tmp_path):
+    # Arrange
+    image = request.getfixturevalue(image_fixture)
+    index_path = str(tmp_path / "index.parquet")
+    build_layered_manifest(
+        image, source, str(tmp_path / "manifest.parquet"), index_path
+    )
+    output_dir = tmp_path / "out"
+
+    # Act
+    extract_members(
+        index_path, ["etc/config", "bin/tool-link", "opt/data/new"], str(output_dir)
+    )
+
+    # Assert
+    assert (output_dir / "etc/config").read_bytes() == b"v2"
+    assert (output_dir / "bin/tool-link").read_bytes() == b"tool"
+    assert (output_dir / "opt/data/new").read_bytes() == b"new"
+
+
+def test_cached_layers_are_not_hashed_again(oci_layout, tmp_path, monkeypatch):
+    # Arrange
+    layer_cache = ContentCache(str(tmp_path / "layers"))
+    build_layered_manifest(
+        oci_layout,
+        "oci",
+        str(tmp_path / "first.parquet"),
+        str(tmp_path / "first_index.parquet"),
+        layer_cache=layer_cache,
+    )
+
+    def fail(*args, **kwargs):
+        raise AssertionError("layer hashed again")
+
+    monkeypatch.setattr(layers, "hash_layer", fail)
+    manifest_path = tmp_path / "second.parquet"
+
+    # Act
+    build_layered_manifest(
+        oci_layout,
+        "oci",
+        str(manifest_path),
+        str(tmp_path / "second_index.parquet"),
+        jobs=2,
+        layer_cache=layer_cache,
+    )
+
+    # Assert
+    manifest = load_manifest(str(manifest_path))
+    assert dict(zip(manifest["path"], manifest["hash"])) == EXPECTED_FILES
+    assert layer_cache.hits == 2
+
+
+def test_filtered_layers_are_cached_separately(oci_layout, tmp_path):
+    # Arrange
+    layer_cache = ContentCache(str(tmp_path / "layers"))
+    build_layered_manifest(
+        oci_layout,
+        "oci",
+        str(tmp_path / "full.parquet"),
+        str(tmp_path / "full_index.parquet"),
+        layer_cache=layer_cache,
+    )
+    manifest_path = tmp_path / "filtered.parquet"
+
+    # Act
+    files = build_layered_manifest(
+        oci_layout,
+        "oci",
+        str(manifest_path),
+        str(tmp_path / "filtered_index.parquet"),
+        layer_cache=layer_cache,
+        path_filter=PathFilter(exclude=("/bin/tool",)),
+    )
+
+    # Assert
+    manifest = load_manifest(str(manifest_path))
+    assert files == 2
+    assert dict(zip(manifest["path"], manifest["hash"])) == {
+        path: digest
+        for path, digest in EXPECTED_FILES.items()
+        if not path.startswith("bin/")
+    }
+    assert layer_cache.hits == 0
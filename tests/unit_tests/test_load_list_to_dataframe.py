@@ -1,7 +1,7 @@
 import pytest
 import polars as pl
 import shutil
-from container_diffoscope.main import load_list_to_dataframe
+from container_diffoscope.comparator import load_list_to_dataframe
 
 
 @pytest.fixture(autouse=True)
@@ -43,3 +43,13 @@ def test_load_list_to_dataframe_empty_file(tmp_path):
 def test_load_list_to_dataframe_nonexistent_file():
     with pytest.raises(FileNotFoundError):
         load_list_to_dataframe("nonexistent.txt")
+
+
+def test_load_list_to_dataframe_paths_with_spaces(tmp_path):
+    hash_file = tmp_path / "hash_list.txt"
+    hash_file.write_text("abc123  /opt/My Documents/file name.txt\n")
+
+    df = load_list_to_dataframe(str(hash_file))
+
+    assert df["hash"].to_list() == ["abc123"]
+    assert df["path"].to_list() == ["/opt/My Documents/file name.txt"]
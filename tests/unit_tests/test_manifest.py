@@ -0,0 +1,95 @@
+import hashlib
+import polars as pl
+import pytest
+from container_diffoscope.manifest import (
+    check_hash_algorithms,
+    export_text_manifest,
+    import_text_manifest,
+    load_hash_algorithm,
+    load_manifest,
+    write_manifest,
+)
+
+
+@pytest.fixture
+def manifest():
+    return pl.DataFrame(
+        {
+            "hash": [hashlib.sha256(b"a").digest(), hashlib.sha256(b"b").digest()],
+            "path": ["bin/a", "opt/with space/b"],
+        }
+    )
+
+
+def test_write_and_load_manifest(manifest, tmp_path):
+    # Arrange
+    path = tmp_path / "manifest.parquet"
+
+    # Act
+    write_manifest(manifest, str(path))
+    result = load_manifest(str(path))
+
+    # Assert
+    assert result.schema == {"hash": pl.Binary, "path": pl.String}
+    assert result.equals(manifest)
+
+
+def test_text_manifest_round_trip(manifest, tmp_path):
+    # Arrange
+    path = tmp_path / "list.txt"
+
+    # Act
+    export_text_manifest(manifest, str(path))
+    result = import_text_manifest(str(path))
+
+    # Assert
+    assert path.read_text().splitlines()[0] == (
+        hashlib.sha256(b"a").hexdigest() + "  bin/a"
+    )
+    assert result.equals(manifest)
+
+
+def test_import_empty_text_manifest(tmp_path):
+    # Arrange
+    path = tmp_path / "empty.txt"
+    path.write_text("")
+
+    # Act
+    result = import_text_manifest(str(path))
+
+    # Assert
+    assert result.is_empty()
+    assert result.schema == {"hash": pl.Binary, "path": pl.String}
+
+
+def test_hash_algorithm_is_recorded(manifest, tmp_path):
+    # Arrange
+    sha256_path = tmp_path / "sha256.parquet"
+    blake2b_path = tmp_path / "blake2b.parquet"
+    legacy_path = tmp_path / "legacy.parquet"
+    manifest.write_parquet(legacy_path)
+
+    # Act
+    write_manifest(manifest, str(sha256_path))
+    write_manifest(manifest, str(blake2b_path), "blake2b")
+
+    # Assert
+    assert load_hash_algorithm(str(blake2b_path)) == "blake2b"
+    assert load_hash_algorithm(str(legacy_path)) == "sha256"
+    assert check_hash_algorithms(str(sha256_path), str(legacy_path)) == "sha256"
+    with pytest.raises(ValueError, match="different algorithms"):
+        check_hash_algorithms(str(sha256_path), str(blake2b_path))
+
+
+def test_manifest_written_sorted_is_loaded_as_sorted(manifest, tmp_path):
+    # Arrange
+    sorted_path = tmp_path / "sorted.parquet"
+    legacy_path = tmp_path / "legacy.parquet"
+    manifest.reverse().write_parquet(legacy_path)
+
+    # Act
+    write_manifest(manifest.reverse(), str(sorted_path))
+
+    # Assert
+    assert load_manifest(str(sorted_path))["path"].flags["SORTED_ASC"]
+    assert not load_manifest(str(legacy_path))["path"].flags["SORTED_ASC"]
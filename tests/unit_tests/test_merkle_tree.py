@@ -0,0 +1,198 @@
+import polars as pl
+import pytest
+from container_diffoscope.comparator import (
+    build_merkle_tree,
+    changed_directories,
+    compare_file_lists,
+    compare_manifest_trees,
+    summarize_by_directory,
+)
+
+
+def _manifest(files: dict[str, bytes]) -> pl.DataFrame:
+    return pl.DataFrame(
+        {"hash": list(files.values()), "path": list(files)},
+        schema={"hash": pl.Binary, "path": pl.String},
+    )
+
+
+BASE = {
+    "etc/hostname": b"1",
+    "usr/lib/python3/a.py": b"2",
+    "usr/lib/python3/b.py": b"3",
+    "usr/share/doc/readme": b"4",
+    "opt/app/bin/app": b"5",
+}
+
+
+def _hashes(tree: pl.DataFrame) -> dict[str, bytes]:
+    return dict(zip(tree["directory"], tree["hash"]))
+
+
+def test_merkle_tree_hashes_every_directory():
+    # Act
+    tree = build_merkle_tree(_manifest(BASE))
+
+    # Assert
+    assert sorted(tree["directory"]) == [
+        "",
+        "etc",
+        "opt",
+        "opt/app",
+        "opt/app/bin",
+        "usr",
+        "usr/lib",
+        "usr/lib/python3",
+        "usr/share",
+        "usr/share/doc",
+    ]
+    assert dict(zip(tree["directory"], tree["files"]))["usr"] == 3
+
+
+def test_merkle_tree_does_not_depend_on_the_order_of_the_manifest():
+    # Act
+    tree_1 = build_merkle_tree(_manifest(BASE))
+    tree_2 = build_merkle_tree(_manifest(dict(reversed(list(BASE.items())))))
+
+    # Assert
+    assert _hashes(tree_1) == _hashes(tree_2)
+
+
+def test_changed_file_only_changes_its_ancestors():
+    # Arrange
+    changed = {**BASE, "usr/lib/python3/a.py": b"9"}
+
+    # Act
+    directories = changed_directories(
+        build_merkle_tree(_manifest(BASE)), build_merkle_tree(_manifest(changed))
+    )
+
+    # Assert
+    assert sorted(directories) == ["", "usr", "usr/lib", "usr/lib/python3"]
+
+
+def test_moved_file_changes_both_directories():
+    # Arrange
+    moved = dict(BASE)
+    moved["usr/share/a.py"] = moved.pop("usr/lib/python3/a.py")
+
+    # Act
+    directories = changed_directories(
+        build_merkle_tree(_manifest(BASE)), build_merkle_tree(_manifest(moved))
+    )
+
+    # Assert
+    assert sorted(directories) == [
+        "",
+        "usr",
+        "usr/lib",
+        "usr/lib/python3",
+        "usr/share",
+    ]
+
+
+def test_identical_manifests_have_no_changed_directory():
+    # Act
+    directories = changed_directories(
+        build_merkle_tree(_manifest(BASE)), build_merkle_tree(_manifest(BASE))
+    )
+
+    # Assert
+    assert directories.is_empty()
+
+
+# Names sorting between a directory and its files: "usr/lib-x/" and "usr/lib.so"
+# come before "usr/lib/" in a manifest sorted by path
+NEIGHBOURS = {
+    **BASE,
+    "usr/lib-x/c.py": b"6",
+    "usr/lib.so": b"7",
+    "usr/lib0": b"8",
+    "usr/lib/python3-x/d.py": b"9",
+}
+
+
+@pytest.mark.parametrize(
+    "files_1, files_2",
+    [
+        (
+            BASE,
+            {
+                **{
+                    path: hash
+                    for path, hash in BASE.items()
+                    if path != "opt/app/bin/app"
+                },
+                "usr/lib/python3/a.py": b"9",
+                "etc/hosts": b"6",
+            },
+        ),
+        (
+            NEIGHBOURS,
+            {
+                **NEIGHBOURS,
+                "usr/lib/python3/a.py": b"0",
+                "usr/lib.so": b"0",
+                "usr/lib-x/new/e.py": b"0",
+            },
+        ),
+        (NEIGHBOURS, {}),
+        (BASE, BASE),
+    ],
+)
+def test_compare_manifest_trees_matches_the_full_comparison(files_1, files_2):
+    # Arrange
+    df1 = _manifest(files_1)
+    df2 = _manifest(files_2)
+
+    # Act
+    common_rows, *others = compare_manifest_trees(
+        df1, build_merkle_tree(df1), df2, build_merkle_tree(df2)
+    )
+
+    # Assert
+    pruned = [common_rows.collect(), *others]
+    for result, expected in zip(pruned, compare_file_lists(df1, df2)):
+        assert result.sort("path").equals(expected.sort("path"))
+
+
+def test_identical_subtrees_are_never_entered():
+    # Arrange
+    df1 = _manifest(BASE)
+    df2 = _manifest({**BASE, "usr/lib/python3/a.py": b"9"})
+    tree_1 = build_merkle_tree(df1)
+    tree_2 = build_merkle_tree(df2)
+    # Below the directories left identical, the second tree and manifest disagree
+    # with the first: reading any of their rows would report a change
+    hidden = pl.col("directory").is_in(["usr/share/doc", "opt/app", "opt/app/bin"])
+    tree_2 = tree_2.with_columns(
+        pl.when(hidden).then(pl.lit(b"x")).otherwise("hash").alias("hash")
+    )
+    df2 = _manifest(
+        {**BASE, "usr/lib/python3/a.py": b"9", "usr/share/doc/readme": b"x"}
+    )
+
+    # Act
+    directories = changed_directories(tree_1, tree_2)
+    common_rows, changed_files, only_in_df1, only_in_df2 = compare_manifest_trees(
+        df1, tree_1, df2, tree_2
+    )
+
+    # Assert
+    assert sorted(directories) == ["", "usr", "usr/lib", "usr/lib/python3"]
+    assert changed_files["path"].to_list() == ["usr/lib/python3/a.py"]
+    assert only_in_df1.is_empty() and only_in_df2.is_empty()
+    assert common_rows.select(pl.len()).collect().item() == 4
+
+
+def test_summarize_by_directory():
+    # Arrange
+    df1 = _manifest(BASE)
+    df2 = _manifest({**BASE, "etc/hostname": b"9", "etc/hosts": b"6"})
+    _, changed_files, only_in_df1, only_in_df2 = compare_file_lists(df1, df2)
+
+    # Act
+    summary = summarize_by_directory(changed_files, only_in_df1, only_in_df2)
+
+    # Assert
+    assert summary.rows() == [("etc", 1, 0, 1, 2)]
@@ -0,0 +1,54 @@
+import pytest
+from container_diffoscope.globs import PathFilter, build_path_filter, load_filter_file
+
+
+@pytest.mark.parametrize(
+    "path_filter, path, kept",
+    [
+        (PathFilter(exclude=("/usr/share/doc",)), "usr/share/doc/bash/README", False),
+        (
+            PathFilter(exclude=("/usr/share/doc/**",)),
+            "usr/share/doc/bash/README",
+            False,
+        ),
+        (PathFilter(exclude=("/usr/share/doc",)), "usr/share/docs/README", True),
+        (PathFilter(exclude=("*.pyc",)), "usr/lib/python3/a.cpython-312.pyc", False),
+        (PathFilter(exclude=("__pycache__",)), "usr/lib/__pycache__/a.py", False),
+        (PathFilter(include=("/etc",)), "etc/ssh/sshd_config", True),
+        (PathFilter(include=("/etc",)), "usr/bin/ssh", False),
+        (PathFilter(include=("/etc",), exclude=("/etc/ssl",)), "etc/ssl/cert", False),
+    ],
+)
+def test_path_filter_keeps(path_filter, path, kept):
+    # Act / Assert
+    assert path_filter.keeps(path) is kept
+
+
+def test_load_filter_file(tmp_path):
+    # Arrange
+    filter_file = tmp_path / "filters"
+    filter_file.write_text(
+        "# Noise\n/usr/share/doc\n- *.pyc\n\n+ /etc\n+ /usr/bin/**\n"
+    )
+
+    # Act
+    include, exclude = load_filter_file(str(filter_file))
+
+    # Assert
+    assert include == ["/etc", "/usr/bin/**"]
+    assert exclude == ["/usr/share/doc", "*.pyc"]
+
+
+def test_build_path_filter_combines_the_globs(tmp_path):
+    # Arrange
+    filter_file = tmp_path / "filters"
+    filter_file.write_text("/var/cache/apt\n")
+
+    # Act
+    path_filter = build_path_filter([], ["*.pyc"], str(filter_file))
+
+    # Assert
+    assert path_filter is not None
+    assert path_filter == PathFilter((), ("*.pyc", "/var/cache/apt"))
+    assert build_path_filter() is None
+    assert path_filter.fingerprint != PathFilter((), ("*.pyc",)).fingerprint
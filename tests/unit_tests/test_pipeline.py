@@ -0,0 +1,127 @@
+import asyncio
+import io
+import tarfile
+import pytest
+from container_diffoscope.cache import ContentCache
+from container_diffoscope.diffoscope_runner import DIFF_OK, DIFF_SKIPPED, DiffResult
+from container_diffoscope.extractor import open_image
+from container_diffoscope.pipeline import StageTimes, diff_changed_files
+
+
+def _rootfs(path, files: dict[str, bytes]) -> str:
+    with tarfile.open(path, "w") as tar:
+        for name, content in files.items():
+            info = tarfile.TarInfo(name)
+            info.size = len(content)
+            tar.addfile(info, io.BytesIO(content))
+    return str(path)
+
+
+@pytest.fixture
+def entries(tmp_path):
+    """Store two flattened filesystems that differ in 70 files."""
+    paths = [f"etc/file-{number}" for number in range(70)]
+    rootfs_1 = _rootfs(tmp_path / "1.tar", {path: b"old" for path in paths})
+    rootfs_2 = _rootfs(tmp_path / "2.tar", {path: b"new" for path in paths})
+    store = ContentCache(str(tmp_path / "images"))
+    with open_image(rootfs_1, store) as entry_1, open_image(rootfs_2, store) as entry_2:
+        yield paths, entry_1, entry_2
+
+
+def test_diff_changed_files_diffs_every_path(entries, tmp_path):
+    # Arrange
+    paths, entry_1, entry_2 = entries
+    diffed = []
+
+    def diff(
+        path: str, file_path_1: str, file_path_2: str, timeout: float | None
+    ) -> DiffResult:
+        with open(file_path_1, "rb") as file_1, open(file_path_2, "rb") as file_2:
+            diffed.append((path, file_1.read(), file_2.read()))
+        return DiffResult(path, DIFF_OK)
+
+    times = StageTimes()
+
+    # Act
+    results = asyncio.run(
+        diff_changed_files(
+            paths, entry_1, entry_2, str(tmp_path / "scratch"), diff, times, 3
+        )
+    )
+
+    # Assert
+    assert {result.path for result in results} == set(paths)
+    assert sorted(diffed) == sorted((path, b"old", b"new") for path in paths)
+    assert set(times.stages) == {"extract", "diff"}
+
+
+def test_stage_times_spans_repeated_stage():
+    # Arrange
+    times = StageTimes()
+
+    # Act
+    with times.measure("extract"):
+        pass
+    with times.measure("diff"):
+        pass
+    with times.measure("extract"):
+        pass
+
+    # Assert
+    extract_start, extract_end = times.stages["extract"]
+    diff_start, diff_end = times.stages["diff"]
+    assert extract_start <= diff_start <= diff_end <= extract_end
+    assert times.report().splitlines()[0].startswith("  extract:")
+
+
+def test_diff_changed_files_reports_failing_diff(entries, tmp_path):
+    # Arrange
+    paths, entry_1, entry_2 = entries
+
+    def diff(
+        path: str, file_path_1: str, file_path_2: str, timeout: float | None
+    ) -> DiffResult:
+        raise RuntimeError(f"cannot diff {path}")
+
+    # Act & Assert
+    with pytest.raises(RuntimeError, match="cannot diff"):
+        asyncio.run(
+            asyncio.wait_for(
+                diff_changed_files(
+                    paths * 3,
+                    entry_1,
+                    entry_2,
+                    str(tmp_path / "scratch"),
+                    diff,
+                    StageTimes(),
+                ),
+                timeout=30,
+            )
+        )
+
+
+def test_diff_changed_files_skips_paths_past_budget(entries, tmp_path):
+    # Arrange
+    paths, entry_1, entry_2 = entries
+
+    def diff(
+        path: str, file_path_1: str, file_path_2: str, timeout: float | None
+    ) -> DiffResult:
+        raise AssertionError("diff started past the budget")
+
+    # Act
+    results = asyncio.run(
+        diff_changed_files(
+            paths,
+            entry_1,
+            entry_2,
+            str(tmp_path / "scratch"),
+            diff,
+            StageTimes(),
+            budget=0,
+        )
+    )
+
+    # Assert
+    assert sorted(result.path for result in results) == sorted(paths)
+    assert {result.status for result in results} == {DIFF_SKIPPED}
@@ -0,0 +1,66 @@
+import asyncio
+import json
+from container_diffoscope.profiling import StageTimes
+
+
+def test_stage_times_without_profile_records_no_event():
+    # Arrange
+    times = StageTimes()
+
+    # Act
+    with times.measure("diff", "etc/config"):
+        pass
+    times.count("hash", files=3)
+
+    # Assert
+    assert set(times.stages) == {"diff"}
+    assert times.events == []
+    assert times.metrics()["stages"]["diff"].keys() == {"started_at", "wall_seconds"}
+
+
+def test_stage_times_metrics_sum_counters_and_named_runs():
+    # Arrange
+    times = StageTimes(profile=True)
+
+    # Act
+    with times.measure("hash"):
+        sum(range(100_000))
+    times.count("hash", files=2, bytes=100)
+    times.count("hash", files=3, bytes=50)
+    for path in ("etc/a", "etc/b"):
+        asyncio.run(times.run("diff", len, path, name=path))
+    metrics = times.metrics()
+
+    # Assert
+    hash_stage = metrics["stages"]["hash"]
+    assert hash_stage["files"] == 5
+    assert hash_stage["bytes"] == 150
+    assert hash_stage["files_per_second"] > 0
+    assert hash_stage["runs"] == 1
+    assert hash_stage["cpu_seconds"] > 0
+    assert "named_runs" not in hash_stage
+    diff_stage = metrics["stages"]["diff"]
+    assert diff_stage["runs"] == 2
+    assert [run["name"] for run in diff_stage["named_runs"]] == ["etc/a", "etc/b"]
+    assert metrics["peak_rss_mb"] > 0
+
+
+def test_stage_times_write_trace(tmp_path):
+    # Arrange
+    times = StageTimes(profile=True)
+    path = tmp_path / "trace.json"
+
+    # Act
+    asyncio.run(times.run("extract", len, "abc"))
+    with times.measure("compare"):
+        pass
+    times.write_trace(str(path))
+
+    # Assert
+    events = json.loads(path.read_text())["traceEvents"]
+    threads = {event["tid"] for event in events if event["ph"] == "M"}
+    spans = [event for event in events if event["ph"] == "X"]
+    assert [span["name"] for span in spans] == ["extract", "compare"]
+    assert {span["tid"] for span in spans} == threads
+    assert len(threads) == 2
+    assert all(span["dur"] >= 0 and "cpu_ms" in span["args"] for span in spans)
@@ -0,0 +1,178 @@
+import io
+import os
+import tarfile
+import polars as pl
+import pytest
+from container_diffoscope import hasher
+from container_diffoscope.cache import ContentCache
+from container_diffoscope.extractor import INDEX_FILE, open_image
+from container_diffoscope.quick import (
+    HEADER_SCHEMA,
+    compare_headers,
+    load_headers,
+    metadata_changes,
+    quick_compare,
+)
+
+
+def _write_rootfs(path, files):
+    """Write a flattened filesystem with (name, content, mtime, mode) files."""
+    with tarfile.open(path, "w") as tar:
+        for name, content, mtime, mode in files:
+            info = tarfile.TarInfo(name)
+            info.size = len(content)
+            info.mtime = mtime
+            info.mode = mode
+            tar.addfile(info, io.BytesIO(content))
+    return str(path)
+
+
+@pytest.fixture
+def rootfs_pair(tmp_path):
+    """Create two versions of a filesystem differing in every possible way."""
+    image_1 = _write_rootfs(
+        tmp_path / "image_1.tar",
+        [
+            ("etc/same", b"same", 1, 0o644),
+            ("etc/touched", b"touch", 1, 0o644),
+            ("etc/edited", b"aaaa", 1, 0o644),
+            ("etc/grown", b"1", 1, 0o644),
+            ("etc/perm", b"perm", 1, 0o644),
+            ("etc/removed", b"gone", 1, 0o644),
+        ],
+    )
+    image_2 = _write_rootfs(
+        tmp_path / "image_2.tar",
+        [
+            ("etc/same", b"same", 1, 0o644),
+            ("etc/touched", b"touch", 2, 0o644),
+            ("etc/edited", b"bbbb", 2, 0o644),
+            ("etc/grown", b"22", 1, 0o644),
+            ("etc/perm", b"perm", 1, 0o600),
+            ("etc/added", b"new", 1, 0o644),
+        ],
+    )
+    return image_1, image_2
+
+
+def _headers(rows):
+    return pl.DataFrame(
+        [
+            {"path": path, "size": size, "mode": 0o644, "uid": 0, "gid": 0}
+            | {"mtime": mtime, "linkname": ""}
+            for path, size, mtime in rows
+        ],
+        schema=HEADER_SCHEMA,
+    )
+
+
+def test_compare_headers_classifies_files():
+    # Arrange
+    headers_1 = _headers([("a", 1, 1), ("b", 1, 1), ("c", 1, 1), ("d", 1, 1)])
+    headers_2 = _headers([("a", 1, 1), ("b", 1, 2), ("c", 2, 1), ("e", 1, 1)])
+
+    # Act
+    common, ambiguous, changed, only_in_1, only_in_2 = compare_headers(
+        headers_1, headers_2
+    )
+
+    # Assert
+    assert common["path"].to_list() == ["a"]
+    assert ambiguous["path"].to_list() == ["b"]
+    assert changed["path"].to_list() == ["c"]
+    assert only_in_1["path"].to_list() == ["d"]
+    assert only_in_2["path"].to_list() == ["e"]
+
+
+def test_metadata_changes_names_the_change():
+    # Arrange
+    files = pl.DataFrame(
+        {
+            "path": ["mode", "owner", "both", "none"],
+            "mode": [0o644, 0o644, 0o644, 0o644],
+            "mode_2": [0o600, 0o644, 0o755, 0o644],
+            "uid": [0, 0, 0, 0],
+            "uid_2": [0, 1000, 1000, 0],
+            "gid": [0, 0, 0, 0],
+            "gid_2": [0, 0, 0, 0],
+        }
+    )
+
+    # Act
+    changes = metadata_changes(files)
+
+    # Assert
+    assert dict(zip(changes["path"], changes["change"])) == {
+        "both": "mode, owner",
+        "mode": "mode",
+        "owner": "owner",
+    }
+
+
+def test_load_headers_resolves_hard_links(tmp_path):
+    # Arrange
+    path = tmp_path / "rootfs.tar"
+    with tarfile.open(path, "w") as tar:
+        info = tarfile.TarInfo("bin/tool")
+        info.size = 4
+        info.mode = 0o755
+        tar.addfile(info, io.BytesIO(b"tool"))
+        link = tarfile.TarInfo("bin/alias")
+        link.type = tarfile.LNKTYPE
+        link.linkname = "bin/tool"
+        tar.addfile(link)
+    store = ContentCache(str(tmp_path / "images"))
+
+    # Act
+    with open_image(str(path), store, quick=True) as entry_dir:
+        headers = load_headers(os.path.join(entry_dir, INDEX_FILE))
+
+    # Assert
+    assert headers["path"].to_list() == ["bin/alias", "bin/tool"]
+    assert headers["size"].to_list() == [4, 4]
+    assert headers["mode"].to_list() == [0o755, 0o755]
+
+
+def test_quick_compare_hashes_only_ambiguous_files(rootfs_pair, tmp_path):
+    # Arrange
+    store = ContentCache(str(tmp_path / "images"))
+    image_1, image_2 = rootfs_pair
+
+    # Act
+    with (
+        open_image(image_1, store, quick=True) as entry_1,
+        open_image(image_2, store, quick=True) as entry_2,
+    ):
+        comparison = quick_compare(
+            os.path.join(entry_1, INDEX_FILE),
+            os.path.join(entry_2, INDEX_FILE),
+            str(tmp_path / "scratch"),
+        )
+
+    # Assert
+    assert comparison.common == 3
+    assert comparison.hashed == 2
+    assert comparison.changed["path"].to_list() == ["etc/edited", "etc/grown"]
+    assert comparison.only_in_1["path"].to_list() == ["etc/removed"]
+    assert comparison.only_in_2["path"].to_list() == ["etc/added"]
+    assert comparison.metadata_changes["path"].to_list() == ["etc/perm"]
+    assert comparison.metadata_changes["mode_2"].to_list() == [0o600]
+
+
+def test_quick_ingestion_reads_no_payload(rootfs_pair, tmp_path, monkeypatch):
+    # Arrange
+    store = ContentCache(str(tmp_path / "images"))
+    image_1, _ = rootfs_pair
+
+    def fail(*args, **kwargs):
+        raise AssertionError("payload hashed")
+
+    monkeypatch.setattr(hasher, "hash_stream", fail)
+    monkeypatch.setattr(hasher, "_hash_range", fail)
+
+    # Act
+    with open_image(image_1, store, quick=True) as entry_dir:
+        headers = load_headers(os.path.join(entry_dir, INDEX_FILE))
+
+    # Assert
+    assert len(headers) == 6
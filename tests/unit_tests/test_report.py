@@ -0,0 +1,94 @@
+import json
+import os
+import polars as pl
+import pytest
+from container_diffoscope.diffoscope_runner import DIFF_OK, DIFF_SKIPPED, DiffResult
+from container_diffoscope.report import (
+    DIFF_INDEX,
+    REPORT_DIR,
+    write_frame,
+    write_report,
+)
+
+CHANGED = pl.DataFrame(
+    {
+        "hash": [b"\x01\x02", b"\xff"],
+        "path": ["etc/a", "etc/b"],
+        "hash_2": [b"\x03", b"\x00"],
+    }
+)
+
+
+def test_write_frame_ndjson_encodes_digests_as_hex(tmp_path):
+    # Arrange
+    path = tmp_path / "changed.ndjson"
+
+    # Act
+    write_frame(CHANGED.lazy(), str(path), "ndjson")
+
+    # Assert
+    rows = [json.loads(line) for line in path.read_text().splitlines()]
+    assert rows == [
+        {"hash": "0102", "path": "etc/a", "hash_2": "03"},
+        {"hash": "ff", "path": "etc/b", "hash_2": "00"},
+    ]
+
+
+def test_write_frame_parquet_keeps_binary_digests(tmp_path):
+    # Arrange
+    path = tmp_path / "changed.parquet"
+
+    # Act
+    write_frame(CHANGED, str(path), "parquet")
+
+    # Assert
+    assert pl.read_parquet(path).equals(CHANGED)
+
+
+def test_write_frame_rejects_unknown_format(tmp_path):
+    # Act / Assert
+    with pytest.raises(ValueError, match="Unknown report format"):
+        write_frame(CHANGED, str(tmp_path / "changed.csv"), "csv")
+
+
+def test_write_report_writes_categories_and_diff_index(tmp_path):
+    # Arrange
+    export_dir = str(tmp_path / "file_diff")
+    results = [
+        DiffResult("etc/b", DIFF_SKIPPED, message="byte budget exhausted"),
+        DiffResult("etc/a", DIFF_OK, os.path.join(export_dir, "files/etc/a.md"), 0.5),
+    ]
+    categories = {
+        "changed": CHANGED,
+        "only_in_1": pl.DataFrame(schema=CHANGED.drop("hash_2").schema),
+    }
+
+    # Act
+    report_dir = write_report(categories, results, export_dir, "json")
+
+    # Assert
+    assert report_dir == os.path.join(export_dir, REPORT_DIR)
+    assert sorted(os.listdir(report_dir)) == [
+        "changed.json",
+        f"{DIFF_INDEX}.json",
+        "only_in_1.json",
+    ]
+    with open(os.path.join(report_dir, f"{DIFF_INDEX}.json")) as index:
+        assert json.load(index) == [
+            {
+                "path": "etc/a",
+                "status": DIFF_OK,
+                "output": "files/etc/a.md",
+                "duration": 0.5,
+                "message": "",
+            },
+            {
+                "path": "etc/b",
+                "status": DIFF_SKIPPED,
+                "output": None,
+                "duration": 0.0,
+                "message": "byte budget exhausted",
+            },
+        ]
+    with open(os.path.join(report_dir, "only_in_1.json")) as only_in_1:
+        assert json.load(only_in_1) == []
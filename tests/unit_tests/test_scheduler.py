@@ -0,0 +1,132 @@
+import polars as pl
+import pytest
+from container_diffoscope.diff_cache import ChangeGroup
+from container_diffoscope.diffoscope_runner import DIFF_SKIPPED, DiffResult
+from container_diffoscope.globs import compile_globs
+from container_diffoscope.scheduler import (
+    BYTE_BUDGET_EXHAUSTED,
+    DiffBudget,
+    apply_byte_budget,
+    parse_budget,
+    rank_changed_files,
+)
+
+
+@pytest.mark.parametrize(
+    "budget, expected",
+    [
+        ("0", DiffBudget()),
+        ("90s", DiffBudget(seconds=90.0)),
+        ("5min", DiffBudget(seconds=300.0)),
+        ("1h", DiffBudget(seconds=3600.0)),
+        ("500MiB", DiffBudget(bytes=500 * 1024**2)),
+        ("100B", DiffBudget(bytes=100)),
+        ("120s, 2GiB", DiffBudget(seconds=120.0, bytes=2 * 1024**3)),
+    ],
+)
+def test_parse_budget(budget, expected):
+    # Act / Assert
+    assert parse_budget(budget) == expected
+
+
+@pytest.mark.parametrize("budget", ["300", "5m", "2G", "10 minutes"])
+def test_parse_budget_rejects_ambiguous_units(budget):
+    # Act / Assert
+    with pytest.raises(ValueError, match="Invalid budget"):
+        parse_budget(budget)
+
+
+@pytest.mark.parametrize(
+    "pattern, path, matches",
+    [
+        ("/etc/**", "/etc/ssh/sshd_config", True),
+        ("/etc/**", "/usr/etc/passwd", False),
+        ("*.pyc", "/usr/lib/python3/__pycache__/a.cpython-312.pyc", True),
+        ("/usr/share/doc", "/usr/share/doc", True),
+        ("usr/*/doc/**", "/usr/share/doc/a/b", True),
+        ("/usr/*/doc/**", "/usr/share/local/doc/a", False),
+        ("/opt/app-?.conf", "/opt/app-1.conf", True),
+        ("**/__pycache__/**", "/__pycache__/x.pyc", True),
+    ],
+)
+def test_compile_globs(pattern, path, matches):
+    # Arrange
+    matcher = compile_globs([pattern])
+
+    # Act / Assert
+    assert matcher is not None
+    assert bool(matcher.match(path)) is matches
+
+
+def test_rank_changed_files_orders_by_glob_type_and_cost():
+    # Arrange
+    changed_files = pl.DataFrame(
+        {
+            "hash": [b"1", b"2", b"3", b"4", b"5"],
+            "path": [
+                "usr/lib/libbig.so",
+                "usr/bin/tool",
+                "etc/app.conf",
+                "usr/share/small.txt",
+                "etc/ld.so.cache.so",
+            ],
+            "hash_2": [b"6", b"7", b"8", b"9", b"0"],
+        }
+    )
+    sizes = pl.DataFrame(
+        {
+            "path": [
+                "usr/lib/libbig.so",
+                "usr/bin/tool",
+                "etc/app.conf",
+                "usr/share/small.txt",
+                "usr/share/small.txt",
+            ],
+            "size": [10, 500, 900, 5, 5],
+        },
+        schema={"path": pl.String, "size": pl.UInt64},
+    )
+
+    # Act
+    ranked = rank_changed_files(changed_files, sizes, ["/etc/**"])
+
+    # Assert
+    assert ranked["path"].to_list() == [
+        "etc/app.conf",
+        "etc/ld.so.cache.so",
+        "usr/share/small.txt",
+        "usr/bin/tool",
+        "usr/lib/libbig.so",
+    ]
+    assert ranked["cost"].to_list() == [900, 0, 10, 500, 10]
+
+
+def test_apply_byte_budget_skips_what_does_not_fit():
+    # Arrange
+    groups = [
+        ChangeGroup("etc/a", b"1", b"2"),
+        ChangeGroup("usr/big", b"3", b"4"),
+        ChangeGroup("usr/small", b"5", b"6"),
+    ]
+    costs = {"etc/a": 60, "usr/big": 50, "usr/small": 40}
+
+    # Act
+    scheduled, skipped = apply_byte_budget(groups, costs, 100)
+
+    # Assert
+    assert [group.path for group in scheduled] == ["etc/a", "usr/small"]
+    assert skipped == [
+        DiffResult("usr/big", DIFF_SKIPPED, message=BYTE_BUDGET_EXHAUSTED)
+    ]
+
+
+def test_apply_byte_budget_without_limit_keeps_everything():
+    # Arrange
+    groups = [ChangeGroup("etc/a", b"1", b"2")]
+
+    # Act
+    scheduled, skipped = apply_byte_budget(groups, {"etc/a": 10**12}, None)
+
+    # Assert
+    assert scheduled == groups
+    assert skipped == []
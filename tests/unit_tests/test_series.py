@@ -0,0 +1,138 @@
+import io
+import os
+import tarfile
+import threading
+import time
+import polars as pl
+import pytest
+from container_diffoscope import extractor
+from container_diffoscope.cache import ContentCache
+from container_diffoscope.comparator import build_merkle_tree
+from container_diffoscope.main import compare_series
+from container_diffoscope.series import HISTORY_FILE, build_history, series_pairs
+
+
+def _manifest(files: dict[str, bytes]) -> pl.DataFrame:
+    return pl.DataFrame(
+        {"hash": list(files.values()), "path": list(files)},
+        schema={"hash": pl.Binary, "path": pl.String},
+    )
+
+
+def _rootfs(path, files: dict[str, bytes]) -> str:
+    with tarfile.open(path, "w") as tar:
+        for name, content in files.items():
+            info = tarfile.TarInfo(name)
+            info.size = len(content)
+            tar.addfile(info, io.BytesIO(content))
+    return str(path)
+
+
+SERIES = [
+    {"etc/a": b"a", "etc/b": b"b", "usr/bin/tool": b"tool"},
+    {"etc/a": b"a2", "etc/b": b"b", "usr/bin/tool": b"tool"},
+    {"etc/a": b"a2", "etc/c": b"c", "usr/bin/tool": b"tool"},
+    {"etc/c": b"c", "usr/bin/tool": b"tool"},
+]
+
+
+@pytest.mark.parametrize(
+    "all_pairs, expected",
+    [
+        (False, [(0, 1), (1, 2), (2, 3)]),
+        (True, [(0, 1), (0, 2), (0, 3), (1, 2), (1, 3), (2, 3)]),
+    ],
+)
+def test_series_pairs(all_pairs, expected):
+    # Act / Assert
+    assert series_pairs(4, all_pairs) == expected
+
+
+def test_build_history_records_every_event():
+    # Arrange
+    manifests = [_manifest(files) for files in SERIES]
+    trees = [build_merkle_tree(manifest) for manifest in manifests]
+
+    # Act
+    history = build_history(manifests, trees, ["v1", "v2", "v3", "v4"])
+
+    # Assert
+    assert history.columns == ["path", "v2", "v3", "v4"]
+    assert history.rows() == [
+        ("etc/a", "changed", None, "removed"),
+        ("etc/b", None, "removed", None),
+        ("etc/c", None, "added", None),
+    ]
+
+
+def test_build_history_refuses_repeated_images():
+    # Arrange
+    manifest = _manifest(SERIES[0])
+    tree = build_merkle_tree(manifest)
+
+    # Act / Assert
+    with pytest.raises(ValueError):
+        build_history([manifest, manifest], [tree, tree], ["v1", "v1"])
+
+
+def test_compare_series_ingests_each_image_once(tmp_path, monkeypatch):
+    # Arrange
+    images = [
+        _rootfs(tmp_path / f"v{number}.tar", files)
+        for number, files in enumerate(SERIES, start=1)
+    ]
+    store = ContentCache(str(tmp_path / "images"))
+    ingested = []
+    ingest_image = extractor.ingest_image
+
+    def counting_ingest(image, *args):
+        ingested.append(image)
+        return ingest_image(image, *args)
+
+    monkeypatch.setattr(extractor, "ingest_image", counting_ingest)
+
+    # Act
+    history = compare_series(
+        images, str(tmp_path / "out"), store=store, diff_options=None, all_pairs=True
+    )
+
+    # Assert
+    assert sorted(ingested) == sorted(os.path.abspath(image) for image in images)
+    assert history.equals(pl.read_parquet(tmp_path / "out" / HISTORY_FILE))
+    assert history["path"].to_list() == ["etc/a", "etc/b", "etc/c"]
+
+
+def test_compare_series_bounds_concurrent_ingestion(tmp_path, monkeypatch):
+    # Arrange
+    images = [
+        _rootfs(tmp_path / f"v{number}.tar", files)
+        for number, files in enumerate(SERIES, start=1)
+    ]
+    lock = threading.Lock()
+    running = []
+    peak = []
+    ingest_image = extractor.ingest_image
+
+    def slow_ingest(image, *args):
+        with lock:
+            running.append(image)
+            peak.append(len(running))
+        time.sleep(0.05)
+        with lock:
+            running.remove(image)
+        return ingest_image(image, *args)
+
+    monkeypatch.setattr(extractor, "ingest_image", slow_ingest)
+
+    # Act
+    compare_series(
+        images,
+        str(tmp_path / "out"),
+        jobs=1,
+        store=ContentCache(str(tmp_path / "images")),
+        diff_options=None,
+    )
+
+    # Assert
+    assert len(peak) == len(images)
+    assert max(peak) == 2
@@ -0,0 +1,203 @@
+import io
+import os
+import tarfile
+import threading
+import pytest
+from container_diffoscope.cache import ContentCache
+from container_diffoscope.extractor import open_image
+from container_diffoscope.main import DiffOptions, run_served_job
+from container_diffoscope.report import DIFF_INDEX, REPORT_DIR
+from container_diffoscope.server import (
+    ComparisonService,
+    QueueFullError,
+    WarmCache,
+    make_server,
+    request_daemon,
+)
+
+
+def _rootfs(path, files: dict[str, bytes]) -> str:
+    with tarfile.open(path, "w") as tar:
+        for name, content in files.items():
+            info = tarfile.TarInfo(name)
+            info.size = len(content)
+            tar.addfile(info, io.BytesIO(content))
+    return str(path)
+
+
+@pytest.fixture
+def images(tmp_path):
+    return (
+        _rootfs(tmp_path / "v1.tar", {"etc/a": b"a\n", "etc/b": b"b\n", "bin/d": b"d"}),
+        _rootfs(
+            tmp_path / "v2.tar", {"etc/a": b"a2\n", "etc/c": b"c\n", "bin/d": b"d"}
+        ),
+    )
+
+
+def _serve(service: ComparisonService, socket_path: str | None = None) -> str:
+    server = make_server(service, port=0, socket_path=socket_path)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    if socket_path is not None:
+        return socket_path
+    host, port = server.socket.getsockname()[:2]
+    return f"{host}:{port}"
+
+
+def _service(tmp_path, warm_cache: WarmCache) -> ComparisonService:
+    store = ContentCache(str(tmp_path / "images"))
+    return ComparisonService(
+        lambda job: run_served_job(job, store, None, DiffOptions(), warm_cache),
+        warm_cache,
+    )
+
+
+def test_daemon_compares_images_with_warm_manifests(images, tmp_path):
+    # Arrange
+    warm_cache = WarmCache(2**30)
+    address = _serve(_service(tmp_path, warm_cache))
+    job = {"image_1": images[0], "image_2": images[1]}
+
+    # Act
+    first = request_daemon(
+        address, "POST", "/compare", {**job, "output_dir": str(tmp_path / "first")}
+    )
+    second = request_daemon(
+        address, "POST", "/compare", {**job, "output_dir": str(tmp_path / "second")}
+    )
+    status = request_daemon(address, "GET", "/status")
+
+    # Assert
+    assert first[0] == second[0] == 200
+    assert first[1]["files"] == {
+        "common": 1,
+        "changed": 1,
+        "only_in_1": 1,
+        "only_in_2": 1,
+    }
+    assert second[1]["files"] == first[1]["files"]
+    report_dir = second[1]["report_dir"]
+    assert report_dir == str(tmp_path / "second" / "file_diff" / REPORT_DIR)
+    assert f"{DIFF_INDEX}.ndjson" in os.listdir(report_dir)
+    assert status[1]["completed"] == 2
+    assert status[1]["warm_cache"]["entries"] == 2
+    assert status[1]["warm_cache"]["misses"] == 2
+    assert status[1]["warm_cache"]["hits"] == 2
+
+
+def test_daemon_listens_on_unix_socket(images, tmp_path):
+    # Arrange
+    address = _serve(
+        _service(tmp_path, WarmCache(2**30)), str(tmp_path / "daemon.sock")
+    )
+
+    # Act
+    status, result = request_daemon(
+        address,
+        "POST",
+        "/compare",
+        {
+            "image_1": images[0],
+            "image_2": images[1],
+            "output_dir": str(tmp_path / "out"),
+            "details": False,
+            "report_format": "json",
+        },
+    )
+
+    # Assert
+    assert status == 200
+    assert result["diffs"] == {}
+    assert "changed.json" in os.listdir(result["report_dir"])
+
+
+@pytest.mark.parametrize(
+    "job",
+    [
+        {"image_1": "a.tar"},
+        {"image_1": "a.tar", "image_2": "b.tar", "output_dir": "relative"},
+        {"image_1": "-", "image_2": "b.tar", "output_dir": "/tmp/out"},
+        {
+            "image_1": "a.tar",
+            "image_2": "b.tar",
+            "output_dir": "/tmp/out",
+            "hash": "md4",
+        },
+    ],
+)
+def test_daemon_rejects_invalid_jobs(tmp_path, job):
+    # Arrange
+    address = _serve(_service(tmp_path, WarmCache(2**30)))
+
+    # Act
+    status, result = request_daemon(address, "POST", "/compare", job)
+
+    # Assert
+    assert status == 400
+    assert result["error"].startswith("Invalid job")
+
+
+def test_comparison_service_refuses_jobs_when_queue_is_full():
+    # Arrange
+    started = threading.Event()
+    release = threading.Event()
+
+    def run_job(job: dict) -> dict:
+        started.set()
+        release.wait()
+        return job
+
+    service = ComparisonService(run_job, WarmCache(0), max_jobs=1, max_queued=0)
+    running = threading.Thread(target=service.submit, args=({"id": 1},))
+    running.start()
+    started.wait()
+
+    # Act / Assert
+    with pytest.raises(QueueFullError):
+        service.submit({"id": 2})
+    assert service.status()["running"] == 1
+    release.set()
+    running.join()
+    assert service.status()["completed"] == 1
+
+
+def test_warm_cache_keeps_recently_used_entries(images, tmp_path):
+    # Arrange
+    store = ContentCache(str(tmp_path / "images"))
+    warm_cache = WarmCache(1)
+
+    # Act
+    with (
+        open_image(images[0], store) as entry_1,
+        open_image(images[1], store) as entry_2,
+    ):
+        first = warm_cache.get(entry_1)
+        warm_cache.get(entry_2)
+        again = warm_cache.get(entry_1)
+
+    # Assert
+    assert first.manifest["path"].to_list() == ["bin/d", "etc/a", "etc/b"]
+    assert again is not first
+    assert warm_cache.stats() == {
+        "entries": 1,
+        "bytes": first.size,
+        "hits": 0,
+        "misses": 3,
+    }
+
+
+def test_comparison_service_frees_slot_when_job_is_interrupted():
+    # Arrange
+    def run_job(job: dict) -> dict:
+        raise KeyboardInterrupt
+
+    service = ComparisonService(run_job, WarmCache(0), max_jobs=1, max_queued=0)
+
+    # Act
+    for _ in range(2):
+        with pytest.raises(KeyboardInterrupt):
+            service.submit({})
+
+    # Assert
+    status = service.status()
+    assert (status["running"], status["queued"], status["failed"]) == (0, 0, 2)
@@ -0,0 +1,177 @@
+import os
+import random
+import subprocess
+import sys
+import textwrap
+import polars as pl
+import pytest
+from container_diffoscope.comparator import (
+    CATEGORIES,
+    build_merkle_tree,
+    changed_directories,
+    compare_file_lists,
+    compare_sorted_manifests,
+    is_sorted_manifest,
+    scan_category,
+)
+from container_diffoscope.manifest import write_manifest
+
+REPOSITORY = os.path.dirname(os.path.dirname(os.path.dirname(__file__)))
+
+
+def _manifests(tmp_path, rows: int = 5000) -> tuple[pl.DataFrame, pl.DataFrame]:
+    """Write two manifests of the same tree with random changes, removals and
+    additions."""
+    generator = random.Random(0)
+    paths = [
+        f"dir-{number % 37}/sub-{number % 5}/file-{number}" for number in range(rows)
+    ]
+    files_1 = {path: generator.randbytes(4) for path in paths}
+    files_2 = {}
+    for path, digest in files_1.items():
+        draw = generator.random()
+        if draw < 0.05:
+            continue
+        files_2[path] = generator.randbytes(4) if draw < 0.1 else digest
+    files_2.update({f"new/file-{number}": b"new" for number in range(100)})
+    df1, df2 = (
+        pl.DataFrame(
+            {"hash": list(files.values()), "path": list(files)},
+            schema={"hash": pl.Binary, "path": pl.String},
+        )
+        for files in (files_1, files_2)
+    )
+    write_manifest(df1, str(tmp_path / "1.parquet"))
+    write_manifest(df2, str(tmp_path / "2.parquet"))
+    return df1, df2
+
+
+@pytest.mark.parametrize("use_tree", [False, True])
+def test_sorted_merge_matches_the_in_memory_comparison(tmp_path, use_tree):
+    # Arrange
+    df1, df2 = _manifests(tmp_path)
+    directories = (
+        changed_directories(build_merkle_tree(df1), build_merkle_tree(df2))
+        if use_tree
+        else None
+    )
+    output_dir = str(tmp_path / "out")
+
+    # Act
+    counts = compare_sorted_manifests(
+        str(tmp_path / "1.parquet"),
+        str(tmp_path / "2.parquet"),
+        output_dir,
+        memory_limit=1,
+        directories=directories,
+    )
+
+    # Assert
+    expected = compare_file_lists(df1, df2)
+    for category, rows in zip(CATEGORIES, expected):
+        merged = scan_category(output_dir, category).collect()
+        assert counts[category] == len(rows)
+        assert merged.sort("path").equals(rows.sort("path"))
+
+
+def test_sorted_merge_of_empty_manifests(tmp_path):
+    # Arrange
+    empty = pl.DataFrame(schema={"hash": pl.Binary, "path": pl.String})
+    write_manifest(empty, str(tmp_path / "empty.parquet"))
+
+    # Act
+    counts = compare_sorted_manifests(
+        str(tmp_path / "empty.parquet"),
+        str(tmp_path / "empty.parquet"),
+        str(tmp_path / "out"),
+        memory_limit=1,
+    )
+
+    # Assert
+    assert counts == dict.fromkeys(CATEGORIES, 0)
+    assert scan_category(str(tmp_path / "out"), "changed").collect().is_empty()
+
+
+def test_unsorted_manifest_is_detected(tmp_path):
+    # Arrange
+    path = str(tmp_path / "unsorted.parquet")
+    pl.DataFrame({"hash": [b"1", b"2"], "path": ["b", "a"]}).write_parquet(path)
+
+    # Act / Assert
+    assert not is_sorted_manifest(path)
+    with pytest.raises(ValueError):
+        compare_sorted_manifests(path, path, str(tmp_path / "out"), 1)
+
+
+PEAK_RSS_SCRIPT = textwrap.dedent(
+    """
+    import resource
+    import sys
+    from container_diffoscope.comparator import compare_file_lists
+    from container_diffoscope.comparator import compare_sorted_manifests
+    from container_diffoscope.manifest import load_manifest
+
+    mode, path_1, path_2, output_dir, memory_limit = sys.argv[1:]
+    before = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    if mode == "merge":
+        compare_sorted_manifests(path_1, path_2, output_dir, int(memory_limit))
+    else:
+        compare_file_lists(load_manifest(path_1), load_manifest(path_2))
+    after = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    print((after - before) * 1024)
+    """
+)
+
+GENERATE_SCRIPT = textwrap.dedent(
+    """
+    import sys
+    import polars as pl
+    from container_diffoscope.manifest import write_manifest
+
+    rows = int(sys.argv[1])
+    for changed, path in enumerate(sys.argv[2:]):
+        number = pl.int_range(rows, eager=True)
+        write_manifest(
+            pl.DataFrame({"number": number}).select(
+                (pl.col("number") + changed * (pl.col("number") % 1000 == 0))
+                .cast(pl.String)
+                .str.zfill(32)
+                .cast(pl.Binary)
+                .alias("hash"),
+                pl.format(
+                    "usr/lib/python3/site-packages/package-{}/module-{}.py",
+                    pl.col("number") // 100,
+                    pl.col("number"),
+                ).alias("path"),
+            ),
+            path,
+        )
+    """
+)
+
+
+def _run(script: str, *args: str) -> str:
+    environment = {**os.environ, "PYTHONPATH": REPOSITORY}
+    return subprocess.run(
+        [sys.executable, "-c", script, *args],
+        check=True,
+        capture_output=True,
+        text=True,
+        env=environment,
+    ).stdout
+
+
+def test_sorted_merge_peak_memory_stays_under_the_limit(tmp_path):
+    # Arrange
+    memory_limit = 64 * 1024**2
+    paths = [str(tmp_path / "1.parquet"), str(tmp_path / "2.parquet")]
+    _run(GENERATE_SCRIPT, "1000000", *paths)
+    arguments = [*paths, str(tmp_path / "out"), str(memory_limit)]
+
+    # Act
+    merge_peak = int(_run(PEAK_RSS_SCRIPT, "merge", *arguments))
+    in_memory_peak = int(_run(PEAK_RSS_SCRIPT, "in-memory", *arguments))
+
+    # Assert
+    assert merge_peak < memory_limit
+    assert in_memory_peak > memory_limit
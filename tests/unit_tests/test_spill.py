@@ -0,0 +1,123 @@
+import io
+import os
+import sys
+import tarfile
+import pytest
+from container_diffoscope.cache import ContentCache
+from container_diffoscope.extractor import (
+    INDEX_FILE,
+    MANIFEST_FILE,
+    extract_members,
+    find_missing_payloads,
+    open_image,
+)
+from container_diffoscope.globs import PathFilter
+from container_diffoscope.hasher import hash_tar_members, hash_tar_stream
+from container_diffoscope.manifest import load_manifest
+from container_diffoscope.spill import SPILL_FILE, SpillPolicy
+
+FILES = {
+    "etc/config": b"key=value\n",
+    "etc/empty": b"",
+    "usr/lib/libc.so": b"\x7fELF" + b"x" * 100,
+    "var/blob": b"z" * 5000,
+    "etc/a/very/long/" + "path/" * 30 + "file": b"long name\n",
+}
+
+
+@pytest.fixture
+def rootfs(tmp_path):
+    """Create a flattened filesystem tar archive with a hard link."""
+    path = tmp_path / "rootfs.tar"
+    with tarfile.open(path, "w") as tar:
+        for name, content in FILES.items():
+            info = tarfile.TarInfo(name)
+            info.size = len(content)
+            tar.addfile(info, io.BytesIO(content))
+        link = tarfile.TarInfo("etc/config.link")
+        link.type = tarfile.LNKTYPE
+        link.linkname = "etc/config"
+        tar.addfile(link)
+    return str(path)
+
+
+@pytest.mark.parametrize(
+    "policy, path, size, kept",
+    [
+        (SpillPolicy(), "etc/config", 10, True),
+        (SpillPolicy(), "etc/empty", 0, False),
+        (SpillPolicy(max_size=100), "var/blob", 5000, False),
+        (SpillPolicy(), "usr/lib/libc.so", 104, False),
+        (
+            SpillPolicy(path_filter=PathFilter(include=("/usr",))),
+            "etc/config",
+            10,
+            False,
+        ),
+    ],
+)
+def test_spill_policy_keeps(policy, path, size, kept):
+    # Arrange
+    member = tarfile.TarInfo(path)
+    member.size = size
+
+    # Act / Assert
+    assert policy.keeps(path, member) is kept
+
+
+def test_hash_tar_stream_spills_kept_payloads(rootfs, tmp_path):
+    # Arrange
+    spill_path = tmp_path / SPILL_FILE
+    index_path = tmp_path / "index.parquet"
+    expected = tmp_path / "expected.parquet"
+    hash_tar_members(rootfs, str(expected))
+    output_dir = tmp_path / "out"
+
+    # Act
+    with open(rootfs, "rb") as stream:
+        files = hash_tar_stream(
+            stream,
+            str(spill_path),
+            str(tmp_path / "manifest.parquet"),
+            index_path=str(index_path),
+            spill=SpillPolicy(max_size=1000),
+        )
+    extract_members(str(index_path), [*FILES, "etc/config.link"], str(output_dir))
+
+    # Assert
+    assert files == 6
+    assert load_manifest(str(tmp_path / "manifest.parquet")).equals(
+        load_manifest(str(expected))
+    )
+    with tarfile.open(spill_path) as spill:
+        assert sorted(spill.getnames()) == sorted(
+            ["etc/config", "etc/a/very/long/" + "path/" * 30 + "file"]
+        )
+    assert (output_dir / "etc/config").read_bytes() == FILES["etc/config"]
+    assert (output_dir / "etc/config.link").read_bytes() == FILES["etc/config"]
+    assert (output_dir / "etc/empty").read_bytes() == b""
+    long_path = "etc/a/very/long/" + "path/" * 30 + "file"
+    assert (output_dir / long_path).read_bytes() == FILES[long_path]
+    assert not (output_dir / "var/blob").exists()
+    assert not (output_dir / "usr/lib/libc.so").exists()
+
+
+def test_image_read_from_stdin(rootfs, tmp_path, monkeypatch):
+    # Arrange
+    store = ContentCache(str(tmp_path / "images"))
+    with open(rootfs, "rb") as archive:
+        stdin = io.TextIOWrapper(io.BytesIO(archive.read()))
+    monkeypatch.setattr(sys, "stdin", stdin)
+
+    # Act
+    with open_image("-", store) as entry_dir:
+        manifest = load_manifest(os.path.join(entry_dir, MANIFEST_FILE))
+        missing = find_missing_payloads(entry_dir, [*FILES, "etc/config.link"])
+        index_exists = os.path.exists(os.path.join(entry_dir, INDEX_FILE))
+
+    # Assert
+    assert len(manifest) == 6
+    assert missing == {"usr/lib/libc.so"}
+    assert index_exists
+    assert not os.path.exists(entry_dir)
+    assert store.stats()["entries"] == 0